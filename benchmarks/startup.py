@@ -0,0 +1,185 @@
+# benchmarks/startup.py
+"""
+Measures how long each tool takes to start, as the time for '--help' to
+return.
+
+Modes:
+  (default)            run the entry points from source with this Python and
+                       list the slowest top-level imports (-X importtime)
+  --frozen DIST        run the executables that build.py put in DIST
+  --compare-packaging  build each entry point as a PyInstaller onedir and
+                       onefile executable (needs PyInstaller) and compare
+
+Usage (from the project root):
+  python -m benchmarks.startup [--repeat 5] [--frozen dist | --compare-packaging]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# App name -> (entry script, module imported by the script).
+ENTRY_POINTS = {
+    "clone-vm": ("run_clone.py", "run_clone"),
+    "create-master-vm": ("run_create_master.py", "run_create_master"),
+    "pi-selfhosting-web": ("webapp/app.py", "webapp.app"),
+    "download-assets": ("download_latest_release.py", "download_latest_release"),
+}
+TOP_IMPORTS = 3
+
+
+def best_of(repeat, command):
+    """Return the fastest of 'repeat' runs of 'command', in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(
+            command,
+            cwd=PROJECT_ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def slowest_imports(module, count=TOP_IMPORTS):
+    """Return the (module, seconds) pairs that dominate importing 'module'."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # A module is listed after its imports, which are indented two more
+        # spaces; collect the direct imports until 'module' itself appears.
+        if name.strip() == module:
+            break
+        if not name.startswith("  "):
+            imports = []  # Another top-level import (e.g. 'site') ended.
+        elif not name.startswith("    "):
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return imports[:count]
+
+
+def executable(dist_dir, app):
+    """Return the path of an app's executable in a onedir or onefile build."""
+    suffix = ".exe" if sys.platform == "win32" else ""
+    for path in (
+        os.path.join(dist_dir, app, f"{app}{suffix}"),
+        os.path.join(dist_dir, f"{app}{suffix}"),
+    ):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def bench_source(repeat):
+    print(f"Startup from source (best of {repeat}):")
+    for app, (script, module) in ENTRY_POINTS.items():
+        seconds = best_of(repeat, [sys.executable, script, "--help"])
+        heaviest = ", ".join(
+            f"{name} {s * 1000:.0f}" for name, s in slowest_imports(module)
+        )
+        print(f"  {app:<20} {seconds * 1000:8.1f} ms   imports (ms): {heaviest}")
+    return 0
+
+
+def bench_frozen(dist_dir, repeat):
+    print(f"Startup of the executables in {dist_dir} (best of {repeat}):")
+    found = False
+    for app in ENTRY_POINTS:
+        path = executable(dist_dir, app)
+        if path is None:
+            print(f"  {app:<20} {'not built':>11}")
+            continue
+        found = True
+        print(f"  {app:<20} {best_of(repeat, [path, '--help']) * 1000:8.1f} ms")
+    return 0 if found else 1
+
+
+def build_variant(script, app, mode, directory):
+    """Build one entry point as a 'onedir' or 'onefile' executable."""
+    command = [
+        "pyinstaller",
+        "--noconfirm",
+        f"--{mode}",
+        "--name",
+        app,
+        "--paths",
+        PROJECT_ROOT,
+        "--distpath",
+        os.path.join(directory, mode),
+        "--workpath",
+        os.path.join(directory, f"build-{mode}"),
+        "--specpath",
+        directory,
+        os.path.join(PROJECT_ROOT, script),
+    ]
+    subprocess.run(
+        command,
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+        check=True,
+    )
+    return executable(os.path.join(directory, mode), app)
+
+
+def compare_packaging(repeat):
+    if not shutil.which("pyinstaller"):
+        print("Error: PyInstaller is not installed.", file=sys.stderr)
+        return 1
+    directory = tempfile.mkdtemp(prefix="pivm-startup-")
+    try:
+        print(f"Startup by packaging (best of {repeat}):")
+        print(f"  {'':<20} {'onedir':>11} {'onefile':>11}  faster")
+        for app, (script, _) in ENTRY_POINTS.items():
+            timings = {}
+            for mode in ("onedir", "onefile"):
+                path = build_variant(script, app, mode, directory)
+                timings[mode] = best_of(repeat, [path, "--help"])
+            print(
+                f"  {app:<20} {timings['onedir'] * 1000:8.1f} ms "
+                f"{timings['onefile'] * 1000:8.1f} ms  {min(timings, key=timings.get)}"
+            )
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--frozen", metavar="DIST", help="Time built executables.")
+    mode.add_argument(
+        "--compare-packaging",
+        action="store_true",
+        help="Build onedir and onefile variants and compare them.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.frozen:
+        return bench_frozen(args.frozen, args.repeat)
+    if args.compare_packaging:
+        return compare_packaging(args.repeat)
+    return bench_source(args.repeat)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
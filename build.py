@@ -1,38 +1,370 @@
 # build.py (Final, Corrected Version)
+"""
+Builds every .spec file in the project root with PyInstaller.
+
+Specs are built concurrently (--jobs). Each build gets its own work and
+dist directory under 'build/<spec>/', so parallel runs cannot clobber each
+other, and its output is written to 'build/logs/<spec>.log'. Finished apps
+are moved into 'dist/' only when their build succeeds.
+
+Builds are incremental: 'build/manifest.json' records a fingerprint of each
+spec's inputs (the spec file, the files and directories it names, the local
+modules those scripts import, and the Python and PyInstaller versions).
+A spec whose fingerprint is unchanged and whose apps are still in 'dist/'
+is skipped; --force rebuilds everything. --build-dir puts the work
+directories, logs and manifest somewhere other than 'build/'.
+
+Usage:
+  python build.py [--jobs N] [--force] [--build-dir DIR]
+"""
+
+import argparse
+import ast
+import hashlib
+import json
 import os
+import shutil
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from importlib import metadata
+
+# --- Configuration ---
+PYINSTALLER = "pyinstaller"
+WORK_DIR = "build"
+DIST_DIR = "dist"
+LOG_DIR_NAME = "logs"  # Inside the work directory, like the manifest.
+MANIFEST_NAME = "manifest.json"
+LOG_TAIL_LINES = 40  # Lines of a failed build's log echoed to the console.
+
+
+@dataclass
+class BuildResult:
+    """The outcome of building one spec file."""
+
+    spec: str
+    returncode: int
+    seconds: float
+    log_path: str
+    outputs: list = field(default_factory=list)  # App names moved into dist/.
+    skipped: bool = False  # Up to date; PyInstaller was not run.
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+def find_spec_files(directory="."):
+    """Return the .spec files in 'directory', sorted by name."""
+    return sorted(f for f in os.listdir(directory) if f.endswith(".spec"))
+
+
+def log_path_for(spec_file, work_dir=WORK_DIR):
+    stem = os.path.splitext(os.path.basename(spec_file))[0]
+    return os.path.join(work_dir, LOG_DIR_NAME, f"{stem}.log")
+
+
+# --- Incremental builds ---
+
+
+def _spec_paths(spec_file):
+    """Return the project files and directories named in a spec file."""
+    with open(spec_file, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), spec_file)
+    paths = set()
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+            continue
+        path = os.path.normpath(node.value) if node.value else "."
+        # '.' (e.g. in pathex) would make every file in the project an input.
+        if path != "." and not path.startswith("..") and os.path.exists(path):
+            paths.add(path)
+    return paths
+
+
+def _module_file(name, search_dirs):
+    """Return the project file that defines module 'name', or None."""
+    if not name:
+        return None
+    base = os.path.join(*name.split("."))
+    for directory in search_dirs:
+        for candidate in (f"{base}.py", os.path.join(base, "__init__.py")):
+            path = os.path.normpath(os.path.join(directory, candidate))
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def _local_imports(path, search_dirs):
+    """Return the project modules that the Python file 'path' imports."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    package = [part for part in os.path.dirname(path).split(os.sep) if part]
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                parts = alias.name.split(".")
+                names += [".".join(parts[: i + 1]) for i in range(len(parts))]
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if node.level:
+                base = package[: len(package) - (node.level - 1)]
+                module = ".".join(base + ([module] if module else []))
+            names.append(module)
+            # 'from scripts import download' imports the module scripts.download.
+            names += [f"{module}.{alias.name}".lstrip(".") for alias in node.names]
+    files = (_module_file(name, search_dirs) for name in names)
+    return {path for path in files if path}
+
+
+def spec_inputs(spec_file):
+    """Return every project file that a build of 'spec_file' depends on."""
+    inputs = {os.path.normpath(spec_file)}
+    pending = []
+    for path in _spec_paths(spec_file):
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                inputs.update(os.path.join(directory, name) for name in filenames)
+        else:
+            inputs.add(path)
+            if path.endswith(".py"):
+                pending.append(path)
+    # Scripts import from the project root and from their own directory.
+    search_dirs = ["."] + sorted({os.path.dirname(path) for path in pending})
+    while pending:
+        for module in _local_imports(pending.pop(), search_dirs):
+            if module not in inputs:
+                inputs.add(module)
+                pending.append(module)
+    return sorted(inputs)
+
+
+def _pyinstaller_version():
+    try:
+        return metadata.version("pyinstaller")
+    except metadata.PackageNotFoundError:
+        return "not installed"
 
 
-def main():
-    """Finds all spec files and runs PyInstaller correctly for each one."""
+def fingerprint(spec_file):
+    """Return a digest of everything that affects the build of 'spec_file'."""
+    digest = hashlib.sha256()
+    digest.update(f"python {sys.version}\n".encode())
+    digest.update(f"pyinstaller {_pyinstaller_version()}\n".encode())
+    for path in spec_inputs(spec_file):
+        with open(path, "rb") as f:
+            content = hashlib.sha256(f.read()).hexdigest()
+        digest.update(f"{path.replace(os.sep, '/')} {content}\n".encode())
+    return digest.hexdigest()
+
+
+def load_manifest(work_dir=WORK_DIR):
+    """Return the fingerprints recorded by earlier builds (or an empty dict)."""
+    try:
+        with open(os.path.join(work_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, work_dir=WORK_DIR):
+    """Atomically write the build manifest."""
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+
+def is_up_to_date(entry, spec_fingerprint):
+    """True if a manifest entry matches and all of its apps are still in dist/."""
+    return (
+        entry is not None
+        and entry.get("fingerprint") == spec_fingerprint
+        and bool(entry.get("outputs"))
+        and all(
+            os.path.exists(os.path.join(DIST_DIR, name)) for name in entry["outputs"]
+        )
+    )
+
+
+# --- Building ---
+
+
+def _install(spec_dist):
+    """
+    Move the apps a build produced into DIST_DIR, replacing older copies.
+    Returns the names of the moved apps.
+    """
+    os.makedirs(DIST_DIR, exist_ok=True)
+    names = sorted(os.listdir(spec_dist))
+    for name in names:
+        target = os.path.join(DIST_DIR, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(os.path.join(spec_dist, name), target)
+    return names
+
+
+def build_spec(spec_file, work_dir=WORK_DIR):
+    """Run PyInstaller for one spec file and return a BuildResult."""
+    stem = os.path.splitext(os.path.basename(spec_file))[0]
+    work_path = os.path.join(work_dir, stem)
+    spec_dist = os.path.join(work_path, "dist")
+    log_path = log_path_for(spec_file, work_dir)
+    if os.path.isdir(spec_dist):
+        shutil.rmtree(spec_dist)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    command = [
+        PYINSTALLER,
+        "--noconfirm",
+        "--workpath",
+        work_path,
+        "--distpath",
+        spec_dist,
+        spec_file,
+    ]
+    started = time.perf_counter()
+    with open(log_path, "w") as log:
+        log.write(f"$ {' '.join(command)}\n")
+        log.flush()
+        try:
+            returncode = subprocess.run(
+                command, stdout=log, stderr=subprocess.STDOUT
+            ).returncode
+        except OSError as e:
+            log.write(f"Could not run {PYINSTALLER}: {e}\n")
+            returncode = 127
+    outputs = _install(spec_dist) if returncode == 0 else []
+    seconds = time.perf_counter() - started
+    return BuildResult(spec_file, returncode, seconds, log_path, outputs)
+
+
+def _print_log_tail(log_path):
+    try:
+        with open(log_path) as f:
+            lines = f.readlines()[-LOG_TAIL_LINES:]
+    except OSError:
+        return
+    for line in lines:
+        print(f"    {line.rstrip()}", file=sys.stderr)
+
+
+def print_summary(results, wall_clock):
+    """Print how long each build took and how much the parallel run saved."""
+    print("\n--- Build summary ---")
+    for result in results:
+        if result.skipped:
+            status = "up to date"
+        else:
+            status = "ok" if result.ok else f"FAILED ({result.returncode})"
+        print(f"  {result.spec:<24} {status:<12} {result.seconds:7.1f}s")
+    total = sum(result.seconds for result in results)
+    print(
+        f"  Wall clock {wall_clock:.1f}s for {total:.1f}s of builds "
+        f"({total / wall_clock if wall_clock else 1:.1f}x)."
+    )
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Build all .spec files.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of specs to build at the same time (default: CPU count)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild every spec, even those whose inputs have not changed",
+    )
+    parser.add_argument(
+        "--build-dir",
+        default=WORK_DIR,
+        help=f"Directory for work files, logs and the manifest (default: {WORK_DIR})",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Finds all spec files and runs PyInstaller for each one. 'argv' defaults
+    to no arguments, so main() builds everything with the default settings.
+    """
+    args = parse_arguments(argv or [])
     print("--- Starting build process ---")
 
     # Find all .spec files in the current directory.
-    spec_files = [f for f in os.listdir(".") if f.endswith(".spec")]
+    spec_files = find_spec_files()
 
     if not spec_files:
         print("Error: No .spec files found in the root directory.", file=sys.stderr)
         return 1
 
-    print(f"--- Found {len(spec_files)} spec file(s) to build ---")
-    for spec_file in spec_files:
-        print(f"\nBuilding from: {spec_file}")
-        try:
-            command = ["pyinstaller", spec_file]
-            print(f"Running command: {' '.join(command)}")
-            subprocess.run(command, check=True)
-            print(f"Successfully built: {spec_file}")
-        except subprocess.CalledProcessError:
-            print(
-                f"--- ERROR building {spec_file} ---",
-                file=sys.stderr,
+    started = time.perf_counter()
+    manifest = load_manifest(args.build_dir)
+    fingerprints = {spec: fingerprint(spec) for spec in spec_files}
+    results = []
+    to_build = []
+    for spec in spec_files:
+        entry = manifest.get(spec)
+        if not args.force and is_up_to_date(entry, fingerprints[spec]):
+            print(f"Up to date: {spec}")
+            results.append(
+                BuildResult(
+                    spec,
+                    0,
+                    0.0,
+                    log_path_for(spec, args.build_dir),
+                    entry["outputs"],
+                    True,
+                )
             )
-            return 1
+        else:
+            to_build.append(spec)
+
+    jobs = max(1, min(args.jobs, len(to_build)))
+    print(
+        f"--- Found {len(spec_files)} spec file(s), {len(to_build)} to build, "
+        f"{jobs} at a time ---"
+    )
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for spec in to_build:
+            print(f"Building from: {spec}")
+            futures.append(executor.submit(build_spec, spec, args.build_dir))
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result.ok:
+                manifest[result.spec] = {
+                    "fingerprint": fingerprints[result.spec],
+                    "outputs": result.outputs,
+                }
+                print(f"Successfully built: {result.spec} ({result.seconds:.1f}s)")
+            else:
+                manifest.pop(result.spec, None)
+                print(
+                    f"--- ERROR building {result.spec}, see {result.log_path} ---",
+                    file=sys.stderr,
+                )
+                _print_log_tail(result.log_path)
+    save_manifest(manifest, args.build_dir)
+    results.sort(key=lambda result: spec_files.index(result.spec))
+    print_summary(results, time.perf_counter() - started)
 
+    if not all(result.ok for result in results):
+        return 1
     print("\n--- Build process completed successfully! ---")
     return 0
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(main(sys.argv[1:]))
@@ -1,92 +1,298 @@
 """
 This script downloads the latest release assets (OVA and installer) for a specified GitHub project.
 By default, it downloads assets for HenkVanHoek/pi-server-vm.
+
+Assets are downloaded concurrently over one pooled HTTP session, so the small
+installer is not stuck behind the multi-GB OVA. Assets that are already
+present (same size and, when GitHub publishes one, the same SHA-256) are
+skipped.
+
+The release JSON is requested conditionally (If-None-Match/If-Modified-Since)
+using metadata stored in the download directory. When GitHub answers
+'304 Not Modified' and every asset from the last run is still in place, the
+script exits without any further requests, which makes it cheap to run from
+cron on many machines (304 responses do not count against the rate limit).
 """
 
+import json
 import os
-import requests
+import sys
+import time
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from scripts import artifact_cache, download
 
 # --- Default Configuration ---
 DEFAULT_OWNER = "HenkVanHoek"
 DEFAULT_REPO = "pi-server-vm"
 DOWNLOAD_DIR = "latest_release"
 ASSET_EXTENSIONS = (".ova", ".exe")
+GITHUB_API = "https://api.github.com"
+DEFAULT_JOBS = 4
+API_TIMEOUT = 30
+# Release metadata from the last run, stored inside the download directory.
+METADATA_FILE = ".release-metadata.json"
 
 # --- Script ---
 
 
-def download_latest_release_assets(owner, repo):
+@dataclass
+class AssetResult:
+    """What happened to one release asset."""
+
+    name: str
+    status: str  # "downloaded", "cached", "present" or "failed"
+    size: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def rate(self):
+        """Download throughput in bytes per second."""
+        return self.size / self.seconds if self.seconds else 0.0
+
+
+def asset_sha256(asset):
+    """Return the SHA-256 that GitHub reports for an asset, or None."""
+    digest = asset.get("digest") or ""
+    return digest[len("sha256:") :] if digest.startswith("sha256:") else None
+
+
+def format_rate(rate):
+    return f"{rate / (1024 * 1024):.2f} MB/s"
+
+
+def create_session(jobs):
+    """Return a session whose connection pool fits 'jobs' parallel downloads."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=jobs, pool_maxsize=jobs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def load_metadata(download_dir):
+    """Return the release metadata saved by the last run (or an empty dict)."""
+    try:
+        with open(os.path.join(download_dir, METADATA_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_metadata(download_dir, metadata):
+    """Atomically write the release metadata for the next run."""
+    path = os.path.join(download_dir, METADATA_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(metadata, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def fetch_release(session, api_url, cached):
+    """
+    Request the release JSON, conditionally if an earlier response is cached.
+    Returns (release_data, entry, not_modified); 'entry' is the new cache entry.
+    """
+    headers = {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    response = session.get(api_url, headers=headers, timeout=API_TIMEOUT)
+    if response.status_code == 304 and "release" in cached:
+        return cached["release"], cached, True
+    response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+    release_data = response.json()
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "release": release_data,
+        "assets": cached.get("assets", {}),
+    }
+    return release_data, entry, False
+
+
+def is_present(asset, file_path, known=None):
+    """
+    Return True if 'file_path' already holds this asset. An asset with the
+    same GitHub ID as last time only needs a size check; otherwise the size
+    and the published digest are compared.
+    """
+    try:
+        if os.path.getsize(file_path) != asset.get("size"):
+            return False
+    except OSError:
+        return False
+    if known and asset.get("id") is not None and known.get("id") == asset["id"]:
+        return True
+    sha256 = asset_sha256(asset)
+    return sha256 is None or download.verify_file(file_path, sha256)
+
+
+def fetch_asset(session, asset, download_dir, chunk_size, known=None, reporter=None):
+    """Download one asset unless it is present or cached; return an AssetResult."""
+    reporter = reporter or download.ProgressReporter("quiet")
+    name = asset.get("name", "")
+    file_path = os.path.join(download_dir, name)
+    size = asset.get("size", 0)
+
+    if is_present(asset, file_path, known):
+        return AssetResult(name, "present", size)
+
+    # Assets with a published digest can come from the shared cache.
+    sha256 = asset_sha256(asset)
+    cache = artifact_cache.ArtifactCache() if sha256 else None
+    if cache and cache.fetch(sha256, file_path):
+        download.record_verification(file_path, sha256)
+        return AssetResult(name, "cached", size)
+
+    started = time.perf_counter()
+    try:
+        download.download_file(
+            asset.get("browser_download_url"),
+            file_path,
+            sha256=sha256,
+            session=session,
+            chunk_size=chunk_size,
+            progress=reporter.track(name),
+            log=reporter.notice,
+        )
+    except download.DownloadError as e:
+        return AssetResult(name, "failed", error=str(e))
+    seconds = time.perf_counter() - started
+    if cache:
+        try:
+            cache.insert(file_path, sha256, verified=True)
+        except (OSError, ValueError) as e:
+            reporter.message(f"  -> Warning: could not cache {name}: {e}")
+    return AssetResult(name, "downloaded", os.path.getsize(file_path), seconds)
+
+
+def describe_result(result):
+    """Return the one-line summary printed for an AssetResult."""
+    if result.status == "downloaded":
+        return (
+            f"  -> {result.name}: downloaded {result.size / (1024*1024):.2f} MB "
+            f"in {result.seconds:.1f}s ({format_rate(result.rate)})"
+        )
+    if result.status == "failed":
+        return f"  -> {result.name}: Error downloading: {result.error}"
+    label = "already present" if result.status == "present" else "from cache"
+    return f"  -> {result.name}: {label}, skipped download"
+
+
+def download_latest_release_assets(
+    owner,
+    repo,
+    download_dir=DOWNLOAD_DIR,
+    jobs=DEFAULT_JOBS,
+    chunk_size=download.CHUNK_SIZE,
+    api_base=GITHUB_API,
+    progress_mode=None,
+):
     """
     Fetches the latest release from GitHub and downloads the specified assets.
+    Returns a list of AssetResult (None if the release could not be read).
+    'progress_mode' is 'bar', 'quiet' or 'json' (see download.ProgressReporter).
     """
-    print(f"Starting download process for {owner}/{repo}...")
+    reporter = download.ProgressReporter(progress_mode)
+    # In 'json' mode stdout carries only JSON lines; other text goes to stderr.
+    out = reporter.text_stream
+    print(f"Starting download process for {owner}/{repo}...", file=out)
 
     # 1. Create the download directory if it doesn't exist
-    if not os.path.exists(DOWNLOAD_DIR):
-        print(f"Creating download directory: {DOWNLOAD_DIR}")
-        os.makedirs(DOWNLOAD_DIR)
+    if not os.path.exists(download_dir):
+        print(f"Creating download directory: {download_dir}", file=out)
+        os.makedirs(download_dir)
+
+    session = create_session(jobs)
 
     # 2. Get the latest release information from the GitHub API
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/releases/latest"
-    print(f"Fetching latest release data from: {api_url}")
+    api_url = f"{api_base}/repos/{owner}/{repo}/releases/latest"
+    print(f"Fetching latest release data from: {api_url}", file=out)
 
+    metadata = load_metadata(download_dir)
     try:
-        response = requests.get(api_url)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+        release_data, entry, not_modified = fetch_release(
+            session, api_url, metadata.get(api_url, {})
+        )
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching release data: {e}")
-        return
+        print(f"Error fetching release data: {e}", file=out)
+        return None
 
-    release_data = response.json()
     assets = release_data.get("assets", [])
 
     if not assets:
-        print("No assets found in the latest release.")
-        return
-
-    print(f"Found {len(assets)} assets in release: {release_data.get('name')}")
-
-    # 3. Filter and download the required assets
-    for asset in assets:
-        asset_name = asset.get("name", "")
-        if asset_name.endswith(ASSET_EXTENSIONS):
-            download_url = asset.get("browser_download_url")
-            file_path = os.path.join(DOWNLOAD_DIR, asset_name)
-
-            print(f"\nDownloading asset: {asset_name}")
-            print(f"  -> From: {download_url}")
-            print(f"  -> To:   {file_path}")
-
-            try:
-                with requests.get(download_url, stream=True) as r:
-                    r.raise_for_status()
-                    total_size = int(r.headers.get("content-length", 0))
-                    downloaded_size = 0
-
-                    with open(file_path, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                            downloaded_size += len(chunk)
-                            progress = (
-                                (downloaded_size / total_size) * 100
-                                if total_size > 0
-                                else 0
-                            )
-                            print(
-                                f"\r  -> Progress: {downloaded_size / (1024*1024):.2f} MB / {total_size / (1024*1024):.2f} MB ({progress:.1f}%)",
-                                end="",
-                            )
-                print("\n  -> Download complete.")
-            except requests.exceptions.RequestException as e:
-                print(f"\nError downloading {asset_name}: {e}")
-            except IOError as e:
-                print(f"\nError writing file {file_path}: {e}")
-
-    print("\n\nAll desired assets have been processed.")
+        print("No assets found in the latest release.", file=out)
+        return []
 
+    print(
+        f"Found {len(assets)} assets in release: {release_data.get('name')}", file=out
+    )
 
-if __name__ == "__main__":
+    # 3. Filter and download the required assets, all at the same time
+    wanted = [a for a in assets if a.get("name", "").endswith(ASSET_EXTENSIONS)]
+    known = entry.get("assets", {})
+    if not_modified and all(
+        is_present(a, os.path.join(download_dir, a["name"]), known.get(a["name"]))
+        for a in wanted
+    ):
+        print(
+            "Release unchanged since the last run; nothing new to download.", file=out
+        )
+        return [AssetResult(a["name"], "present", a.get("size", 0)) for a in wanted]
+
+    for asset in wanted:
+        print(f"\nQueued asset: {asset['name']}", file=out)
+        print(f"  -> From: {asset.get('browser_download_url')}", file=out)
+        print(f"  -> To:   {os.path.join(download_dir, asset['name'])}", file=out)
+
+    print(file=out)
+    started = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(
+                fetch_asset,
+                session,
+                asset,
+                download_dir,
+                chunk_size,
+                known.get(asset["name"]),
+                reporter,
+            )
+            for asset in wanted
+        ]
+        for asset, future in zip(wanted, futures):
+            result = future.result()
+            reporter.message(describe_result(result))
+            results.append(result)
+            if result.status != "failed":
+                known[asset["name"]] = {"id": asset.get("id"), "size": result.size}
+    wall_clock = time.perf_counter() - started
+    reporter.finish()
+
+    entry["assets"] = known
+    metadata[api_url] = entry
+    save_metadata(download_dir, metadata)
+
+    downloaded = sum(r.size for r in results if r.status == "downloaded")
+    rate = downloaded / wall_clock if wall_clock else 0.0
+    print(
+        f"\nDownloaded {downloaded / (1024*1024):.2f} MB in {wall_clock:.1f}s "
+        f"({format_rate(rate)} aggregate).",
+        file=out,
+    )
+    print("\n\nAll desired assets have been processed.", file=out)
+    return results
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="Download latest release assets from a GitHub repository."
     )
@@ -102,6 +308,38 @@ if __name__ == "__main__":
         default=DEFAULT_REPO,
         help=f"The name of the repository (default: {DEFAULT_REPO})",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of assets to download at the same time (default: {DEFAULT_JOBS})",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=download.CHUNK_SIZE // 1024,
+        help="Read/write chunk size in KiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--progress",
+        choices=download.ProgressReporter.MODES,
+        help="Progress output: a console bar, nothing, or JSON lines for other "
+        f"programs (default: the {download.PROGRESS_ENV_VAR} environment variable, "
+        "or 'bar')",
+    )
+    args = parser.parse_args(argv)
 
-    download_latest_release_assets(args.owner, args.repo)
+    results = download_latest_release_assets(
+        args.owner,
+        args.repo,
+        jobs=args.jobs,
+        chunk_size=args.chunk_size * 1024,
+        progress_mode=args.progress,
+    )
+    if results is None or any(r.status == "failed" for r in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,22 +25,71 @@ Step 2: Finalize the Release (Windows Only)
     3. Export the master VirtualBox VM template to a .ova file.
     4. Upload both the setup.exe and the .ova file to the GitHub release.
 
-  Usage: python release.py finalize
+  Steps run as soon as the steps they depend on are done: the VM export
+  (into 'export/', so the installer never packages it) runs alongside the
+  download and the installer build, and every asset is uploaded as soon as
+  it is ready. A timing report for each step is printed at the end.
+
+  The OVA is published with a SHA-256 manifest ('<name>.ova.sha256'). With
+  '--compress', a zstd-compressed copy ('.ova.zst') is made in the same pass
+  over the OVA that computes its digest.
+
+  Assets are uploaded concurrently, one 'gh release upload' per file, with
+  exponential backoff between retries. Assets that the release already has
+  (same size and digest) are skipped, and finished uploads are recorded in
+  '.release-upload-state.json', so rerunning 'finalize' after a failed
+  upload only sends what is missing.
+
+  Usage: python release.py finalize [--compress]
 
 Step 3: Deploy Documentation
   This command builds the documentation and copies it to the production web
   server. It requires a .env file with the DOCS_DEPLOY_PATH variable set.
+  Files in the web root that no deploy accounts for (e.g. pages left by
+  deploys from before the deploy manifest) are listed; --prune deletes them.
 
-  Usage: python release.py deploy-docs
+  Usage: python release.py deploy-docs [--prune]
 """
 import os
 import sys
+import hashlib
+import json
+import random
 import subprocess
+import tempfile
+import threading
 import time
 import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
+from scripts import download
+
+# --- Upload Configuration ---
+UPLOAD_JOBS = 3  # Assets uploaded at the same time.
+UPLOAD_RETRIES = 6  # Retries per asset after the first attempt.
+RELEASE_WAIT_RETRIES = 10  # Retries while CI has not created the release yet.
+BACKOFF_BASE = 2.0  # Seconds; the longest possible wait doubles per retry.
+BACKOFF_CAP = 120.0
+UPLOAD_STATE_FILE = ".release-upload-state.json"
+
+# --- Documentation Deploy Configuration ---
+DEPLOY_MANIFEST = ".deploy-manifest.json"  # Kept in the web root.
+SYNC_JOBS = 8  # Files copied at the same time.
+
+# --- Finalize Configuration ---
+ISCC_ENV_VAR = "PIVM_ISCC"  # Overrides the path of the Inno Setup compiler.
+ISCC_PATH = "C:\\Program Files (x86)\\Inno Setup 6\\ISCC.exe"
+EXPORT_DIR = "export"
+
+# --- Export Configuration ---
+EXPORT_CHUNK_SIZE = 1024 * 1024
+ZSTD_LEVEL = 10  # zstd runs with -T0, one worker thread per core.
+
 
 # --- Logic Functions (Designed for Testability) ---
 
@@ -177,7 +226,7 @@ def create_windows_installer(version):
     """Uses Inno Setup to create the installer. Returns the path to the installer."""
     print("--- ACTION: Creating Windows installer with Inno Setup ---")
     iss_file = "installer.iss"
-    iscc_path = "C:\\Program Files (x86)\\Inno Setup 6\\ISCC.exe"
+    iscc_path = os.environ.get(ISCC_ENV_VAR, ISCC_PATH)
     installer_path = os.path.join("dist", f"pi-server-vm-setup-{version}.exe")
     command = [iscc_path, "/Q", f"/DMyVersion={version}", iss_file]
     try:
@@ -194,15 +243,101 @@ def create_windows_installer(version):
         sys.exit(1)
 
 
-def export_vm(tag_name):
-    """Exports the master VM. Returns the path to the .ova file."""
+@dataclass
+class ExportResult:
+    """The exported appliance, its checksums and how long each step took."""
+
+    ova_path: str
+    sha256: str
+    size: int
+    manifest_path: str
+    export_seconds: float
+    hash_seconds: float
+    compressed_path: Optional[str] = None
+    compressed_sha256: Optional[str] = None
+    compressed_size: int = 0
+    compress_seconds: float = 0.0
+
+    @property
+    def asset_paths(self):
+        """The files to publish: the OVA, its compressed variant, the manifest."""
+        paths = [self.ova_path, self.compressed_path, self.manifest_path]
+        return [path for path in paths if path]
+
+
+class _Compressor:
+    """Compresses a stream with a multi-threaded 'zstd', hashing its output."""
+
+    def __init__(self, output_path, level=ZSTD_LEVEL):
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.failed = False
+        # A file, not a pipe, so zstd never blocks on a full stderr pipe.
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            ["zstd", f"-{level}", "-T0", "-q", "-c", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+        )
+        self._thread = threading.Thread(target=self._drain, args=(output_path,))
+        self._thread.start()
+
+    def _drain(self, output_path):
+        with open(output_path, "wb") as f:
+            for block in iter(
+                lambda: self._process.stdout.read(EXPORT_CHUNK_SIZE), b""
+            ):
+                self.sha256.update(block)
+                f.write(block)
+                self.size += len(block)
+
+    def write(self, block):
+        """Feed a block to zstd; once zstd has died, the rest is dropped."""
+        if self.failed:
+            return
+        try:
+            self._process.stdin.write(block)
+        except BrokenPipeError:
+            self.failed = True
+
+    def close(self):
+        """Finish the stream. Returns zstd's error output, or None on success."""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            self.failed = True
+        self._thread.join()
+        returncode = self._process.wait()
+        self._stderr.seek(0)
+        stderr = self._stderr.read().decode(errors="replace")
+        self._stderr.close()
+        if returncode == 0 and not self.failed:
+            return None
+        return stderr or f"zstd exited with code {returncode}."
+
+
+def export_vm(tag_name, compress=False):
+    """
+    Exports the master VM and writes a SHA-256 manifest for it. With
+    'compress', a zstd-compressed copy is made in the same read of the OVA
+    that computes its digest. Returns an ExportResult.
+    """
     print("--- ACTION: Exporting master template Virtual Machine ---")
     print(f"         -> This may take several minutes...")
     MASTER_VM_NAME = "pi-master-template"
-    ova_path = os.path.join("dist", f"pi-server-template-{tag_name}.ova")
-    if os.path.exists(ova_path):
-        print(f"   -> Found pre-existing artifact. Deleting: {ova_path}")
-        os.remove(ova_path)
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    ova_path = os.path.join(EXPORT_DIR, f"pi-server-template-{tag_name}.ova")
+    compressed_path = f"{ova_path}.zst" if compress else None
+    for path in (ova_path, compressed_path):
+        if path and os.path.exists(path):
+            print(f"   -> Found pre-existing artifact. Deleting: {path}")
+            os.remove(path)
+    if compress and not shutil.which("zstd"):
+        print("❌ FATAL ERROR: 'zstd' command not found; it is needed for --compress.")
+        sys.exit(1)
+
+    started = time.perf_counter()
     try:
         subprocess.run(
             ["VBoxManage", "export", MASTER_VM_NAME, f"--output={ova_path}"],
@@ -210,8 +345,6 @@ def export_vm(tag_name):
             capture_output=True,
             text=True,
         )
-        print(f"✅ VM exported successfully: {ova_path}")
-        return ova_path
     except FileNotFoundError:
         print("❌ FATAL ERROR: 'VBoxManage' command not found.")
         sys.exit(1)
@@ -219,43 +352,360 @@ def export_vm(tag_name):
         print(f"❌ FATAL ERROR: Failed to export the VM.")
         print(e.stderr)
         sys.exit(1)
+    export_seconds = time.perf_counter() - started
+    print(f"✅ VM exported successfully: {ova_path}")
+
+    # VBoxManage may go back and patch the tar headers of the OVA while it
+    # writes it, so the digest is taken from the finished file. That single
+    # read (usually from the page cache) also feeds the compressor.
+    started = time.perf_counter()
+    sha256 = hashlib.sha256()
+    compressor = _Compressor(compressed_path) if compress else None
+    # Only the reads and the digest count towards the hashing time; feeding
+    # the compressor is part of the compression time.
+    hash_seconds = 0.0
+    with open(ova_path, "rb") as f:
+        while True:
+            step = time.perf_counter()
+            block = f.read(EXPORT_CHUNK_SIZE)
+            if not block:
+                hash_seconds += time.perf_counter() - step
+                break
+            sha256.update(block)
+            hash_seconds += time.perf_counter() - step
+            if compressor:
+                compressor.write(block)
+    result = ExportResult(
+        ova_path,
+        sha256.hexdigest(),
+        os.path.getsize(ova_path),
+        f"{ova_path}.sha256",
+        export_seconds,
+        hash_seconds,
+    )
+    # The upload step can use this digest instead of reading the OVA again.
+    download.record_verification(ova_path, result.sha256)
+
+    lines = [f"{result.sha256}  {os.path.basename(ova_path)}"]
+    if compressor:
+        error = compressor.close()
+        if error is not None:
+            print("❌ FATAL ERROR: Failed to compress the OVA.")
+            print(error)
+            sys.exit(1)
+        result.compressed_path = compressed_path
+        result.compressed_sha256 = compressor.sha256.hexdigest()
+        result.compressed_size = compressor.size
+        result.compress_seconds = time.perf_counter() - started
+        download.record_verification(compressed_path, result.compressed_sha256)
+        lines.append(f"{result.compressed_sha256}  {os.path.basename(compressed_path)}")
+    with open(result.manifest_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"✅ SHA-256 manifest written: {result.manifest_path}")
+    print_export_metrics(result)
+    return result
+
+
+def print_export_metrics(result):
+    """Prints how long the export, hashing and compression took."""
+    mb = result.size / (1024 * 1024)
+
+    def rate(seconds):
+        return f"{mb / seconds:.1f} MB/s" if seconds else "-"
 
+    print(
+        f"   -> Export:   {result.export_seconds:7.1f}s  ({mb:.1f} MB, {rate(result.export_seconds)})"
+    )
+    print(f"   -> SHA-256:  {result.hash_seconds:7.1f}s  ({rate(result.hash_seconds)})")
+    if result.compressed_path:
+        ratio = result.compressed_size / result.size if result.size else 0
+        print(
+            f"   -> Compress: {result.compress_seconds:7.1f}s  "
+            f"({rate(result.compress_seconds)}, {ratio:.0%} of the original size)"
+        )
 
-def upload_assets(tag_name, asset_paths):
-    """Uploads a list of asset files to a specific GitHub release."""
-    print(f"--- ACTION: Uploading final assets to release {tag_name} ---")
-    max_retries = 10
-    for attempt in range(max_retries):
+
+def backoff_delay(attempt):
+    """
+    Seconds to wait before retry number 'attempt' (starting at 0): a random
+    time up to an exponentially growing limit, so that concurrent uploads
+    do not all retry at the same moment.
+    """
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+def get_release_assets(tag_name):
+    """
+    Returns the assets of a GitHub release as {name: asset}, waiting for the
+    release to appear if the CI workflow has not created it yet.
+    """
+    command = ["gh", "release", "view", tag_name, "--json", "assets"]
+    for attempt in range(RELEASE_WAIT_RETRIES + 1):
         try:
-            command = ["gh", "release", "upload", tag_name]
-            command.extend(asset_paths)
-            command.append("--clobber")
             result = subprocess.run(command, check=True, capture_output=True, text=True)
-            print("✅ All assets uploaded successfully.")
-            print(result.stdout)
-            return
+            return {
+                asset["name"]: asset for asset in json.loads(result.stdout)["assets"]
+            }
         except FileNotFoundError:
             print("❌ FATAL ERROR: 'gh' command not found.")
             sys.exit(1)
         except subprocess.CalledProcessError as e:
-            if "release not found" in e.stderr:
-                if attempt < max_retries - 1:
-                    print(
-                        f"   -> Release page not found yet. Waiting 30 seconds... "
-                        f"({attempt + 1}/{max_retries})"
-                    )
-                    time.sleep(30)
-                else:
-                    print("❌ FATAL ERROR: Release was not found after 5 minutes.")
-                    sys.exit(1)
-            else:
-                print(f"❌ FATAL ERROR: Failed to upload release assets.")
+            if "release not found" not in e.stderr:
+                print(f"❌ FATAL ERROR: Could not read release {tag_name}.")
                 print(e.stderr)
                 sys.exit(1)
+            if attempt == RELEASE_WAIT_RETRIES:
+                print(f"❌ FATAL ERROR: Release {tag_name} was not found.")
+                sys.exit(1)
+            delay = backoff_delay(attempt)
+            print(
+                f"   -> Release page not found yet. Waiting {delay:.0f} seconds... "
+                f"({attempt + 1}/{RELEASE_WAIT_RETRIES})"
+            )
+            time.sleep(delay)
+
+
+def load_upload_state(tag_name):
+    """Returns the uploads recorded for 'tag_name' by an earlier run."""
+    try:
+        with open(UPLOAD_STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if state.get("tag") != tag_name:
+        state = {"tag": tag_name, "assets": {}}
+    return state
+
+
+# Upload stages of 'finalize' run at the same time and share the state file.
+_upload_state_lock = threading.Lock()
+
+
+def record_upload(tag_name, name, local):
+    """Adds one finished upload to the state file."""
+    with _upload_state_lock:
+        state = load_upload_state(tag_name)
+        state["assets"][name] = local
+        with open(f"{UPLOAD_STATE_FILE}.tmp", "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(f"{UPLOAD_STATE_FILE}.tmp", UPLOAD_STATE_FILE)
+
+
+def is_uploaded(remote, local, recorded):
+    """
+    Returns True if the release asset 'remote' holds the file described by
+    'local' ({size, sha256}). Without a digest from GitHub, a matching size
+    is only trusted if this script recorded uploading exactly that file.
+    """
+    if remote is None or remote.get("size") != local["size"]:
+        return False
+    digest = remote.get("digest") or ""
+    if digest.startswith("sha256:"):
+        return digest[len("sha256:") :] == local["sha256"]
+    return recorded == local
+
+
+def upload_asset(tag_name, path):
+    """Uploads one asset, retrying with backoff. Returns None or the last error."""
+    name = os.path.basename(path)
+    command = ["gh", "release", "upload", tag_name, path, "--clobber"]
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True)
+            return None
+        except FileNotFoundError:
+            return "'gh' command not found."
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.strip()
+            if attempt == UPLOAD_RETRIES:
+                return error
+            delay = backoff_delay(attempt)
+            print(
+                f"   -> Upload of {name} failed ({error}). Retrying in {delay:.0f} "
+                f"seconds... ({attempt + 1}/{UPLOAD_RETRIES})"
+            )
+            time.sleep(delay)
+
+
+def upload_assets(tag_name, asset_paths, jobs=UPLOAD_JOBS):
+    """Uploads a list of asset files to a specific GitHub release."""
+    print(f"--- ACTION: Uploading final assets to release {tag_name} ---")
+    missing = [path for path in asset_paths if not os.path.isfile(path)]
+    if missing:
+        print(f"❌ FATAL ERROR: Asset not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    remote_assets = get_release_assets(tag_name)
+    state = load_upload_state(tag_name)
+    pending = []
+    for path in asset_paths:
+        name = os.path.basename(path)
+        # Digests computed earlier (e.g. during the export) are reused.
+        sha256 = download.recorded_sha256(path) or download.file_sha256(path)
+        local = {"size": os.path.getsize(path), "sha256": sha256}
+        if is_uploaded(remote_assets.get(name), local, state["assets"].get(name)):
+            print(f"   -> {name} is already uploaded. Skipping.")
+        else:
+            pending.append((path, local))
+
+    def upload(item):
+        path, local = item
+        error = upload_asset(tag_name, path)
+        if error is None:
+            print(f"   -> Uploaded {os.path.basename(path)}.")
+            record_upload(tag_name, os.path.basename(path), local)
+        return path, error
+
+    failed = []
+    if pending:
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(pending)))
+        ) as executor:
+            failed = [
+                (path, error)
+                for path, error in executor.map(upload, pending)
+                if error is not None
+            ]
+    if failed:
+        for path, error in failed:
+            print(f"❌ FATAL ERROR: Failed to upload {os.path.basename(path)}.")
+            print(error)
+        print("   Run 'python release.py finalize' again to upload the missing assets.")
+        sys.exit(1)
+    print("✅ All assets uploaded successfully.")
+
+
+# --- Documentation Sync ---
+
+
+@dataclass
+class SyncReport:
+    """What a documentation sync copied, left alone and deleted."""
+
+    copied: int = 0
+    copied_bytes: int = 0
+    skipped: int = 0
+    skipped_bytes: int = 0
+    removed: int = 0
+    # Files in the target that no deploy accounts for (deleted with 'prune').
+    unmanaged: list = field(default_factory=list)
+
+
+def format_mb(size):
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def _site_files(root):
+    """Returns the relative paths ('/'-separated) of all files below 'root'."""
+    files = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(directory, filename), root)
+            files.append(path.replace(os.sep, "/"))
+    return files
 
 
-def handle_deploy_docs():
-    """Builds the MkDocs site and deploys it to the production webserver."""
+def _copy_atomically(source, target):
+    """Copies a file so that readers of 'target' never see a partial file."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = f"{target}.deploy-tmp"
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _remove_deployed(deploy_path, name):
+    """Deletes a deployed file and the directories it leaves empty."""
+    target = os.path.join(deploy_path, *name.split("/"))
+    removed = os.path.isfile(target)
+    if removed:
+        os.remove(target)
+    directory = os.path.dirname(target)
+    while os.path.normpath(directory) != os.path.normpath(deploy_path):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+    return removed
+
+
+def sync_site(source_dir, deploy_path, jobs=SYNC_JOBS, prune=False):
+    """
+    Makes 'deploy_path' match 'source_dir', copying only files whose content
+    changed. A manifest of the deployed files and their SHA-256 digests is
+    kept in the target, so unchanged files are recognized without reading
+    them, and files that an earlier deploy copied but that are gone from
+    the site are deleted. Other files in the target are reported as
+    'unmanaged' and left alone, unless 'prune' is set. Returns a SyncReport.
+    """
+    manifest_path = os.path.join(deploy_path, DEPLOY_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            deployed = json.load(f)
+    except (OSError, ValueError):
+        deployed = {}
+
+    report = SyncReport()
+    manifest = {}
+    to_copy = []
+    for name in _site_files(source_dir):
+        source = os.path.join(source_dir, name)
+        target = os.path.join(deploy_path, *name.split("/"))
+        entry = {
+            "size": os.path.getsize(source),
+            "sha256": download.file_sha256(source),
+        }
+        manifest[name] = entry
+        try:
+            target_size = os.path.getsize(target)
+        except OSError:
+            target_size = None
+        # Without a manifest entry (first deploy), the target itself is compared.
+        previous = deployed.get(name)
+        if previous is None and target_size == entry["size"]:
+            previous = {"size": target_size, "sha256": download.file_sha256(target)}
+        if previous == entry and target_size == entry["size"]:
+            report.skipped += 1
+            report.skipped_bytes += entry["size"]
+        else:
+            to_copy.append((source, target, entry["size"]))
+
+    if to_copy:
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, len(to_copy)))
+        ) as executor:
+            list(executor.map(lambda item: _copy_atomically(*item[:2]), to_copy))
+    report.copied = len(to_copy)
+    report.copied_bytes = sum(size for _, _, size in to_copy)
+
+    for name in sorted(set(deployed) - set(manifest)):
+        report.removed += _remove_deployed(deploy_path, name)
+    own_files = (DEPLOY_MANIFEST, f"{DEPLOY_MANIFEST}.tmp")
+    report.unmanaged = sorted(
+        name
+        for name in _site_files(deploy_path)
+        if name not in manifest and name not in own_files
+    )
+    if prune:
+        for name in report.unmanaged:
+            report.removed += _remove_deployed(deploy_path, name)
+
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return report
+
+
+def handle_deploy_docs(prune=False):
+    """
+    Builds the MkDocs site and deploys it to the production webserver. With
+    'prune', files in the web root that are not part of the site are deleted.
+    """
     print("--- ACTION: Building and deploying documentation website ---")
 
     # 1. Load environment variables and check for the destination path
@@ -292,12 +742,26 @@ def handle_deploy_docs():
             print(e.stderr)
         sys.exit(1)
 
-    # 3. Copy the site to the destination
+    # 3. Sync the site to the destination (only changed files are copied)
     source_dir = "site/"
-    print(f"   -> Copying '{source_dir}' to '{deploy_path}'...")
+    print(f"   -> Syncing '{source_dir}' to '{deploy_path}'...")
     try:
-        # Use shutil.copytree for a robust, cross-platform directory copy
-        shutil.copytree(source_dir, deploy_path, dirs_exist_ok=True)
+        report = sync_site(source_dir, deploy_path, prune=prune)
+        print(
+            f"   -> Copied {report.copied} files ({format_mb(report.copied_bytes)}), "
+            f"skipped {report.skipped} unchanged ({format_mb(report.skipped_bytes)}), "
+            f"removed {report.removed} stale."
+        )
+        if report.unmanaged and not prune:
+            print(
+                f"   -> {len(report.unmanaged)} files in the web root are not part "
+                f"of the site (e.g. pages of older deploys):"
+            )
+            for name in report.unmanaged[:20]:
+                print(f"      {name}")
+            if len(report.unmanaged) > 20:
+                print(f"      ... and {len(report.unmanaged) - 20} more")
+            print("   -> Run 'python release.py deploy-docs --prune' to delete them.")
         print("✅ Documentation deployed successfully!")
     except Exception as e:
         print(f"❌ FATAL ERROR: Failed to copy site directory.")
@@ -334,7 +798,130 @@ def handle_version_bump(part):
     )
 
 
-def handle_finalize():
+# --- Finalize Pipeline ---
+
+
+@dataclass
+class Stage:
+    """One step of 'finalize' and the steps it has to wait for."""
+
+    name: str
+    func: Callable  # func(results) -> value; 'results' maps stage names to values.
+    needs: tuple = ()
+    status: str = "pending"  # Then "ok", "failed" or "skipped".
+    started: float = 0.0  # Seconds after the pipeline started.
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def run_stages(stages):
+    """
+    Runs every stage as soon as the stages it needs have succeeded. Stages
+    after a failed one are skipped. Returns {stage name: return value}.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    results = {}
+    pending = list(stages)
+    running = {}
+    origin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for stage in list(pending):
+                    needs = [by_name[name].status for name in stage.needs]
+                    if "failed" in needs or "skipped" in needs:
+                        stage.status = "skipped"
+                    elif all(status == "ok" for status in needs):
+                        stage.started = time.perf_counter() - origin
+                        running[executor.submit(stage.func, results)] = stage
+                    else:
+                        continue
+                    pending.remove(stage)
+                    changed = True
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                stage.seconds = time.perf_counter() - origin - stage.started
+                try:
+                    results[stage.name] = future.result()
+                    stage.status = "ok"
+                except (Exception, SystemExit) as e:
+                    # The release helpers report fatal errors with sys.exit().
+                    stage.status = "failed"
+                    if not isinstance(e, SystemExit):
+                        stage.error = f"{type(e).__name__}: {e}"
+    return results
+
+
+def print_stage_report(stages, wall_clock):
+    """Prints when each stage ran and how long it took."""
+    print("\n--- Stage timing ---")
+    for stage in sorted(
+        stages, key=lambda stage: (stage.status == "skipped", stage.started)
+    ):
+        if stage.status == "skipped":
+            print(f"   {stage.name:<20} skipped")
+            continue
+        end = stage.started + stage.seconds
+        print(
+            f"   {stage.name:<20} {stage.status:<7} "
+            f"{stage.started:7.1f}s -> {end:7.1f}s  ({stage.seconds:.1f}s)"
+        )
+        if stage.error:
+            print(f"      {stage.error}")
+    total = sum(stage.seconds for stage in stages)
+    print(f"   Finished in {wall_clock:.1f}s; the stages took {total:.1f}s in total.")
+
+
+def finalize_stages(tag_name, version, compress=False):
+    """Returns the stages of 'finalize' for a release."""
+    # The downloader executable is built on CI and included in the downloaded zip.
+    downloader_path = os.path.join("dist", "download-assets", "download-assets.exe")
+    return [
+        Stage("download", lambda results: download_windows_artifacts(tag_name)),
+        Stage("export", lambda results: export_vm(tag_name, compress=compress)),
+        Stage(
+            "installer",
+            lambda results: create_windows_installer(version),
+            needs=("download",),
+        ),
+        Stage(
+            "upload-downloader",
+            lambda results: upload_assets(tag_name, [downloader_path]),
+            needs=("download",),
+        ),
+        Stage(
+            "upload-installer",
+            lambda results: upload_assets(tag_name, [results["installer"]]),
+            needs=("installer",),
+        ),
+        Stage(
+            "upload-ova",
+            lambda results: upload_assets(tag_name, results["export"].asset_paths),
+            needs=("export",),
+        ),
+    ]
+
+
+def run_finalize(tag_name, version, compress=False):
+    """Runs the finalize stages for a release and reports their timing."""
+    stages = finalize_stages(tag_name, version, compress)
+    started = time.perf_counter()
+    run_stages(stages)
+    print_stage_report(stages, time.perf_counter() - started)
+
+    failed = [stage.name for stage in stages if stage.status != "ok"]
+    if failed:
+        print(f"❌ FATAL ERROR: Finalize did not complete ({', '.join(failed)}).")
+        print("   Run 'python release.py finalize' again; uploaded assets are skipped.")
+        sys.exit(1)
+
+
+def handle_finalize(compress=False):
     """Handles the 'finalize' command."""
     if sys.platform != "win32":
         print("Error: The 'finalize' command can only be run on a Windows machine.")
@@ -345,14 +932,7 @@ def handle_finalize():
     latest_tag = get_latest_tag()
     version = get_current_version_from_tag(latest_tag)
 
-    download_windows_artifacts(latest_tag)
-    installer_path = create_windows_installer(version)
-    ova_path = export_vm(latest_tag)
-
-    # The downloader executable is built on CI and included in the downloaded zip.
-    downloader_path = os.path.join("dist", "download-assets", "download-assets.exe")
-
-    upload_assets(latest_tag, [installer_path, ova_path, downloader_path])
+    run_finalize(latest_tag, version, compress)
 
     print("\n🎉 Final release mastering complete! All assets are uploaded. 🎉")
     print("\nTo deploy the documentation, run: python release.py deploy-docs")
@@ -385,13 +965,23 @@ def main():
     parser_finalize = subparsers.add_parser(
         "finalize", help="Finalize a release on Windows."
     )
-    parser_finalize.set_defaults(func=lambda _: handle_finalize())
+    parser_finalize.add_argument(
+        "--compress",
+        action="store_true",
+        help="Also publish a zstd-compressed copy of the OVA (needs 'zstd').",
+    )
+    parser_finalize.set_defaults(func=lambda args: handle_finalize(args.compress))
 
     # Subparser for deploying docs
     parser_deploy = subparsers.add_parser(
         "deploy-docs", help="Build and deploy documentation."
     )
-    parser_deploy.set_defaults(func=lambda _: handle_deploy_docs())
+    parser_deploy.add_argument(
+        "--prune",
+        action="store_true",
+        help="Also delete files in the web root that are not part of the site.",
+    )
+    parser_deploy.set_defaults(func=lambda args: handle_deploy_docs(args.prune))
 
     args = parser.parse_args()
     args.func(args)
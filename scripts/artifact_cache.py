@@ -0,0 +1,266 @@
+# scripts/artifact_cache.py
+"""
+A content-addressed cache for large artifacts (ISOs, OVAs, installers).
+
+Files are stored under their SHA-256 digest, so the same artifact is kept
+only once no matter which tool downloaded it or what it was called. The
+cache lives in a per-user directory (PIVM_CACHE_DIR overrides it, e.g. to
+share one cache between CI agents on a network drive) and is kept below a
+size limit by evicting the least recently used files.
+
+Inserts are atomic: a file is written to a temporary name inside the cache
+and renamed into place, so concurrent processes never see partial files.
+
+Usage:
+  python -m scripts.artifact_cache ls
+  python -m scripts.artifact_cache prune [--max-size 10G]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+# --- Configuration ---
+CACHE_DIR_ENV_VAR = "PIVM_CACHE_DIR"
+MAX_SIZE_ENV_VAR = "PIVM_CACHE_MAX_SIZE"
+DEFAULT_MAX_SIZE = 20 * 1024**3
+CHUNK_SIZE = 1024 * 1024
+
+_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(text):
+    """Parse a size such as '500M' or '20G' into bytes."""
+    text = str(text).strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    return int(float(text[: len(text) - len(unit)]) * _UNITS[unit])
+
+
+def format_size(size):
+    """Format a number of bytes for display."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def default_cache_dir():
+    """Return the cache directory (PIVM_CACHE_DIR overrides the default)."""
+    if os.environ.get(CACHE_DIR_ENV_VAR):
+        return os.environ[CACHE_DIR_ENV_VAR]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        return os.path.join(base, "pi-server-vm", "cache")
+    base = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    return os.path.join(base, "pi-server-vm")
+
+
+@dataclass
+class Entry:
+    """One cached artifact."""
+
+    digest: str
+    size: int
+    last_used: float
+    name: str
+
+
+class ArtifactCache:
+    """A directory of files named by their SHA-256 digest."""
+
+    def __init__(self, root=None, max_size=None):
+        self.root = root or default_cache_dir()
+        if max_size is None:
+            max_size = parse_size(os.environ.get(MAX_SIZE_ENV_VAR, DEFAULT_MAX_SIZE))
+        self.max_size = max_size
+
+    def _blob_path(self, digest):
+        return os.path.join(self.root, "sha256", digest[:2], digest)
+
+    def _meta_path(self, digest):
+        return f"{self._blob_path(digest)}.json"
+
+    def lookup(self, digest):
+        """Return the cached path for a digest, or None. Marks it as used."""
+        digest = digest.lower()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            return None
+        # Usage is tracked on the metadata file; artifacts are never touched
+        # once they are in the cache.
+        try:
+            os.utime(self._meta_path(digest))
+        except FileNotFoundError:
+            self._write_meta(digest, "")
+        return path
+
+    def fetch(self, digest, destination):
+        """
+        Copy the cached artifact to 'destination'. Returns False if the digest
+        is not cached. Copies (not links) are used so that changing the file
+        in a working directory can never corrupt the cache.
+        """
+        source = self.lookup(digest)
+        if source is None:
+            return False
+        directory = os.path.dirname(destination) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".pivm-", suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, temp_path)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return True
+
+    def insert(self, path, digest=None, name=None, verified=False):
+        """
+        Add a file to the cache and return its digest. When 'digest' is given
+        the content is verified while it is copied and ValueError is raised on
+        a mismatch, unless the caller has just 'verified' it.
+        """
+        name = name or os.path.basename(path)
+        if digest and self.lookup(digest):
+            return digest.lower()
+        temp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            if digest and verified:
+                shutil.copyfile(path, temp_path)
+                actual = digest.lower()
+            else:
+                actual = _copy_and_hash(path, temp_path)
+            if digest is None:
+                digest = actual
+            elif actual != digest.lower():
+                raise ValueError(f"Checksum mismatch for {path}; not cached.")
+            digest = digest.lower()
+            blob = self._blob_path(digest)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(temp_path, blob)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._write_meta(digest, name)
+        self.prune()
+        return digest
+
+    def _write_meta(self, digest, name):
+        meta_path = self._meta_path(digest)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"name": name, "added": time.time()}, f)
+        os.replace(temp_path, meta_path)
+
+    def entries(self):
+        """Return all cached artifacts, most recently used first."""
+        entries = []
+        blobs = os.path.join(self.root, "sha256")
+        if not os.path.isdir(blobs):
+            return entries
+        for prefix in os.listdir(blobs):
+            for filename in os.listdir(os.path.join(blobs, prefix)):
+                if filename.endswith((".json", ".tmp")):
+                    continue
+                path = os.path.join(blobs, prefix, filename)
+                try:
+                    size = os.path.getsize(path)
+                    last_used = os.path.getmtime(self._meta_path(filename))
+                except FileNotFoundError:
+                    try:
+                        last_used = os.path.getmtime(path)
+                    except FileNotFoundError:
+                        continue  # Evicted by another process meanwhile.
+                entries.append(Entry(filename, size, last_used, self._name(filename)))
+        entries.sort(key=lambda entry: entry.last_used, reverse=True)
+        return entries
+
+    def _name(self, digest):
+        try:
+            with open(self._meta_path(digest)) as f:
+                return json.load(f).get("name", "")
+        except (OSError, ValueError):
+            return ""
+
+    def remove(self, digest):
+        """Remove one artifact from the cache."""
+        for path in (self._blob_path(digest), self._meta_path(digest)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def prune(self, max_size=None):
+        """Evict least recently used artifacts until the cache fits in 'max_size'."""
+        max_size = self.max_size if max_size is None else max_size
+        entries = self.entries()
+        total = sum(entry.size for entry in entries)
+        removed = []
+        while entries and total > max_size:
+            entry = entries.pop()
+            self.remove(entry.digest)
+            total -= entry.size
+            removed.append(entry)
+        return removed
+
+
+def _copy_and_hash(source, destination):
+    sha256_hash = hashlib.sha256()
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        for block in iter(lambda: src.read(CHUNK_SIZE), b""):
+            sha256_hash.update(block)
+            dst.write(block)
+    return sha256_hash.hexdigest()
+
+
+def main(argv=None):
+    """Inspect or prune the artifact cache."""
+    parser = argparse.ArgumentParser(description="Manage the shared artifact cache.")
+    parser.add_argument("--dir", help="Cache directory (default: PIVM_CACHE_DIR).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("ls", help="List cached artifacts, most recently used first.")
+    prune_parser = commands.add_parser("prune", help="Evict old artifacts.")
+    prune_parser.add_argument(
+        "--max-size", help="Shrink the cache to this size, e.g. 5G (0 empties it)."
+    )
+    args = parser.parse_args(argv)
+
+    cache = ArtifactCache(args.dir)
+    if args.command == "ls":
+        entries = cache.entries()
+        for entry in entries:
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.last_used))
+            print(
+                f"{entry.digest[:16]}  {format_size(entry.size):>10}  {used}  {entry.name}"
+            )
+        total = sum(entry.size for entry in entries)
+        print(
+            f"{len(entries)} artifacts, {format_size(total)} "
+            f"(limit {format_size(cache.max_size)}) in {cache.root}"
+        )
+        return 0
+
+    max_size = parse_size(args.max_size) if args.max_size is not None else None
+    removed = cache.prune(max_size)
+    for entry in removed:
+        print(f"Removed {entry.name or entry.digest} ({format_size(entry.size)})")
+    print(f"{len(removed)} artifacts removed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
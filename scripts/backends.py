@@ -0,0 +1,411 @@
+# scripts/backends.py
+"""
+Interchangeable ways of executing VBoxManage commands.
+
+Every backend offers 'execute(args)', which takes the arguments of a
+VBoxManage command line (without the executable itself), returns its
+standard output and raises subprocess.CalledProcessError on failure.
+
+- 'subprocess': starts one VBoxManage process per command (the default).
+- 'vboxapi': keeps one long-lived session with VBoxSVC through the
+  VirtualBox Python bindings and translates the commands used by this
+  project into API calls. Anything it does not translate is passed on to
+  the subprocess backend.
+"""
+
+import datetime
+import re
+import subprocess
+import threading
+
+# --- Process Accounting ---
+
+_spawn_lock = threading.Lock()
+_spawn_count = 0
+
+
+def get_spawn_count():
+    """Return the number of VBoxManage processes started so far."""
+    return _spawn_count
+
+
+def reset_spawn_count():
+    """Reset the VBoxManage process counter to zero."""
+    global _spawn_count
+    with _spawn_lock:
+        _spawn_count = 0
+
+
+def _count_spawn():
+    global _spawn_count
+    with _spawn_lock:
+        _spawn_count += 1
+
+
+# Option values that can be shown without quoting.
+_PLAIN_VALUE = re.compile(r"^[\w.:/=-]+$")
+
+
+class Secret(str):
+    """A command-line value (such as a password) that is never displayed."""
+
+    def __repr__(self):
+        return "'***'"
+
+
+def quote(value):
+    """Quote a command-line value for display unless it is a plain token."""
+    if isinstance(value, Secret):
+        return "***"
+    value = str(value)
+    return value if _PLAIN_VALUE.match(value) else f'"{value}"'
+
+
+def format_command(args):
+    """Return a readable 'VBoxManage ...' command line for a list of arguments."""
+    return " ".join(["VBoxManage", *(quote(arg) for arg in args)])
+
+
+def parse_options(args):
+    """Split VBoxManage '--key value' / '--key=value' options into a dict."""
+    options, positional = {}, []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith("--"):
+            if "=" in arg:
+                key, value = arg[2:].split("=", 1)
+            elif i + 1 < len(args) and not args[i + 1].startswith("--"):
+                key, value = arg[2:], args[i + 1]
+                i += 1
+            else:
+                key, value = arg[2:], True
+            options[key] = value
+        else:
+            positional.append(arg)
+        i += 1
+    return options, positional
+
+
+# --- Backends ---
+
+
+class SubprocessBackend:
+    """Runs every command as a separate VBoxManage process."""
+
+    name = "subprocess"
+
+    def execute(self, args, check=True):
+        _count_spawn()
+        result = subprocess.run(
+            ["VBoxManage", *args], capture_output=True, text=True, check=False
+        )
+        if check and result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, format_command(args), result.stdout, result.stderr
+            )
+        return result.stdout
+
+    def close(self):
+        pass
+
+
+class VBoxApiBackend:
+    """
+    Talks to VBoxSVC over one persistent connection using the 'vboxapi' module
+    that ships with VirtualBox (XPCOM on Linux/macOS, COM on Windows).
+    """
+
+    name = "vboxapi"
+
+    # 'VMState' values as printed by 'VBoxManage showvminfo --machinereadable'.
+    _STATE_NAMES = {
+        "PoweredOff": "poweroff",
+        "Saved": "saved",
+        "Aborted": "aborted",
+        "Running": "running",
+        "Paused": "paused",
+        "Starting": "starting",
+        "Stopping": "stopping",
+    }
+
+    def __init__(self, fallback=None):
+        try:
+            from vboxapi import VirtualBoxManager
+        except ImportError:
+            raise RuntimeError(
+                "The 'vboxapi' backend needs the VirtualBox Python bindings. "
+                "Install them from the VirtualBox SDK (sdk/installer)."
+            )
+        self._manager = VirtualBoxManager(None, None)
+        self._vbox = self._manager.getVirtualBox()
+        self._const = self._manager.constants
+        self._fallback = fallback or SubprocessBackend()
+        # The API objects are not safe to share between threads without care:
+        # calls into them are serialized, but waiting for a long operation
+        # (a clone, a VM start) happens outside the lock.
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            if self._manager is not None:
+                self._manager.deinit()
+            self._manager = None
+            self._vbox = None
+
+    def execute(self, args, check=True):
+        handler = self._handler(args)
+        if handler is None:
+            return self._fallback.execute(args, check=check)
+        try:
+            return handler(args) or ""
+        except Exception as e:
+            if not check:
+                return ""
+            raise subprocess.CalledProcessError(
+                1, format_command(args), "", f"VBoxManage: error: {e}"
+            )
+
+    # --- Dispatch ---
+
+    def _handler(self, args):
+        command = args[0] if args else ""
+        if command == "list" and len(args) > 1:
+            return {
+                "vms": self._list_vms,
+                "runningvms": self._list_vms,
+                "bridgedifs": self._list_bridgedifs,
+                "systemproperties": self._list_systemproperties,
+            }.get(args[1])
+        if command == "guestproperty" and len(args) > 1 and args[1] in ("get", "set"):
+            return self._guestproperty
+        if command == "snapshot" and len(args) > 2 and args[2] in ("take", "edit"):
+            return self._snapshot
+        return {
+            "showvminfo": self._showvminfo,
+            "modifyvm": self._modifyvm,
+            "clonevm": self._clonevm,
+            "registervm": self._registervm,
+            "startvm": self._startvm,
+        }.get(command)
+
+    # --- Helpers ---
+
+    def _wait(self, progress):
+        """Wait for a long-running operation; called without holding the lock."""
+        progress.waitForCompletion(-1)
+        with self._lock:
+            if progress.resultCode != 0:
+                raise RuntimeError(progress.errorInfo.text)
+
+    def _state_name(self, state):
+        for name, text in self._STATE_NAMES.items():
+            if state == getattr(self._const, f"MachineState_{name}"):
+                return text
+        return "unknown"
+
+    def _session(self, machine, lock_type="Shared"):
+        session = self._manager.getSessionObject()
+        machine.lockMachine(session, getattr(self._const, f"LockType_{lock_type}"))
+        return session
+
+    def _unlock(self, session):
+        with self._lock:
+            session.unlockMachine()
+
+    # --- Commands ---
+
+    def _list_vms(self, args):
+        running = args[1] == "runningvms"
+        lines = []
+        with self._lock:
+            for machine in self._manager.getArray(self._vbox, "machines"):
+                state = self._state_name(machine.state)
+                if running and state not in ("running", "paused"):
+                    continue
+                lines.append(f'"{machine.name}" {{{machine.id}}}\n')
+        return "".join(lines)
+
+    def _list_bridgedifs(self, args):
+        with self._lock:
+            interfaces = self._vbox.host.findHostNetworkInterfacesOfType(
+                self._const.HostNetworkInterfaceType_Bridged
+            )
+            names = [iface.name for iface in interfaces]
+        return "".join(f"Name:            {name}\n\n" for name in names)
+
+    def _list_systemproperties(self, args):
+        with self._lock:
+            folder = self._vbox.systemProperties.defaultMachineFolder
+        return f"Default machine folder:          {folder}\n"
+
+    def _showvminfo(self, args):
+        with self._lock:
+            return self._machine_info(self._vbox.findMachine(args[1]))
+
+    def _machine_info(self, machine):
+        changed = datetime.datetime.fromtimestamp(
+            machine.lastStateChange / 1000, datetime.timezone.utc
+        )
+        lines = [
+            f'name="{machine.name}"',
+            f'groups="{",".join(self._manager.getArray(machine, "groups"))}"',
+            f'UUID="{machine.id}"',
+            f'CfgFile="{machine.settingsFilePath}"',
+            f'VMState="{self._state_name(machine.state)}"',
+            f'VMStateChangeTime="{changed:%Y-%m-%dT%H:%M:%S.%f}000"',
+            f"memory={machine.memorySize}",
+            f"cpus={machine.CPUCount}",
+            f'macaddress1="{machine.getNetworkAdapter(0).MACAddress}"',
+        ]
+        if machine.description:
+            lines.append(f'description="{machine.description}"')
+        for attachment in self._manager.getArray(machine, "mediumAttachments"):
+            if attachment.medium is not None:
+                slot = f"{attachment.controller}-{attachment.port}-{attachment.device}"
+                lines.append(f'"{slot}"="{attachment.medium.location}"')
+                lines.append(
+                    f'"{attachment.controller}-ImageUUID-{attachment.port}-'
+                    f'{attachment.device}"="{attachment.medium.id}"'
+                )
+        if machine.snapshotCount:
+            lines.extend(self._snapshot_lines(machine.findSnapshot(""), ""))
+            lines.append(f'CurrentSnapshotName="{machine.currentSnapshot.name}"')
+            lines.append(f'CurrentSnapshotUUID="{machine.currentSnapshot.id}"')
+        return "\n".join(lines) + "\n"
+
+    def _snapshot_lines(self, snapshot, suffix):
+        lines = [
+            f'SnapshotName{suffix}="{snapshot.name}"',
+            f'SnapshotUUID{suffix}="{snapshot.id}"',
+        ]
+        if snapshot.description:
+            lines.append(f'SnapshotDescription{suffix}="{snapshot.description}"')
+        children = self._manager.getArray(snapshot, "children")
+        for index, child in enumerate(children, start=1):
+            lines.extend(self._snapshot_lines(child, f"{suffix}-{index}"))
+        return lines
+
+    def _modifyvm(self, args):
+        options, _ = parse_options(args[2:])
+        with self._lock:
+            machine = self._vbox.findMachine(args[1])
+            session = self._session(machine, "Write")
+            try:
+                mutable = session.machine
+                if "memory" in options:
+                    mutable.memorySize = int(options.pop("memory"))
+                if "cpus" in options:
+                    mutable.CPUCount = int(options.pop("cpus"))
+                if "description" in options:
+                    mutable.description = options.pop("description")
+                if "macaddress1" in options:
+                    mutable.getNetworkAdapter(0).MACAddress = options.pop("macaddress1")
+                mutable.saveSettings()
+            finally:
+                session.unlockMachine()
+        # Settings without a translation are applied by VBoxManage once the
+        # write lock has been released.
+        if options:
+            untranslated = [f"--{key}={value}" for key, value in options.items()]
+            self._fallback.execute(["modifyvm", args[1], *untranslated])
+
+    def _guestproperty(self, args):
+        with self._lock:
+            machine = self._vbox.findMachine(args[2])
+            if args[1] == "get":
+                value = machine.getGuestPropertyValue(args[3])
+                return f"Value: {value}\n" if value else "No value set!\n"
+            session = self._session(machine)
+            try:
+                value = args[4] if len(args) > 4 else ""
+                session.machine.setGuestPropertyValue(args[3], value)
+            finally:
+                session.unlockMachine()
+
+    def _snapshot(self, args):
+        options, _ = parse_options(args[4:])
+        with self._lock:
+            machine = self._vbox.findMachine(args[1])
+            session = self._session(machine)
+            if args[2] != "take":
+                try:
+                    snapshot = session.machine.findSnapshot(args[3])
+                    snapshot.description = options.get("description", "")
+                finally:
+                    session.unlockMachine()
+                return
+            try:
+                progress, _ = session.machine.takeSnapshot(
+                    args[3], options.get("description", ""), True
+                )
+            except Exception:
+                session.unlockMachine()
+                raise
+        try:
+            self._wait(progress)
+        finally:
+            self._unlock(session)
+
+    def _clonevm(self, args):
+        options, positional = parse_options(args[1:])
+        with self._lock:
+            source = self._vbox.findMachine(positional[0])
+            if "snapshot" in options:
+                source = source.findSnapshot(options["snapshot"]).machine
+            settings_file = ""
+            if "basefolder" in options:
+                settings_file = self._vbox.composeMachineFilename(
+                    options["name"], "", "", options["basefolder"]
+                )
+            try:
+                target = self._vbox.createMachine(
+                    settings_file, options["name"], [], source.OSTypeId, "", "", "", ""
+                )
+            except TypeError:
+                # VirtualBox 6.x has no disk encryption arguments.
+                target = self._vbox.createMachine(
+                    settings_file, options["name"], [], source.OSTypeId, ""
+                )
+            clone_options = []
+            if options.get("options") == "link":
+                clone_options.append(self._const.CloneOptions_Link)
+            progress = source.cloneTo(
+                target, self._const.CloneMode_MachineState, clone_options
+            )
+        # The disk copy takes minutes; other commands run in the meantime.
+        self._wait(progress)
+        if options.get("register"):
+            with self._lock:
+                self._vbox.registerMachine(target)
+
+    def _registervm(self, args):
+        with self._lock:
+            self._vbox.registerMachine(self._vbox.openMachine(args[1]))
+
+    def _startvm(self, args):
+        options, positional = parse_options(args[1:])
+        with self._lock:
+            machine = self._vbox.findMachine(positional[0])
+            session = self._manager.getSessionObject()
+            progress = machine.launchVMProcess(session, options.get("type", "gui"), [])
+        try:
+            self._wait(progress)
+        finally:
+            self._unlock(session)
+
+
+BACKENDS = {
+    SubprocessBackend.name: SubprocessBackend,
+    VBoxApiBackend.name: VBoxApiBackend,
+}
+
+
+def create_backend(name):
+    """Create a backend by name (see BACKENDS)."""
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown backend '{name}'. Choose from: {', '.join(sorted(BACKENDS))}."
+        )
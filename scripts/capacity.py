@@ -0,0 +1,320 @@
+# scripts/capacity.py
+"""
+Host capacity accounting for starting VMs.
+
+The host's CPUs and memory are read from /proc (PIVM_PROC_ROOT points
+elsewhere, e.g. at a fake in the tests). The allocations of the running VMs
+and of starts that were admitted but have not finished yet are subtracted,
+and a start is admitted only if its VM still fits. Requests that do not fit
+wait in a first-come, first-served queue until VMs stop or earlier starts
+complete; a VM that could never fit is refused immediately.
+
+The queue is per process (the web app and a fleet clone each have one), but
+the running VMs are read from VirtualBox, so separate tools still see each
+other's VMs once they run.
+
+Usage:
+  python -m scripts.capacity [--json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+
+from scripts import inventory
+
+# --- Configuration ---
+PROC_ROOT_ENV_VAR = "PIVM_PROC_ROOT"
+RESERVE_ENV_VAR = "PIVM_HOST_RESERVE_MB"
+OVERCOMMIT_ENV_VAR = "PIVM_CPU_OVERCOMMIT"
+TIMEOUT_ENV_VAR = "PIVM_START_TIMEOUT"
+DEFAULT_RESERVE_MB = 1024  # Memory kept for the host itself.
+DEFAULT_CPU_OVERCOMMIT = 2.0  # Virtual CPUs allowed per host CPU.
+DEFAULT_START_TIMEOUT = 600.0  # Seconds a start may wait in the queue.
+POLL_INTERVAL = 5.0  # VMs stopped by other tools are noticed this often.
+
+# VirtualBox's defaults, for VMs whose settings do not say.
+DEFAULT_VM_MEMORY_MB = 128
+DEFAULT_VM_CPUS = 1
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class CapacityError(RuntimeError):
+    """A VM cannot be started because the host has no room for it."""
+
+
+@dataclass
+class Budget:
+    """The host's capacity and how much of it is allocated."""
+
+    host_cpus: int
+    host_memory_mb: int
+    cpu_limit: int  # Virtual CPUs that may be allocated in total.
+    memory_limit_mb: int  # Host memory minus the host's reserve.
+    used_cpus: int = 0
+    used_memory_mb: int = 0
+    running: int = 0  # Running VMs.
+    starting: int = 0  # Admitted starts that have not finished.
+    queued: int = 0  # Starts waiting for capacity.
+
+    @property
+    def free_cpus(self):
+        return max(0, self.cpu_limit - self.used_cpus)
+
+    @property
+    def free_memory_mb(self):
+        return max(0, self.memory_limit_mb - self.used_memory_mb)
+
+    def fits(self, memory_mb, cpus):
+        """True if a VM of this size can be started now."""
+        return memory_mb <= self.free_memory_mb and cpus <= self.free_cpus
+
+    def could_ever_fit(self, memory_mb, cpus):
+        """True if a VM of this size fits on the host when nothing else runs."""
+        return memory_mb <= self.memory_limit_mb and cpus <= self.cpu_limit
+
+    def to_dict(self):
+        data = asdict(self)
+        data.update(free_cpus=self.free_cpus, free_memory_mb=self.free_memory_mb)
+        return data
+
+
+def _env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_start_timeout():
+    """Return the queue timeout in seconds (PIVM_START_TIMEOUT overrides it)."""
+    return _env_number(TIMEOUT_ENV_VAR, DEFAULT_START_TIMEOUT)
+
+
+def read_host_resources(proc_root=None):
+    """
+    Return the host's (CPUs, memory in MB). Without a readable /proc (e.g. on
+    Windows), the CPU count comes from Python and the memory is unknown (None).
+    """
+    proc_root = proc_root or os.environ.get(PROC_ROOT_ENV_VAR, "/proc")
+    cpus, memory_mb = None, None
+    try:
+        with open(os.path.join(proc_root, "cpuinfo")) as f:
+            cpus = sum(1 for line in f if line.startswith("processor"))
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(proc_root, "meminfo")) as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory_mb = int(line.split()[1]) // 1024  # The value is in kB.
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return cpus or os.cpu_count() or 1, memory_mb
+
+
+def vm_allocation(info):
+    """Return the (memory in MB, CPUs) of a VM from its 'showvminfo' data."""
+    try:
+        memory_mb = int(info.get("memory", DEFAULT_VM_MEMORY_MB))
+        cpus = int(info.get("cpus", DEFAULT_VM_CPUS))
+    except ValueError:
+        return DEFAULT_VM_MEMORY_MB, DEFAULT_VM_CPUS
+    return memory_mb, cpus
+
+
+class Scheduler:
+    """Admits VM starts while the host has capacity and queues the rest."""
+
+    def __init__(self, host=read_host_resources, vm_info=None, poll=POLL_INTERVAL):
+        self._host = host
+        # Returns the 'showvminfo' data of a VM; defaults to vm_manager's.
+        self._vm_info = vm_info
+        self._poll = poll
+        self._changed = threading.Condition()
+        self._queue = deque()
+        self._starting = {}  # VM name -> (memory MB, CPUs) of admitted starts.
+        self._releases = 0  # Counts release() calls, see acquire().
+        # A running VM's settings cannot change, so its size is read once and
+        # forgotten when it stops (it may be resized before the next start).
+        self._sizes = {}
+        self._sizes_lock = threading.Lock()
+
+    def _running_allocations(self):
+        """Return {name: (memory MB, CPUs)} of the running VMs."""
+        vm_info = self._vm_info
+        if vm_info is None:
+            from scripts import vm_manager
+
+            vm_info = vm_manager.get_vm_info
+        records = inventory.get_inventory().records(running_only=True)
+        with self._sizes_lock:
+            sizes = {
+                r.uuid: self._sizes[r.uuid] for r in records if r.uuid in self._sizes
+            }
+        allocations = {}
+        for record in records:
+            if record.uuid not in sizes:
+                try:
+                    sizes[record.uuid] = vm_allocation(vm_info(record.uuid))
+                except Exception:
+                    continue  # Stopped or unregistered since the list was read.
+            allocations[record.name] = sizes[record.uuid]
+        with self._sizes_lock:
+            self._sizes = sizes
+        return allocations
+
+    def _snapshot(self):
+        """
+        Read the host's resources and the running VMs. This runs VBoxManage,
+        so it is called without holding the lock.
+        """
+        return self._host(), self._running_allocations()
+
+    def _budget(self, snapshot):
+        """Compute the budget from a _snapshot(); the caller holds the lock."""
+        (cpus, memory_mb), running = snapshot
+        reserve = int(_env_number(RESERVE_ENV_VAR, DEFAULT_RESERVE_MB))
+        overcommit = _env_number(OVERCOMMIT_ENV_VAR, DEFAULT_CPU_OVERCOMMIT)
+        budget = Budget(
+            host_cpus=cpus,
+            host_memory_mb=memory_mb or 0,
+            cpu_limit=int(cpus * overcommit),
+            # Unknown memory is not limited, rather than blocking every start.
+            memory_limit_mb=max(0, memory_mb - reserve) if memory_mb else sys.maxsize,
+        )
+        # A VM that just started may be running and still be counted as starting.
+        allocations = dict(running, **self._starting)
+        budget.used_memory_mb = sum(memory for memory, _ in allocations.values())
+        budget.used_cpus = sum(cpus for _, cpus in allocations.values())
+        budget.running = len(running)
+        budget.starting = len(self._starting)
+        budget.queued = len(self._queue)
+        return budget
+
+    def budget(self):
+        """Return the current Budget."""
+        snapshot = self._snapshot()
+        with self._changed:
+            return self._budget(snapshot)
+
+    def acquire(self, name, memory_mb, cpus, timeout=None, on_queued=None):
+        """
+        Wait until the VM fits, then count it as starting. Raises CapacityError
+        if it can never fit or 'timeout' seconds pass. 'on_queued(budget)' is
+        called once if the request has to wait.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ticket = object()
+        with self._changed:
+            self._queue.append(ticket)
+            releases = self._releases
+        try:
+            while True:
+                snapshot = self._snapshot()
+                with self._changed:
+                    if self._releases != releases:
+                        # A start finished while the snapshot was read, so that
+                        # VM may be missing from both the snapshot and _starting.
+                        releases = self._releases
+                        continue
+                    budget = self._budget(snapshot)
+                    if not budget.could_ever_fit(memory_mb, cpus):
+                        raise CapacityError(
+                            f"'{name}' needs {memory_mb} MB and {cpus} CPUs, but "
+                            f"the host can run at most {budget.memory_limit_mb} MB "
+                            f"and {budget.cpu_limit} CPUs of VMs."
+                        )
+                    # Only the oldest request may start, so big VMs are not starved.
+                    if self._queue[0] is ticket and budget.fits(memory_mb, cpus):
+                        self._starting[name] = (memory_mb, cpus)
+                        return budget
+                    if on_queued is not None:
+                        on_queued(budget)
+                        on_queued = None
+                    wait = self._poll
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise CapacityError(
+                                f"Timed out waiting for host capacity to start "
+                                f"'{name}' ({budget.free_memory_mb} MB and "
+                                f"{budget.free_cpus} CPUs free)."
+                            )
+                        wait = min(wait, remaining)
+                    self._changed.wait(wait)
+                    releases = self._releases
+        finally:
+            with self._changed:
+                self._queue.remove(ticket)
+                self._changed.notify_all()
+
+    def release(self, name):
+        """Stop counting a start; the VM now counts as running (or failed)."""
+        with self._changed:
+            self._starting.pop(name, None)
+            self._releases += 1
+            self._changed.notify_all()
+
+    @contextlib.contextmanager
+    def reserve(self, name, memory_mb, cpus, timeout=None, on_queued=None):
+        """Hold a VM's capacity while it starts (see acquire())."""
+        self.acquire(name, memory_mb, cpus, timeout, on_queued)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+
+def get_scheduler():
+    """Return the scheduler shared by everything in this process."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def main(argv=None):
+    """Print the host's capacity budget."""
+    parser = argparse.ArgumentParser(
+        description="Show how much host capacity is left for starting VMs."
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON output.")
+    args = parser.parse_args(argv)
+
+    from scripts import vm_manager
+
+    if not vm_manager.setup_environment():
+        return 1
+
+    budget = get_scheduler().budget()
+    if args.json:
+        print(json.dumps(budget.to_dict(), indent=2))
+        return 0
+    memory_limit = (
+        "unlimited"
+        if budget.memory_limit_mb == sys.maxsize
+        else f"{budget.memory_limit_mb} MB"
+    )
+    print(f"Host:    {budget.host_cpus} CPUs, {budget.host_memory_mb} MB")
+    print(f"Limit:   {budget.cpu_limit} vCPUs, {memory_limit} for VMs")
+    print(
+        f"Used:    {budget.used_cpus} vCPUs, {budget.used_memory_mb} MB "
+        f"({budget.running} running, {budget.starting} starting)"
+    )
+    print(f"Free:    {budget.free_cpus} vCPUs, {budget.free_memory_mb} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# scripts/clone_fleet.py
+"""
+A cross-platform script to clone a whole fleet of VMs from the master template.
+
+This script creates N VMs named '<prefix><number>' by cloning
+'pi-master-template' concurrently with a bounded pool of worker threads.
+Only the steps VirtualBox requires to be serialized (registration and media
+registry writes) run one at a time; everything else overlaps.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts import backends, readiness, vm_manager
+from scripts.clone_vm import SOURCE_VM_NAME
+
+# --- Configuration ---
+DEFAULT_PREFIX = "pi-fleet-"
+DEFAULT_JOBS = 4
+
+
+def parse_arguments(argv=None):
+    """Parses all command-line arguments using argparse."""
+    parser = argparse.ArgumentParser(
+        description="Clone a fleet of VMs from the master Pi VM template in parallel.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser.add_argument(
+        "--count", type=int, required=True, help="Number of VMs to create."
+    )
+    parser.add_argument(
+        "--prefix",
+        default=DEFAULT_PREFIX,
+        help=f"Name prefix for the new VMs (default: {DEFAULT_PREFIX}).",
+    )
+    parser.add_argument(
+        "--first-index",
+        type=int,
+        default=1,
+        help="Number of the first VM in the fleet (default: 1).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Maximum number of clones running at once (default: {DEFAULT_JOBS}).",
+    )
+    parser.add_argument("--ram", type=int, help="Amount of RAM in MB.")
+    parser.add_argument("--cpus", type=int, help="Number of CPU cores.")
+    parser.add_argument(
+        "--disk-size", type=int, help="Size in GB for a new, secondary virtual disk."
+    )
+    parser.add_argument("--user", type=str, help="The username for the default user.")
+    parser.add_argument("--password", type=str, help="The password for the user.")
+    parser.add_argument(
+        "--start",
+        action="store_true",
+        help="Automatically start the VMs after cloning. Starts wait in a queue\n"
+        "while the host has no CPUs or memory to spare.",
+    )
+    parser.add_argument(
+        "--wait-ready",
+        action="store_true",
+        help="With --start, wait until all started VMs are ready to use.",
+    )
+    parser.add_argument(
+        "--linked",
+        action="store_true",
+        help="Create linked clones that share the template's disk (copy-on-write).",
+    )
+    parser.add_argument(
+        "--tag",
+        help="Put the VMs in the VirtualBox group '/<tag>', e.g. for\n"
+        "'python -m scripts.vm_gc --tag <tag>'.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(backends.BACKENDS),
+        help="How VBoxManage commands are executed (default: the PIVM_BACKEND\n"
+        "environment variable, or 'subprocess').",
+    )
+    args = parser.parse_args(argv)
+    if args.wait_ready and not args.start:
+        parser.error("--wait-ready requires --start")
+    return args
+
+
+def fleet_names(prefix, count, first_index=1):
+    """Return the VM names of a fleet, zero-padded so they sort naturally."""
+    last_index = first_index + count - 1
+    width = len(str(last_index))
+    return [f"{prefix}{i:0{width}d}" for i in range(first_index, last_index + 1)]
+
+
+def clone_one(name, args, machine_folder):
+    """Clone a single fleet member. Returns a (name, error, seconds) tuple."""
+    started = time.perf_counter()
+    try:
+        vm_manager.clone_vm(
+            source=SOURCE_VM_NAME,
+            target=name,
+            ram=args.ram,
+            cpus=args.cpus,
+            disk_size=args.disk_size,
+            user=args.user,
+            password=args.password,
+            start_vm=args.start,
+            linked=args.linked,
+            machine_folder=machine_folder,
+            tag=args.tag,
+        )
+        error = None
+    except subprocess.CalledProcessError as e:
+        error = f"{e.cmd}: {(e.stderr or '').strip()}"
+    except Exception as e:
+        error = str(e)
+    return name, error, time.perf_counter() - started
+
+
+def clone_fleet(names, args):
+    """Clone all VMs concurrently. Returns a list of (name, error, seconds) tuples."""
+    machine_folder = vm_manager.get_default_machine_folder()
+    jobs = max(1, min(args.jobs, len(names)))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(clone_one, name, args, machine_folder) for name in names]
+        return [future.result() for future in futures]
+
+
+def print_summary(results, wall_clock):
+    """Print per-VM timings and the total wall-clock time of the fleet."""
+    print("\n--- Fleet Summary ---")
+    for name, error, seconds in results:
+        status = "OK" if error is None else "FAILED"
+        print(f"  {name:<30} {status:<7} {seconds:8.2f}s")
+        if error:
+            print(f"      {error}")
+
+    succeeded = sum(1 for _, error, _ in results if error is None)
+    busy_time = sum(seconds for _, _, seconds in results)
+    print(f"\n{succeeded}/{len(results)} VMs cloned successfully.")
+    print(f"Total wall-clock time: {wall_clock:.2f}s")
+    print(f"Sum of per-VM times:   {busy_time:.2f}s")
+
+
+def main(argv=None):
+    """Main execution function."""
+    args = parse_arguments(argv)
+    if not vm_manager.setup_environment():
+        return 1
+
+    if args.backend:
+        try:
+            vm_manager.set_backend(args.backend)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    if args.count < 1:
+        print("Error: --count must be at least 1.", file=sys.stderr)
+        return 1
+
+    if not vm_manager.vm_exists(SOURCE_VM_NAME):
+        print(
+            f"Error: The source VM '{SOURCE_VM_NAME}' does not exist.", file=sys.stderr
+        )
+        return 1
+
+    names = fleet_names(args.prefix, args.count, args.first_index)
+    existing = [name for name in names if vm_manager.vm_exists(name)]
+    if existing:
+        print(f"Error: These VMs already exist: {', '.join(existing)}", file=sys.stderr)
+        return 1
+
+    print(
+        f"\nCloning '{SOURCE_VM_NAME}' to {len(names)} VMs "
+        f"({names[0]} .. {names[-1]}) with up to {args.jobs} parallel jobs..."
+    )
+    started = time.perf_counter()
+    results = clone_fleet(names, args)
+    print_summary(results, time.perf_counter() - started)
+    ok = all(error is None for _, error, _ in results)
+
+    if args.wait_ready:
+        started_vms = [name for name, error, _ in results if error is None]
+        print(f"\nWaiting for {len(started_vms)} VMs to become ready...")
+        ready = readiness.wait_many(started_vms)
+        readiness.record_boot_times(ready)
+        for result in ready:
+            if result.ready:
+                boot = f"{result.boot_seconds:.1f}s" if result.boot_seconds else "-"
+                print(f"  {result.name:<30} ready   {result.ip:<15} {boot}")
+            else:
+                print(f"  {result.name:<30} NOT READY  {result.error}")
+        ok = ok and all(result.ready for result in ready)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
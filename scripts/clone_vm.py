@@ -4,18 +4,130 @@ A cross-platform script to clone the master Debian VM template.
 
 This script creates a new, configurable VM by cloning 'pi-master-template'.
 It assumes a simple, single Bridged Adapter network configuration.
+
+The clone itself is available as a function, clone(CloneRequest), which
+returns a CloneResult instead of printing errors and exit codes. The web app
+calls it directly; the command line below is a thin wrapper around it.
 """
 
 import argparse
 import subprocess
 import sys
-from scripts import vm_manager
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from scripts import backends, capacity, readiness, vm_manager
 
 # --- Configuration ---
 SOURCE_VM_NAME = "pi-master-template"
 
 
-def parse_arguments():
+@dataclass
+class CloneRequest:
+    """Everything needed to create one clone of the master template."""
+
+    name: str
+    ram: Optional[int] = None
+    cpus: Optional[int] = None
+    disk_size: Optional[int] = None
+    user: Optional[str] = None
+    password: Optional[str] = field(default=None, repr=False)
+    start: bool = False
+    linked: bool = False
+    dry_run: bool = False
+    source: str = SOURCE_VM_NAME
+    # See vm_manager.clone_vm(); lets parallel clones copy disks concurrently.
+    machine_folder: Optional[str] = None
+    # VirtualBox group ('/<tag>') for finding the clone later (scripts.vm_gc).
+    tag: Optional[str] = None
+
+
+@dataclass
+class CloneResult:
+    """The outcome of clone(); 'error' is None on success."""
+
+    name: str
+    error: Optional[str] = None
+    failed_command: Optional[str] = None
+    error_output: str = ""
+    duration: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def clone(request):
+    """
+    Clone the template as described by 'request' and return a CloneResult.
+    Progress messages go through vm_manager.log(), so callers can capture
+    them with vm_manager.capture_output().
+    """
+    started = time.perf_counter()
+    result = CloneResult(request.name)
+
+    if not vm_manager.vm_exists(request.source):
+        result.error = f"The source VM '{request.source}' does not exist."
+        return result
+    if vm_manager.vm_exists(request.name):
+        result.error = f"A VM with the name '{request.name}' already exists."
+        return result
+
+    vm_manager.log(f"\nCloning '{request.source}' to new VM '{request.name}'...")
+    try:
+        vm_manager.clone_vm(
+            source=request.source,
+            target=request.name,
+            ram=request.ram,
+            cpus=request.cpus,
+            disk_size=request.disk_size,
+            user=request.user,
+            password=request.password,
+            start_vm=request.start,
+            linked=request.linked,
+            machine_folder=request.machine_folder,
+            dry_run=request.dry_run,
+            tag=request.tag,
+        )
+    except subprocess.CalledProcessError as e:
+        result.error = "An error occurred while running a VBoxManage command."
+        result.failed_command = e.cmd
+        result.error_output = e.stderr or ""
+    except capacity.CapacityError as e:
+        result.error = f"The VM was created but not started. {e}"
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def report(request, result):
+    """Log the closing messages for a finished clone."""
+    log = vm_manager.log
+    if not result.ok:
+        if result.failed_command is None:
+            log(f"Error: {result.error}", error=True)
+            return
+        log("\n--- ERROR ---", error=True)
+        log(
+            f"An error occurred while running a VBoxManage command: "
+            f"{result.failed_command}",
+            error=True,
+        )
+        log(f"Error output:\n{result.error_output}", error=True)
+        return
+
+    if request.dry_run:
+        log("\nDry run complete. No changes were made.")
+        return
+
+    log("\nCloning complete!")
+    if request.start:
+        log(f"\nVM '{request.name}' is starting up...")
+    else:
+        log(f'\nYou can now start it by running: VBoxManage startvm "{request.name}"')
+
+
+def parse_arguments(argv=None):
     """Parses all command-line arguments using argparse."""
     parser = argparse.ArgumentParser(
         description="Clone the master Pi VM template with custom hardware and user settings.",
@@ -31,69 +143,88 @@ def parse_arguments():
     parser.add_argument("--user", type=str, help="The username for the default user.")
     parser.add_argument("--password", type=str, help="The password for the user.")
     parser.add_argument(
-        "--start", action="store_true", help="Automatically start the VM after cloning."
+        "--start",
+        action="store_true",
+        help="Automatically start the VM after cloning. The start waits until the\n"
+        "host has CPUs and memory to spare (see 'python -m scripts.capacity').",
+    )
+    parser.add_argument(
+        "--wait-ready",
+        action="store_true",
+        help="With --start, wait until the VM has booted and is ready to use\n"
+        "(see 'python -m scripts.readiness').",
+    )
+    parser.add_argument(
+        "--linked",
+        action="store_true",
+        help="Create a linked clone that shares the template's disk (copy-on-write).\n"
+        "A base snapshot of the template is created or reused automatically.",
+    )
+    parser.add_argument(
+        "--tag",
+        help="Put the VM in the VirtualBox group '/<tag>' (see 'python -m scripts.vm_gc').",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the VBoxManage commands that would be run, without running them.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(backends.BACKENDS),
+        help="How VBoxManage commands are executed (default: the PIVM_BACKEND\n"
+        "environment variable, or 'subprocess').",
     )
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.wait_ready and not args.start:
+        parser.error("--wait-ready requires --start")
+    return args
 
 
-def main():
+def main(argv=None):
     """Main execution function."""
+    # Arguments first, so '--help' and usage errors need no VirtualBox.
+    args = parse_arguments(argv)
     if not vm_manager.setup_environment():
         return 1
 
-    args = parse_arguments()
+    if args.backend:
+        try:
+            vm_manager.set_backend(args.backend)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
 
     if args.password:
         print("\n*** SECURITY WARNING ***")
         print("You have provided a password on the command line.")
         print("This can be saved in your shell history in plain text.\n")
 
-    if not vm_manager.vm_exists(SOURCE_VM_NAME):
-        print(
-            f"Error: The source VM '{SOURCE_VM_NAME}' does not exist.", file=sys.stderr
-        )
-        return 1
-
-    if vm_manager.vm_exists(args.name):
-        print(
-            f"Error: A VM with the name '{args.name}' already exists.", file=sys.stderr
-        )
+    request = CloneRequest(
+        name=args.name,
+        ram=args.ram,
+        cpus=args.cpus,
+        disk_size=args.disk_size,
+        user=args.user,
+        password=args.password,
+        start=args.start,
+        linked=args.linked,
+        dry_run=args.dry_run,
+        tag=args.tag,
+    )
+    result = clone(request)
+    report(request, result)
+    if not result.ok:
         return 1
 
-    print(f"\nCloning '{SOURCE_VM_NAME}' to new VM '{args.name}'...")
-
-    try:
-        # The call to clone_vm is now simpler in its meaning, though the code is the same
-        vm_manager.clone_vm(
-            source=SOURCE_VM_NAME,
-            target=args.name,
-            ram=args.ram,
-            cpus=args.cpus,
-            disk_size=args.disk_size,
-            user=args.user,
-            password=args.password,
-            start_vm=args.start,
-        )
-
-        print("\nCloning complete!")
-        # ... (Success messages are the same) ...
-
-        if args.start:
-            print(f"\nVM '{args.name}' is starting up...")
-        else:
-            print(
-                f'\nYou can now start it by running: VBoxManage startvm "{args.name}"'
-            )
-        return 0
-
-    except subprocess.CalledProcessError as e:
-        print("\n--- ERROR ---", file=sys.stderr)
-        print(
-            f"An error occurred while running a VBoxManage command: {e.cmd}",
-            file=sys.stderr,
-        )
-        print(f"Error output:\n{e.stderr}", file=sys.stderr)
-        return 1
+    if args.wait_ready and not args.dry_run:
+        ready = readiness.wait_ready(request.name)
+        readiness.record_boot_times([ready])
+        if not ready.ready:
+            print(f"Error: {ready.error}", file=sys.stderr)
+            return 1
+        print(f"VM '{request.name}' is ready at {ready.ip}.")
+    return 0
 
 
 if __name__ == "__main__":
@@ -3,12 +3,15 @@
 A cross-platform script to create a master Debian VM template in VirtualBox.
 This script creates a VM with a single, discoverable Bridged Network Adapter.
 """
-import hashlib
+import argparse
 import os
 import re
 import sys
-import requests
-from scripts import vm_manager
+from scripts import artifact_cache, vm_manager
+
+# 'requests' and 'scripts.download' (which imports requests) are imported
+# where they are used: they add ~0.1s to every start, including '--help'
+# and the early exits when VirtualBox is missing or the VM already exists.
 
 # --- Configuration (remains the same) ---
 ISO_DIR = "isos"
@@ -17,10 +20,14 @@ VM_DISK = f"{VM_NAME}.vdi"
 VM_RAM_MB = 1024
 VM_CPUS = 1
 STABLE_RELEASE_URL = "https://cdimage.debian.org/debian-cd/current/amd64/iso-cd/"
+# Number of parallel connections used to download the ISO.
+DOWNLOAD_SEGMENTS = 4
 
 
 def get_latest_iso_info():
     # ... (this function is complete and correct)
+    import requests
+
     print(f"Checking for latest Debian release at: {STABLE_RELEASE_URL}")
     try:
         response = requests.get(STABLE_RELEASE_URL, timeout=30)
@@ -52,48 +59,58 @@ def get_latest_iso_info():
 
 
 def verify_and_download_iso(iso_filename, iso_url, iso_sha256):
-    # ... (this function is complete and correct)
+    """
+    Return the path of a verified copy of the ISO, downloading it if needed.
+    An interrupted download is resumed from its '.part' file on the next run.
+    An ISO that was verified before (and has not changed since) is not hashed
+    again.
+    """
+    from scripts import download
+
     iso_path = os.path.join(ISO_DIR, iso_filename)
     os.makedirs(ISO_DIR, exist_ok=True)
     if os.path.exists(iso_path):
         print("Verifying checksum of existing ISO...")
-        sha256_hash = hashlib.sha256()
-        with open(iso_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        if sha256_hash.hexdigest() == iso_sha256:
+        if download.verify_file(iso_path, iso_sha256):
             print("Checksum OK. ISO is ready.")
             return iso_path
         print("Checksum mismatch. Deleting corrupted file and re-downloading.")
         os.remove(iso_path)
-    print(f"Downloading {iso_filename}...")
+
+    cache = artifact_cache.ArtifactCache()
+    if cache.fetch(iso_sha256, iso_path):
+        # Artifacts are verified when they enter the cache.
+        download.record_verification(iso_path, iso_sha256)
+        print(f"Using the cached copy from {cache.root}. ISO is ready.")
+        return iso_path
+
+    reporter = download.ProgressReporter()
+    print(f"Downloading {iso_filename}...", file=reporter.text_stream)
     try:
-        with requests.get(iso_url, stream=True, timeout=60) as r:
-            r.raise_for_status()
-            total_size = int(r.headers.get("content-length", 0))
-            block_size = 8192
-            downloaded_size = 0
-            with open(iso_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=block_size):
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    if total_size > 0:
-                        done = int(50 * downloaded_size / total_size)
-                        progress = (
-                            f"\r[{'=' * done}{' ' * (50 - done)}] "
-                            f"{downloaded_size / (1024*1024):.2f}MB / "
-                            f"{total_size / (1024*1024):.2f}MB"
-                        )
-                        print(progress, end="")
-            print("\nDownload complete.")
-        return verify_and_download_iso(iso_filename, iso_url, iso_sha256)
-    except requests.exceptions.RequestException as e:
-        print(f"\nError downloading file: {e}", file=sys.stderr)
+        download.download_file(
+            iso_url,
+            iso_path,
+            sha256=iso_sha256,
+            segments=DOWNLOAD_SEGMENTS,
+            progress=reporter.track(iso_filename),
+            log=reporter.notice,
+        )
+    except download.DownloadError as e:
+        reporter.finish()
+        print(f"Error downloading file: {e}", file=sys.stderr)
         return None
+    reporter.finish()
+    print("Download complete. Checksum OK. ISO is ready.", file=reporter.text_stream)
+    try:
+        cache.insert(iso_path, iso_sha256, verified=True)
+    except (OSError, ValueError) as e:
+        print(f"Warning: could not add the ISO to the cache: {e}", file=sys.stderr)
+    return iso_path
 
 
-def main():
+def main(argv=None):
     """Main execution function."""
+    argparse.ArgumentParser(description=__doc__.strip()).parse_args(argv)
     if not vm_manager.setup_environment():
         return 1
 
@@ -184,6 +201,77 @@ EOF
 sudo chmod +x /usr/local/bin/pivm-info-writer.sh
 sudo systemctl enable pivm-info.service
 
+# Create the readiness reporter; it runs at the end of every boot and tells
+# the host (scripts/readiness.py) that the VM is ready. TRANSIENT properties
+# are cleared by VirtualBox when the VM powers off; the service clears the
+# property itself when the guest shuts down or reboots.
+sudo tee /usr/local/bin/pivm-ready.sh > /dev/null << EOF
+#!/bin/bash
+VBoxControl guestproperty set /PiSelfhosting/Ready "\\$(cut -d' ' -f1 /proc/uptime)" --flags TRANSIENT
+EOF
+
+sudo tee /etc/systemd/system/pivm-ready.service > /dev/null << EOF
+[Unit]
+Description=Pi-Server-VM Boot Readiness Reporter
+After=vboxadd-service.service pivm-info.service avahi-daemon.service network-online.target
+Wants=network-online.target
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart=/usr/local/bin/pivm-ready.sh
+ExecStop=/usr/bin/VBoxControl guestproperty delete /PiSelfhosting/Ready
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo chmod +x /usr/local/bin/pivm-ready.sh
+sudo systemctl enable pivm-ready.service
+
+# Create the identity service; it applies a new hostname and user to the
+# running VM whenever the host asks for it (scripts/pool.py does so when it
+# hands out a pre-booted VM) and confirms it in /PiSelfhosting/Identity.
+sudo tee /usr/local/bin/pivm-identity.sh > /dev/null << 'EOF'
+#!/bin/bash
+get() { VBoxControl --nologo guestproperty get "$1" | sed -n 's/^Value: //p'; }
+TRIGGER=/PiSelfhosting/Reidentify
+while true; do
+    TOKEN=$(get $TRIGGER)
+    if [ -n "$TOKEN" ] && [ "$TOKEN" != "$(get /PiSelfhosting/Identity)" ]; then
+        NEW_HOSTNAME=$(get /VirtualBox/GuestAdd/hostname)
+        NEW_USER=$(get /VirtualBox/GuestAdd/user)
+        NEW_PASSWORD=$(get /VirtualBox/GuestAdd/password)
+        INFO=$(get /VirtualBox/GuestAdd/PiSelfhostingInfo)
+        if [ -n "$NEW_HOSTNAME" ] && [ "$NEW_HOSTNAME" != "$(hostname)" ]; then
+            sed -i "s/\\b$(hostname)\\b/$NEW_HOSTNAME/g" /etc/hosts
+            hostnamectl set-hostname "$NEW_HOSTNAME"
+            systemctl restart avahi-daemon
+        fi
+        if [ -n "$NEW_USER" ]; then
+            id "$NEW_USER" > /dev/null 2>&1 || useradd -m -s /bin/bash -G sudo "$NEW_USER"
+            [ -n "$NEW_PASSWORD" ] && echo "$NEW_USER:$NEW_PASSWORD" | chpasswd
+        fi
+        [ -n "$INFO" ] && echo "$INFO" > /etc/piselfhosting-virtual-pi-server
+        VBoxControl guestproperty delete /VirtualBox/GuestAdd/password
+        VBoxControl guestproperty set /PiSelfhosting/Identity "$TOKEN" --flags TRANSIENT
+    fi
+    VBoxControl --nologo guestproperty wait "$TRIGGER" > /dev/null 2>&1 || sleep 5
+done
+EOF
+
+sudo tee /etc/systemd/system/pivm-identity.service > /dev/null << EOF
+[Unit]
+Description=Pi-Server-VM Identity Watcher
+After=vboxadd-service.service pivm-info.service
+[Service]
+ExecStart=/usr/local/bin/pivm-identity.sh
+Restart=always
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo chmod +x /usr/local/bin/pivm-identity.sh
+sudo systemctl enable pivm-identity.service
+
 # Final cleanup and shutdown
 echo "Template configuration complete. Shutting down."
 sudo shutdown now
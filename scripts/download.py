@@ -0,0 +1,573 @@
+# scripts/download.py
+"""
+A resumable HTTP downloader for large files such as installer ISOs.
+
+Data is written to '<file>.part' and only renamed into place once the
+download is complete and its checksum has been verified. An interrupted
+download is resumed with a 'Range' request instead of starting over, and
+when the server supports ranges the file can be fetched as several
+segments over parallel connections.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+# --- Configuration ---
+CHUNK_SIZE = 1024 * 1024  # Bytes per read from the network and per write.
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024  # Smaller files are not worth splitting.
+RETRIES = 5
+TIMEOUT = 60
+PROGRESS_INTERVAL = 0.1  # Seconds between progress updates (10 Hz).
+PROGRESS_ENV_VAR = "PIVM_PROGRESS"
+
+# Errors after which a download is resumed from where it stopped. The body
+# is read from urllib3 directly, so its errors are not wrapped by requests.
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.HTTPError,
+)
+
+
+class DownloadError(Exception):
+    """Raised when a file could not be downloaded or failed verification."""
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file."""
+    sha256_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            sha256_hash.update(block)
+    return sha256_hash.hexdigest()
+
+
+def _record_path(path):
+    return f"{path}.verified.json"
+
+
+def record_verification(path, digest):
+    """Remember the digest of a file together with its size and mtime."""
+    stat = os.stat(path)
+    record = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+    with open(_record_path(path), "w") as f:
+        json.dump(record, f)
+
+
+def recorded_sha256(path):
+    """Return the recorded digest of a file, or None if it changed since."""
+    try:
+        with open(_record_path(path)) as f:
+            record = json.load(f)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if (record.get("size"), record.get("mtime_ns")) != (
+        stat.st_size,
+        stat.st_mtime_ns,
+    ):
+        return None
+    return record.get("sha256")
+
+
+def verify_file(path, sha256):
+    """
+    Return True if the file has the given SHA-256. A matching verification
+    record is trusted; otherwise the file is hashed and the result recorded.
+    """
+    digest = recorded_sha256(path)
+    if digest is None:
+        digest = file_sha256(path)
+        record_verification(path, digest)
+    return digest == sha256.lower()
+
+
+def probe(session, url):
+    """Return (size, accepts_ranges) for a URL; size is None if unknown."""
+    response = session.head(url, allow_redirects=True, timeout=TIMEOUT)
+    response.raise_for_status()
+    size = response.headers.get("Content-Length")
+    accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return (int(size) if size is not None else None), accepts_ranges
+
+
+class ProgressReporter:
+    """
+    Throttled progress output for one or more concurrent downloads.
+
+    Modes: 'bar' draws one console line with the rate and ETA, 'json' writes
+    one JSON object per line for machine consumers (messages included, as
+    'message' events), and 'quiet' writes no progress. Updates are limited
+    to one per 'interval' seconds, plus one whenever a download completes.
+    PIVM_PROGRESS sets the default mode.
+    """
+
+    MODES = ("bar", "quiet", "json")
+
+    def __init__(self, mode=None, interval=PROGRESS_INTERVAL, stream=None, clock=None):
+        self.mode = mode or os.environ.get(PROGRESS_ENV_VAR, "bar")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown progress mode '{self.mode}'.")
+        self.interval = interval
+        self._stream = stream
+        self._clock = clock or time.monotonic
+        self._started = self._clock()
+        self._last = None
+        self._items = {}  # name -> [baseline, done, total]
+        self._width = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stream(self):
+        return self._stream or sys.stdout
+
+    @property
+    def text_stream(self):
+        """Where callers print other text: stderr in 'json' mode, else stdout."""
+        return sys.stderr if self.mode == "json" else sys.stdout
+
+    def track(self, name):
+        """Return a progress(done, total) callback for one download."""
+        return lambda done, total: self.update(name, done, total)
+
+    def update(self, name, done, total):
+        """
+        Record progress for 'name'. The first update for a name marks where
+        it started (resumed bytes), which is left out of the rate and ETA.
+        """
+        with self._lock:
+            item = self._items.setdefault(name, [done, done, total])
+            item[1:] = [done, total]
+            now = self._clock()
+            completed = total is not None and done >= total
+            if (
+                self._last is not None
+                and now - self._last < self.interval
+                and not completed
+            ):
+                return
+            self._last = now
+            self._emit(now)
+
+    def _totals(self, now):
+        done = sum(item[1] for item in self._items.values())
+        fresh = done - sum(item[0] for item in self._items.values())
+        totals = [item[2] for item in self._items.values()]
+        total = sum(totals) if None not in totals else None
+        elapsed = now - self._started
+        rate = fresh / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if total is not None and rate > 0 else None
+        return done, total, rate, eta
+
+    def _emit(self, now):
+        if self.mode == "quiet":
+            return
+        done, total, rate, eta = self._totals(now)
+        if self.mode == "json":
+            record = {
+                "event": "progress",
+                "done": done,
+                "total": total,
+                "rate": round(rate, 1),
+                "eta": None if eta is None else round(eta, 1),
+                "files": {
+                    name: {"done": item[1], "total": item[2]}
+                    for name, item in self._items.items()
+                },
+            }
+            self.stream.write(json.dumps(record) + "\n")
+            self.stream.flush()
+            return
+        mb = 1024 * 1024
+        line = f"{done / mb:.1f}"
+        if total:
+            filled = int(30 * done / total)
+            line = f"[{'=' * filled}{' ' * (30 - filled)}] {line}/{total / mb:.1f}"
+        line += f" MB  {rate / mb:.2f} MB/s"
+        if eta is not None:
+            line += f"  ETA {int(eta) // 60}:{int(eta) % 60:02d}"
+        if len(self._items) > 1:
+            line = f"{len(self._items)} files {line}"
+        self._write_line(line)
+
+    def _write_line(self, line):
+        self.stream.write("\r" + line.ljust(self._width))
+        self.stream.flush()
+        self._width = len(line)
+
+    def message(self, text):
+        """Print a line of text without garbling the progress bar."""
+        with self._lock:
+            if self.mode == "json":
+                record = {"event": "message", "text": text}
+                self.stream.write(json.dumps(record) + "\n")
+            elif self.mode == "bar" and self._width:
+                self._write_line(text)
+                self.stream.write("\n")
+                self._width = 0
+                self._emit(self._clock())
+            else:
+                self.stream.write(text + "\n")
+            self.stream.flush()
+
+    def notice(self, text):
+        """Report a download's status, such as a resume; a message() unless quiet."""
+        if self.mode != "quiet":
+            self.message(text)
+
+    def finish(self):
+        """Emit a final update and end the progress output."""
+        with self._lock:
+            if not self._items:
+                return
+            self._emit(self._clock())
+            if self.mode == "bar":
+                self.stream.write("\n")
+                self._width = 0
+            elif self.mode == "json":
+                self.stream.write(json.dumps({"event": "done"}) + "\n")
+            self.stream.flush()
+
+
+class _Progress:
+    """Thread-safe byte counter that forwards updates to a callback."""
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.done = 0
+        self._callback = callback
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        with self._lock:
+            self.done += count
+            if self._callback:
+                self._callback(self.done, self.total)
+
+
+class _StreamHasher:
+    """
+    Computes the SHA-256 of a file while it is being written.
+
+    Bytes written at the hash position are hashed straight from memory.
+    Segments further ahead are written out of order; once the hash position
+    reaches them, the bytes that already arrived are read back (usually from
+    the page cache) while the rest of the download is still running, so no
+    extra pass over the file is needed when the download finishes.
+    """
+
+    def __init__(self, path, written_until):
+        self.path = path
+        self.position = 0
+        self._sha256 = hashlib.sha256()
+        # written_until(offset) -> end of the bytes already on disk from 'offset'.
+        self._written_until = written_until
+        self._lock = threading.Lock()
+
+    def feed(self, offset, data):
+        """Hash 'data', which was just written at 'offset' (and flushed)."""
+        with self._lock:
+            if offset == self.position:
+                self._sha256.update(data)
+                self.position += len(data)
+            self._catch_up()
+
+    def _catch_up(self):
+        # Finished segments end where the next one starts, so keep going
+        # until no more bytes are on disk at the hash position.
+        end = self._written_until(self.position)
+        while end > self.position:
+            with open(self.path, "rb") as f:
+                f.seek(self.position)
+                while self.position < end:
+                    block = f.read(min(CHUNK_SIZE, end - self.position))
+                    if not block:
+                        return
+                    self._sha256.update(block)
+                    self.position += len(block)
+            end = self._written_until(self.position)
+
+    def hexdigest(self):
+        """Return the digest of everything written so far."""
+        with self._lock:
+            self._catch_up()
+            return self._sha256.hexdigest()
+
+
+def _fetch_range(
+    session,
+    url,
+    path,
+    start,
+    end,
+    progress,
+    on_write=None,
+    chunk_size=CHUNK_SIZE,
+    log=print,
+):
+    """
+    Write bytes start..end (inclusive; end=None means to the end of the file)
+    of 'url' into 'path' at the same offset, retrying from the last byte
+    written after a dropped connection. 'on_write(offset, data)' is called
+    after every chunk. Returns the number of bytes written.
+    """
+    position = start
+    attempts = 0
+    while end is None or position <= end:
+        headers = {"Range": f"bytes={position}-{'' if end is None else end}"}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    if position != 0:
+                        raise DownloadError(f"Server ignored the range request: {url}")
+                    # The whole file is coming; that is fine when starting at 0.
+                # One buffer per transfer: the body is read into it and
+                # written from it, without a new bytes object per chunk.
+                # The file is unbuffered, so the hasher can read it back.
+                buffer = memoryview(bytearray(chunk_size))
+                r.raw.decode_content = True
+                with open(path, "r+b", buffering=0) as f:
+                    f.seek(position)
+                    while True:
+                        count = r.raw.readinto(buffer)
+                        if not count:
+                            break
+                        data = buffer[:count]
+                        view = data
+                        while view:  # Raw writes may be partial.
+                            view = view[f.write(view) :]
+                        if on_write:
+                            on_write(position, data)
+                        position += count
+                        progress.add(count)
+            if end is None:
+                break
+            if position <= end:
+                raise requests.exceptions.ChunkedEncodingError("Response ended early.")
+        except RETRYABLE_ERRORS as e:
+            attempts += 1
+            if attempts > RETRIES:
+                raise DownloadError(f"Download of {url} failed: {e}") from e
+            log(f"Connection lost ({e}); resuming at byte {position}...")
+    return position - start
+
+
+class _SegmentState:
+    """
+    The progress of a segmented download, saved next to the '.part' file so
+    that every segment can be resumed after an interruption.
+    """
+
+    SAVE_INTERVAL = 1.0  # Seconds between saves while downloading.
+
+    def __init__(self, path, size, count):
+        self.path = path
+        self.size = size
+        self.segments = self._load() or self._split(size, count)
+        self._lock = threading.Lock()
+        self._saved = 0.0
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return state["segments"] if state.get("size") == self.size else None
+
+    @staticmethod
+    def _split(size, count):
+        # Each segment is [first byte, last byte, next byte to download].
+        step = -(-size // count)
+        return [
+            [start, min(start + step, size) - 1, start]
+            for start in range(0, size, step)
+        ]
+
+    @property
+    def downloaded(self):
+        return sum(position - start for start, _, position in self.segments)
+
+    def written_until(self, offset):
+        for start, end, position in self.segments:
+            if start <= offset <= end:
+                return position
+        return offset
+
+    def update(self, index, position):
+        with self._lock:
+            self.segments[index][2] = position
+            due = time.monotonic() - self._saved >= self.SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"size": self.size, "segments": self.segments})
+            self._saved = time.monotonic()
+        with open(self.path, "w") as f:
+            f.write(data)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _download_single(
+    session, url, part_path, size, accepts_ranges, progress, chunk_size, log
+):
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if not accepts_ranges or (size is not None and offset > size):
+        offset = 0
+    with open(part_path, "a+b") as f:
+        f.truncate(offset)
+    if offset:
+        log(f"Resuming download at {offset / (1024 * 1024):.2f}MB.")
+    progress.add(offset)  # Also reports the start of a fresh download.
+
+    # The bytes of an earlier run are hashed once, then everything inline.
+    written = [offset]
+    hasher = _StreamHasher(part_path, lambda _: written[0])
+
+    def on_write(position, data):
+        written[0] = position + len(data)
+        hasher.feed(position, data)
+
+    if size is None or offset < size:
+        _fetch_range(
+            session, url, part_path, offset, None, progress, on_write, chunk_size, log
+        )
+    return hasher.hexdigest()
+
+
+def _download_segmented(
+    session, url, part_path, size, count, progress, chunk_size, log
+):
+    state = _SegmentState(f"{part_path}.json", size, count)
+    if not os.path.exists(part_path):
+        state.segments = state._split(size, count)
+    # Saved before any data arrives, so that a pre-allocated '.part' file is
+    # never mistaken for a complete single-stream download.
+    state.save()
+    with open(part_path, "a+b") as f:
+        f.truncate(size)
+    if state.downloaded:
+        log(f"Resuming download at {state.downloaded / (1024 * 1024):.2f}MB.")
+    progress.add(state.downloaded)  # Also reports the start of a fresh download.
+
+    hasher = _StreamHasher(part_path, state.written_until)
+
+    def fetch(index):
+        start, end, position = state.segments[index]
+
+        def on_write(offset, data):
+            state.update(index, offset + len(data))
+            hasher.feed(offset, data)
+
+        if position <= end:
+            _fetch_range(
+                session,
+                url,
+                part_path,
+                position,
+                end,
+                progress,
+                on_write,
+                chunk_size,
+                log,
+            )
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(state.segments)) as executor:
+            futures = [executor.submit(fetch, i) for i in range(len(state.segments))]
+            for future in futures:
+                future.result()
+    finally:
+        state.save()
+    state.remove()
+    return hasher.hexdigest()
+
+
+def download_file(
+    url,
+    path,
+    sha256=None,
+    segments=1,
+    progress=None,
+    session=None,
+    chunk_size=CHUNK_SIZE,
+    log=print,
+):
+    """
+    Download 'url' to 'path', resuming a previous partial download.
+
+    With 'segments' > 1 the file is fetched as that many byte ranges in
+    parallel (if the server supports ranges and the file is large enough).
+    The SHA-256 is computed while the data arrives. If 'sha256' is given,
+    the file is verified before it is moved into place; on a mismatch the
+    partial file is removed and DownloadError is raised. The digest is
+    recorded with record_verification(). 'progress' is called as
+    progress(bytes_done, total_bytes) and 'log(text)' with status messages
+    such as resumes (e.g. ProgressReporter.notice). Pass a shared 'session'
+    to reuse pooled connections across downloads.
+    """
+    session = session or requests.Session()
+    part_path = f"{path}.part"
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        size, accepts_ranges = probe(session, url)
+    except requests.exceptions.RequestException as e:
+        raise DownloadError(f"Could not reach {url}: {e}") from e
+
+    tracker = _Progress(size, progress)
+    segmented = accepts_ranges and min(segments, (size or 0) // MIN_SEGMENT_SIZE) > 1
+    state_path = f"{part_path}.json"
+    if not segmented and os.path.exists(state_path):
+        # Left over from a segmented download; its '.part' file has gaps.
+        os.remove(state_path)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    try:
+        if segmented:
+            segments = min(segments, size // MIN_SEGMENT_SIZE)
+            digest = _download_segmented(
+                session, url, part_path, size, segments, tracker, chunk_size, log
+            )
+        else:
+            digest = _download_single(
+                session,
+                url,
+                part_path,
+                size,
+                accepts_ranges,
+                tracker,
+                chunk_size,
+                log,
+            )
+    except requests.exceptions.RequestException as e:
+        raise DownloadError(f"Download of {url} failed: {e}") from e
+
+    if size is not None and os.path.getsize(part_path) != size:
+        raise DownloadError(
+            f"Download of {url} is incomplete: expected {size} bytes, "
+            f"got {os.path.getsize(part_path)}."
+        )
+    if sha256 and digest != sha256.lower():
+        os.remove(part_path)
+        raise DownloadError(f"Checksum mismatch for {url}; the download was removed.")
+    os.replace(part_path, path)
+    record_verification(path, digest)
+    return path
@@ -0,0 +1,175 @@
+# scripts/inventory.py
+"""
+A cached inventory of the VMs registered in VirtualBox.
+
+Instead of running 'VBoxManage list vms' for every existence check, the list
+is read once into an index (name -> UUID -> state) and reused until it is
+older than the TTL or one of our own operations (create, clone, delete)
+invalidates it. Lookups in the index are O(1).
+
+Usage:
+  python -m scripts.inventory [--running] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+# --- Configuration ---
+TTL_ENV_VAR = "PIVM_INVENTORY_TTL"
+DEFAULT_TTL = 5.0
+
+RUNNING = "running"
+STOPPED = "stopped"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class VMRecord:
+    """One registered VM."""
+
+    name: str
+    uuid: str
+    state: str
+
+
+def parse_vm_list(output):
+    """Parse 'VBoxManage list vms' output into (name, uuid) pairs."""
+    vms = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith('"') or not line.endswith("}"):
+            continue
+        name, _, uuid = line[1:].rpartition('" {')
+        vms.append((name, uuid[:-1]))
+    return vms
+
+
+class Inventory:
+    """A point-in-time index of the registered VMs."""
+
+    def __init__(self, vms, running_uuids=None, query=None, created=None):
+        self.created = time.monotonic() if created is None else created
+        self._uuid_by_name = {name: uuid for name, uuid in vms}
+        self._name_by_uuid = {uuid: name for name, uuid in vms}
+        self._running = running_uuids
+        self._query = query
+        self._lock = threading.Lock()
+
+    @property
+    def age(self):
+        """Seconds since the inventory was read from VirtualBox."""
+        return time.monotonic() - self.created
+
+    def __len__(self):
+        return len(self._uuid_by_name)
+
+    def __contains__(self, name):
+        return name in self._uuid_by_name
+
+    def exists(self, name):
+        """Return True if a VM with this name is registered."""
+        return name in self._uuid_by_name
+
+    def names(self):
+        """Return the names of all registered VMs, sorted."""
+        return sorted(self._uuid_by_name)
+
+    def uuid(self, name):
+        """Return the UUID of a VM, or None if it does not exist."""
+        return self._uuid_by_name.get(name)
+
+    def _running_uuids(self):
+        # 'list runningvms' is only needed for state questions, so it is read
+        # on first use (once per inventory snapshot).
+        with self._lock:
+            if self._running is None:
+                output = self._query(["list", "runningvms"]) if self._query else ""
+                self._running = {uuid for _, uuid in parse_vm_list(output)}
+            return self._running
+
+    def state(self, name_or_uuid):
+        """Return RUNNING or STOPPED for a VM, or None if it does not exist."""
+        uuid = self._uuid_by_name.get(name_or_uuid, name_or_uuid)
+        if uuid not in self._name_by_uuid:
+            return None
+        return RUNNING if uuid in self._running_uuids() else STOPPED
+
+    def get(self, name_or_uuid):
+        """Return the VMRecord for a VM name or UUID, or None."""
+        uuid = self._uuid_by_name.get(name_or_uuid, name_or_uuid)
+        name = self._name_by_uuid.get(uuid)
+        if name is None:
+            return None
+        return VMRecord(name, uuid, self.state(uuid))
+
+    def records(self, running_only=False):
+        """Return VMRecords for all VMs, sorted by name."""
+        records = [self.get(self._uuid_by_name[name]) for name in self.names()]
+        if running_only:
+            records = [r for r in records if r.state == RUNNING]
+        return records
+
+
+def load():
+    """Read a fresh inventory from VirtualBox."""
+    from scripts import vm_manager
+
+    query = vm_manager.query
+    return Inventory(parse_vm_list(query(["list", "vms"], check=False)), query=query)
+
+
+def get_ttl():
+    """Return the inventory TTL in seconds (PIVM_INVENTORY_TTL overrides it)."""
+    try:
+        return float(os.environ.get(TTL_ENV_VAR, DEFAULT_TTL))
+    except ValueError:
+        return DEFAULT_TTL
+
+
+def get_inventory(max_age=None):
+    """Return the cached inventory, reloading it if it is older than 'max_age'."""
+    global _cache
+    max_age = get_ttl() if max_age is None else max_age
+    with _cache_lock:
+        if _cache is None or _cache.age > max_age:
+            _cache = load()
+        return _cache
+
+
+def invalidate():
+    """Forget the cached inventory; call this after creating or deleting VMs."""
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+
+def main(argv=None):
+    """Print the registered VMs."""
+    parser = argparse.ArgumentParser(description="List the VMs known to VirtualBox.")
+    parser.add_argument("--running", action="store_true", help="Only list running VMs.")
+    parser.add_argument("--json", action="store_true", help="Print JSON output.")
+    args = parser.parse_args(argv)
+
+    from scripts import vm_manager
+
+    if not vm_manager.setup_environment():
+        return 1
+
+    records = get_inventory().records(running_only=args.running)
+    if args.json:
+        print(json.dumps([asdict(record) for record in records], indent=2))
+    else:
+        for record in records:
+            print(f"{record.name:<30} {record.state:<8} {record.uuid}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+# scripts/pool.py
+"""
+A pool of pre-cloned, pre-booted VMs.
+
+Cloning, the first boot and the guest's first-boot services take a while
+before a VM is usable. A WarmPool keeps 'size' clones of the master template
+booted and idle, hands one out on request and replaces it in the background.
+
+Pool members are named '<prefix><random id>' and marked with the guest
+property /PiSelfhosting/Pool ('idle', or 'claimed:<hostname>' once handed
+out), so a new pool adopts the idle members an earlier one left running.
+Claims are serialized with a file lock, so two processes sharing a pool
+never hand out the same VM.
+
+VirtualBox cannot rename a running VM: a claimed VM keeps its pool name.
+Its new hostname and user are applied inside the running guest by the
+template's 'pivm-identity' service (see create_master_vm); a claim fails if
+the guest does not confirm them within IDENTITY_TIMEOUT seconds.
+
+Usage:
+  python -m scripts.pool fill [--size N]
+  python -m scripts.pool claim <hostname> [--user U] [--password P] [--size N]
+  python -m scripts.pool status
+"""
+
+import argparse
+import contextlib
+import contextvars
+import getpass
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from scripts import inventory, readiness, vm_manager
+from scripts.clone_vm import SOURCE_VM_NAME
+
+# --- Configuration ---
+DEFAULT_PREFIX = "pivm-pool-"
+DEFAULT_SIZE = 2
+DEFAULT_JOBS = 2  # Pool members warmed at the same time.
+POOL_PROPERTY = "/PiSelfhosting/Pool"
+IDLE = "idle"
+CLAIMED = "claimed:"
+READY_TIMEOUT = 300.0
+IDENTITY_TIMEOUT = 60.0
+
+
+@dataclass
+class Lease:
+    """A VM handed out by the pool."""
+
+    vm: str
+    hostname: str
+    hit: bool  # An idle VM was ready; otherwise the caller waited for one.
+    waited: float
+
+
+@dataclass
+class PoolStats:
+    """Hit/miss counts and timings of a pool."""
+
+    hits: int = 0
+    misses: int = 0
+    wait_times: list = field(default_factory=list)
+    warm_times: list = field(default_factory=list)
+    warm_failures: int = 0
+
+    def to_dict(self):
+        claims = self.hits + self.misses
+        waits, warms = self.wait_times, self.warm_times
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / claims, 3) if claims else None,
+            "wait_avg": round(sum(waits) / len(waits), 3) if waits else None,
+            "wait_max": round(max(waits), 3) if waits else None,
+            "warmed": len(warms),
+            "warm_avg": round(sum(warms) / len(warms), 3) if warms else None,
+            "warm_failures": self.warm_failures,
+        }
+
+
+def wait_until_ready(name, timeout=READY_TIMEOUT):
+    """Wait until a booted member is usable (see scripts.readiness)."""
+    result = readiness.wait_ready(name, timeout)
+    if not result.ready:
+        raise TimeoutError(result.error)
+    return result
+
+
+@contextlib.contextmanager
+def claim_lock(prefix):
+    """Hold an exclusive lock on the pool 'prefix', shared by all processes."""
+    path = os.path.join(
+        tempfile.gettempdir(), f"{prefix}claim-{getpass.getuser()}.lock"
+    )
+    with open(path, "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class WarmPool:
+    """Keeps 'size' booted clones idle and hands them out."""
+
+    def __init__(
+        self,
+        size=DEFAULT_SIZE,
+        source=SOURCE_VM_NAME,
+        prefix=DEFAULT_PREFIX,
+        ram=None,
+        cpus=None,
+        linked=True,
+        jobs=DEFAULT_JOBS,
+        ready=wait_until_ready,
+    ):
+        self.size = size
+        self.source = source
+        self.prefix = prefix
+        self.ram = ram
+        self.cpus = cpus
+        self.linked = linked
+        # Called with a VM name; returns once the guest is usable.
+        self._ready = ready
+        self.stats = PoolStats()
+        self._idle = deque()
+        self._warming = 0
+        self._last_error: Optional[str] = None
+        self._changed = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, jobs))
+        self._machine_folder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def idle(self):
+        """Names of the idle members, oldest first."""
+        with self._changed:
+            return list(self._idle)
+
+    @property
+    def warming(self):
+        with self._changed:
+            return self._warming
+
+    def adopt(self):
+        """Take over the idle members left running by an earlier pool."""
+        snapshot = inventory.get_inventory()
+        adopted = 0
+        for record in snapshot.records(running_only=True):
+            if not record.name.startswith(self.prefix):
+                continue
+            if vm_manager.get_guest_property(record.name, POOL_PROPERTY) != IDLE:
+                continue
+            with self._changed:
+                if record.name not in self._idle:
+                    self._idle.append(record.name)
+                    adopted += 1
+                    self._changed.notify_all()
+        return adopted
+
+    def refill(self):
+        """Start warming VMs until idle and warming ones add up to 'size'."""
+        with self._changed:
+            return self._refill()
+
+    def _refill(self):
+        missing = self.size - len(self._idle) - self._warming
+        self._warming += max(0, missing)
+        context = contextvars.copy_context()
+        return [
+            self._executor.submit(context.copy().run, self._warm)
+            for _ in range(missing)
+        ]
+
+    def fill(self, timeout=None):
+        """Refill and wait for the new members; returns the number warmed."""
+        futures = self.refill()
+        done, _ = wait(futures, timeout=timeout)
+        return sum(1 for future in done if future.result())
+
+    def _warm(self):
+        """Clone, boot and wait for one new member. Returns its name or None."""
+        name = f"{self.prefix}{uuid.uuid4().hex[:8]}"
+        started = time.perf_counter()
+        try:
+            if self._machine_folder is None:
+                self._machine_folder = vm_manager.get_default_machine_folder()
+            vm_manager.clone_vm(
+                source=self.source,
+                target=name,
+                ram=self.ram,
+                cpus=self.cpus,
+                start_vm=True,
+                linked=self.linked,
+                machine_folder=self._machine_folder,
+            )
+            self._ready(name)
+            # Marked last, so only usable VMs are ever adopted.
+            vm_manager.run(["guestproperty", "set", name, POOL_PROPERTY, IDLE])
+        except Exception as e:
+            vm_manager.log(f"Could not warm pool VM '{name}': {e}", error=True)
+            with self._changed:
+                self._warming -= 1
+                self.stats.warm_failures += 1
+                self._last_error = str(e)
+                self._changed.notify_all()
+            return None
+        with self._changed:
+            self._warming -= 1
+            self._idle.append(name)
+            self.stats.warm_times.append(time.perf_counter() - started)
+            self._changed.notify_all()
+        return name
+
+    def acquire(self, hostname, user=None, password=None, timeout=None, refill=True):
+        """
+        Hand out an idle VM as 'hostname', waiting for one to warm up if the
+        pool is empty, and (with 'refill') replace it in the background.
+        Raises TimeoutError after 'timeout' seconds and RuntimeError if no VM
+        could be warmed or the guest did not apply its new identity.
+        """
+        started = time.perf_counter()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        hit = None
+        while True:
+            vm = self._take_idle(deadline, refill)
+            if hit is None:
+                hit = vm is not None
+            if vm is None:
+                vm = self._take_idle(deadline, refill, wait=True)
+            # Another process may have claimed an adopted member already.
+            with claim_lock(self.prefix):
+                if vm_manager.get_guest_property(vm, POOL_PROPERTY) == IDLE:
+                    vm_manager.run(
+                        ["guestproperty", "set", vm, POOL_PROPERTY, CLAIMED + hostname]
+                    )
+                    break
+            vm_manager.log(f"Pool VM '{vm}' was claimed elsewhere; trying another.")
+
+        waited = time.perf_counter() - started
+        with self._changed:
+            if hit:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+            self.stats.wait_times.append(waited)
+
+        token = vm_manager.reidentify(vm, hostname, user, password)
+        confirmed = readiness.wait_for_value(
+            vm, vm_manager.IDENTITY_PROPERTY, token, IDENTITY_TIMEOUT
+        )
+        if not confirmed:
+            raise RuntimeError(
+                f"'{vm}' did not apply the identity '{hostname}' within "
+                f"{IDENTITY_TIMEOUT:g}s. Does the template have the "
+                "'pivm-identity' service (see create_master_vm)?"
+            )
+        return Lease(vm, hostname, hit, waited)
+
+    def _take_idle(self, deadline, refill, wait=False):
+        """Pop the oldest idle member (or None), waiting for one with 'wait'."""
+        with self._changed:
+            failures = self.stats.warm_failures
+            while wait and not self._idle:
+                if self._warming == 0:
+                    if self.stats.warm_failures > failures:
+                        raise RuntimeError(
+                            f"The pool could not warm a VM: {self._last_error}"
+                        )
+                    self._refill()
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a pool VM.")
+                self._changed.wait(remaining)
+            if not self._idle:
+                return None
+            vm = self._idle.popleft()
+            if refill:
+                self._refill()
+            return vm
+
+    def close(self, wait=True):
+        """Stop the background workers (pool members stay as they are)."""
+        self._executor.shutdown(wait=wait)
+
+
+def parse_arguments(argv=None):
+    """Parses all command-line arguments using argparse."""
+    parser = argparse.ArgumentParser(
+        description="Keep a pool of booted clones of the master template ready."
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=DEFAULT_SIZE,
+        help=f"Number of idle VMs to keep (default: {DEFAULT_SIZE}).",
+    )
+    parser.add_argument(
+        "--prefix",
+        default=DEFAULT_PREFIX,
+        help=f"Name prefix of the pool VMs (default: {DEFAULT_PREFIX}).",
+    )
+    parser.add_argument("--ram", type=int, help="Amount of RAM in MB.")
+    parser.add_argument("--cpus", type=int, help="Number of CPU cores.")
+    parser.add_argument("--json", action="store_true", help="Print JSON output.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("fill", help="Warm VMs until the pool is full.")
+    commands.add_parser("status", help="List the idle pool VMs.")
+    claim = commands.add_parser("claim", help="Hand out a VM, then refill the pool.")
+    claim.add_argument("hostname", help="The hostname for the VM.")
+    claim.add_argument("--user", help="The username for the default user.")
+    claim.add_argument("--password", help="The password for the user.")
+    claim.add_argument(
+        "--no-refill",
+        action="store_true",
+        help="Exit right after handing out the VM.",
+    )
+    return parser.parse_args(argv)
+
+
+def print_report(pool, lease=None, as_json=False):
+    """Print the idle VMs, the handed-out VM and the pool statistics."""
+    report = {"idle": pool.idle, "stats": pool.stats.to_dict()}
+    if lease is not None:
+        report["lease"] = asdict(lease)
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return
+    if lease is not None:
+        source = "from the pool" if lease.hit else f"after {lease.waited:.1f}s"
+        print(f"Claimed '{lease.vm}' as '{lease.hostname}' ({source}).")
+    print(f"Idle pool VMs: {', '.join(report['idle']) or 'none'}")
+    stats = report["stats"]
+    print(
+        f"Hits {stats['hits']}, misses {stats['misses']}, "
+        f"warmed {stats['warmed']} (avg {stats['warm_avg']}s), "
+        f"failed {stats['warm_failures']}"
+    )
+
+
+def main(argv=None):
+    """Main execution function."""
+    args = parse_arguments(argv)
+    if not vm_manager.setup_environment():
+        return 1
+
+    lease = None
+    with contextlib.ExitStack() as stack:
+        if args.json:
+            # Keep stdout for the report; progress goes to stderr.
+            stack.enter_context(
+                vm_manager.capture_output(
+                    lambda message, error: print(message, file=sys.stderr)
+                )
+            )
+        pool = stack.enter_context(
+            WarmPool(size=args.size, prefix=args.prefix, ram=args.ram, cpus=args.cpus)
+        )
+        pool.adopt()
+        if args.command == "claim":
+            try:
+                lease = pool.acquire(
+                    args.hostname, args.user, args.password, refill=False
+                )
+            except (RuntimeError, TimeoutError) as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+        if args.command == "fill" or (lease and not args.no_refill):
+            pool.fill()
+    print_report(pool, lease, args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# scripts/readiness.py
+"""
+Waits until started VMs are ready to use.
+
+A VM counts as ready when the Guest Additions report its IP address
+(/VirtualBox/GuestInfo/Net/0/V4/IP) and the template's 'pivm-ready' service
+has set /PiSelfhosting/Ready at the end of the boot (see create_master_vm).
+Instead of polling SSH or sleeping, one 'VBoxManage guestproperty wait'
+blocks until one of these properties changes. Many VMs are waited for at
+once. The guest clears the Ready property when it shuts down, so a VM
+that is rebooting is not mistaken for a ready one.
+
+Every observed boot time (from the VM's start to readiness) is kept in a
+small history file (PIVM_BOOT_HISTORY overrides its location), from which a
+per-VM histogram of boot times is printed.
+
+Usage:
+  python -m scripts.readiness <vm> [<vm> ...] [--timeout 300] [--ip-only]
+                              [--histogram] [--json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from scripts import vm_manager
+
+# --- Configuration ---
+IP_PROPERTY = "/VirtualBox/GuestInfo/Net/0/V4/IP"
+READY_PROPERTY = "/PiSelfhosting/Ready"
+READY_PROPERTIES = (IP_PROPERTY, READY_PROPERTY)
+DEFAULT_TIMEOUT = 300.0
+MAX_WAITERS = 32  # VBoxManage processes waiting at the same time.
+HISTORY_ENV_VAR = "PIVM_BOOT_HISTORY"
+HISTORY_LIMIT = 100  # Boot times kept per VM.
+# Upper bounds (seconds) of the histogram buckets; the last one is open.
+BUCKETS = (10, 20, 30, 45, 60, 90, 120, 180, 300)
+
+
+@dataclass
+class ReadyResult:
+    """The outcome of waiting for one VM."""
+
+    name: str
+    ready: bool
+    ip: Optional[str] = None
+    # From the VM's start to readiness; None if it was ready before we looked.
+    boot_seconds: Optional[float] = None
+    waited: float = 0.0
+    error: Optional[str] = None
+
+
+def _start_time(info):
+    """Return when a running VM was started (epoch seconds), or None."""
+    if info.get("VMState") != "running":
+        return None
+    return vm_manager.get_state_change_time(info)
+
+
+def _read(name, properties):
+    return {key: vm_manager.get_guest_property(name, key) for key in properties}
+
+
+def _wait_for_change(name, keys, seconds):
+    """Block until one of 'keys' changes; returns False if 'seconds' passed."""
+    output = vm_manager.query(
+        [
+            "guestproperty",
+            "wait",
+            name,
+            "|".join(keys),
+            "--timeout",
+            str(max(1, int(seconds * 1000))),
+            "--fail-on-timeout",
+        ],
+        check=False,
+    )
+    return bool(output.strip())
+
+
+def wait_ready(name, timeout=DEFAULT_TIMEOUT, properties=READY_PROPERTIES):
+    """Wait until all 'properties' of a running VM are set; return a ReadyResult."""
+    started = time.monotonic()
+    deadline = started + timeout
+    try:
+        info = vm_manager.get_vm_info(name)
+    except Exception as e:
+        return ReadyResult(name, False, error=str(e))
+    if info.get("VMState") != "running":
+        return ReadyResult(name, False, error=f"'{name}' is not running.")
+    boot_started = _start_time(info)
+
+    values = _read(name, properties)
+    waited_for_change = False
+    while True:
+        missing = [key for key, value in values.items() if not value]
+        if not missing:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        waited_for_change = True
+        # 'guestproperty wait' only reports changes made after it started. A
+        # change between the read above and the wait is caught by reading
+        # once more when the wait times out.
+        changed = _wait_for_change(name, missing, remaining)
+        values.update(_read(name, missing))
+        if not changed:
+            break
+
+    waited = time.monotonic() - started
+    missing = [key for key, value in values.items() if not value]
+    if missing:
+        return ReadyResult(
+            name,
+            False,
+            values.get(IP_PROPERTY),
+            waited=waited,
+            error=f"'{name}' not ready after {timeout:g}s (no {', '.join(missing)}).",
+        )
+    boot_seconds = None
+    if waited_for_change and boot_started is not None:
+        boot_seconds = max(0.0, time.time() - boot_started)
+    return ReadyResult(name, True, values.get(IP_PROPERTY), boot_seconds, waited)
+
+
+def wait_for_value(name, key, expected, timeout=DEFAULT_TIMEOUT):
+    """Wait until guest property 'key' of a VM is 'expected'; returns a bool."""
+    deadline = time.monotonic() + timeout
+    while vm_manager.get_guest_property(name, key) != expected:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if not _wait_for_change(name, [key], remaining):
+            # Re-read once: the change may have come before the wait began.
+            return vm_manager.get_guest_property(name, key) == expected
+    return True
+
+
+def wait_many(names, timeout=DEFAULT_TIMEOUT, properties=READY_PROPERTIES):
+    """Wait for several VMs at once; returns ReadyResults in the order of 'names'."""
+    if not names:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(names), MAX_WAITERS)) as pool:
+        futures = [pool.submit(wait_ready, n, timeout, properties) for n in names]
+        return [future.result() for future in futures]
+
+
+# --- Boot-time history ---
+
+
+def history_path():
+    """Return the boot history file (PIVM_BOOT_HISTORY overrides the default)."""
+    if os.environ.get(HISTORY_ENV_VAR):
+        return os.environ[HISTORY_ENV_VAR]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get(
+            "XDG_STATE_HOME", os.path.join(os.path.expanduser("~"), ".local", "state")
+        )
+    return os.path.join(base, "pi-server-vm", "boot-times.json")
+
+
+def load_history():
+    """Return {vm name: [boot seconds, ...]} (or an empty dict)."""
+    try:
+        with open(history_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record_boot_times(results):
+    """Add the observed boot times of 'results' to the history and return it."""
+    history = load_history()
+    for result in results:
+        if result.boot_seconds is not None:
+            times = history.setdefault(result.name, [])
+            times.append(round(result.boot_seconds, 2))
+            del times[:-HISTORY_LIMIT]
+    path = history_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(history, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+    return history
+
+
+def histogram(samples, buckets=BUCKETS):
+    """Count 'samples' per bucket; returns a list of (label, count)."""
+    counts = [0] * (len(buckets) + 1)
+    for sample in samples:
+        index = next((i for i, edge in enumerate(buckets) if sample <= edge), None)
+        counts[len(buckets) if index is None else index] += 1
+    labels = [f"<= {edge}s" for edge in buckets] + [f"> {buckets[-1]}s"]
+    return list(zip(labels, counts))
+
+
+def print_histogram(name, samples, width=30):
+    """Print a text histogram of one VM's boot times."""
+    if not samples:
+        print(f"{name}: no boot times recorded yet")
+        return
+    ordered = sorted(samples)
+    median = ordered[len(ordered) // 2]
+    print(
+        f"{name}: {len(samples)} boots, median {median:.1f}s, "
+        f"min {ordered[0]:.1f}s, max {ordered[-1]:.1f}s"
+    )
+    rows = histogram(samples)
+    # Leave out the empty buckets above the slowest boot.
+    while rows and rows[-1][1] == 0:
+        rows.pop()
+    peak = max(count for _, count in rows)
+    for label, count in rows:
+        bar = "#" * round(count / peak * width) if count else ""
+        print(f"  {label:>8} {count:4d} {bar}")
+
+
+def main(argv=None):
+    """Main execution function."""
+    parser = argparse.ArgumentParser(
+        description="Wait until VMs have booted and are ready to use."
+    )
+    parser.add_argument("names", nargs="+", metavar="vm", help="VMs to wait for.")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help=f"Seconds to wait per VM (default: {DEFAULT_TIMEOUT:g}).",
+    )
+    parser.add_argument(
+        "--ip-only",
+        action="store_true",
+        help="Only wait for an IP address (for templates without 'pivm-ready').",
+    )
+    parser.add_argument(
+        "--histogram",
+        action="store_true",
+        help="Print each VM's boot-time histogram afterwards.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON output.")
+    args = parser.parse_args(argv)
+
+    if not vm_manager.setup_environment():
+        return 1
+
+    properties = (IP_PROPERTY,) if args.ip_only else READY_PROPERTIES
+    results = wait_many(args.names, args.timeout, properties)
+    history = record_boot_times(results)
+
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        for result in results:
+            if not result.ready:
+                print(f"{result.name:<30} NOT READY  {result.error}")
+                continue
+            boot = (
+                f"booted in {result.boot_seconds:.1f}s"
+                if result.boot_seconds is not None
+                else "was already up"
+            )
+            print(f"{result.name:<30} ready      {result.ip or '-':<15} {boot}")
+        if args.histogram:
+            print()
+            for name in args.names:
+                print_histogram(name, history.get(name, []))
+    return 0 if all(result.ready for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+# scripts/vm_gc.py
+"""
+Garbage collection ("gc") for clones and their disks.
+
+Selects VMs by name prefix, tag (VirtualBox group '/<tag>', see
+'clone_vm --tag') and age (time since the VM last started or stopped),
+powers the running ones off and unregisters and deletes them in parallel.
+The master template is never selected, and without --prefix or --tag no
+VMs are deleted at all.
+
+With --sweep it also deletes orphaned clone disks and closes registry
+entries whose file is gone. Only disk images laid out as clones made by
+these scripts are candidates ('<vm>/<vm>.vdi', '<vm>/<vm>-disk2.vdi' and
+'<vm>/Snapshots/{uuid}.vdi' in the machine folder), and only in folders
+without a settings file, so VMs removed with "Remove only" in VirtualBox
+keep their disks. With --prefix, only folders of matching names are swept.
+
+Usage:
+  python -m scripts.vm_gc [--prefix P] [--tag T] [--older-than 12h]
+                          [--jobs 4] [--sweep] [--dry-run] [--json]
+"""
+
+import argparse
+import contextvars
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from scripts import inventory, vm_manager
+from scripts.artifact_cache import format_size
+from scripts.clone_vm import SOURCE_VM_NAME
+
+# --- Configuration ---
+DEFAULT_JOBS = 4
+# VM states in which the VM holds its session and must be powered off.
+LIVE_STATES = ("running", "paused", "stuck", "starting", "stopping")
+_SNAPSHOT_DISK = re.compile(r"^\{[0-9a-fA-F-]{36}\}\.vdi$")
+# A clone that is still being copied is not registered yet; younger disk
+# files are never treated as orphans.
+ORPHAN_MIN_AGE = 3600
+_AGE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass
+class Candidate:
+    """A VM selected for deletion."""
+
+    name: str
+    state: str
+    age: Optional[float]  # Seconds since the last start or stop.
+    size: int  # Bytes freed by deleting it.
+
+
+@dataclass
+class GcReport:
+    """What a collection deleted (or, in a dry run, would delete)."""
+
+    dry_run: bool
+    vms: list = field(default_factory=list)  # Candidates
+    failed: list = field(default_factory=list)  # (name, error)
+    orphaned_disks: list = field(default_factory=list)  # (path, bytes)
+    dangling_media: list = field(default_factory=list)  # (uuid, location)
+
+    @property
+    def reclaimable(self):
+        deleted = {name for name, _ in self.failed}
+        return sum(vm.size for vm in self.vms if vm.name not in deleted) + sum(
+            size for _, size in self.orphaned_disks
+        )
+
+    def to_dict(self):
+        data = asdict(self)
+        data["reclaimable_bytes"] = self.reclaimable
+        return data
+
+
+def parse_age(text):
+    """Parse an age such as '90m', '12h' or '2d' (plain numbers are seconds)."""
+    text = str(text).strip().lower()
+    unit = text[-1:] if text[-1:] in _AGE_UNITS else "s"
+    number = text[:-1] if text[-1:] in _AGE_UNITS else text
+    return float(number) * _AGE_UNITS[unit]
+
+
+def _tree_size(path):
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return total
+
+
+def vm_size(info):
+    """Return the bytes a VM occupies: its folder plus disks kept elsewhere."""
+    folder = os.path.dirname(info.get("CfgFile", ""))
+    total = _tree_size(folder) if folder else 0
+    for path in vm_manager.attached_media(info):
+        inside = folder and os.path.abspath(path).startswith(
+            os.path.abspath(folder) + os.sep
+        )
+        if not inside and os.path.isfile(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def find_vms(prefix=None, tag=None, older_than=None, protect=(SOURCE_VM_NAME,)):
+    """Return the Candidates matching all given criteria (none without prefix/tag)."""
+    if not prefix and not tag:
+        return []
+    now = time.time()
+    candidates = []
+    for record in inventory.get_inventory().records():
+        if record.name in protect:
+            continue
+        if prefix and not record.name.startswith(prefix):
+            continue
+        info = vm_manager.get_vm_info(record.uuid)
+        if tag and f"/{tag}" not in info.get("groups", "").split(","):
+            continue
+        changed = vm_manager.get_state_change_time(info)
+        age = now - changed if changed is not None else None
+        if older_than is not None and (age is None or age < older_than):
+            continue
+        candidates.append(
+            Candidate(record.name, info.get("VMState", ""), age, vm_size(info))
+        )
+    return candidates
+
+
+def remove_vm(candidate):
+    """Power off (if needed) and delete one VM. Returns None or an error."""
+    try:
+        if candidate.state in LIVE_STATES:
+            vm_manager.poweroff_vm(candidate.name)
+        elif candidate.state == "saved":
+            vm_manager.discard_state(candidate.name)
+        vm_manager.delete_vm(candidate.name)
+    except Exception as e:
+        return getattr(e, "stderr", None) or str(e)
+    return None
+
+
+def _is_clone_disk(folder_name, parts):
+    """Whether a path (relative to a VM folder) is named like a clone's disk."""
+    if len(parts) == 1:
+        return parts[0] in (f"{folder_name}.vdi", f"{folder_name}-disk2.vdi")
+    return (
+        len(parts) == 2
+        and parts[0] == "Snapshots"
+        and bool(_SNAPSHOT_DISK.match(parts[1]))
+    )
+
+
+def find_orphans(machine_folder, prefix=None):
+    """
+    Return (orphaned disk files, dangling media). Orphans are clone disks
+    (see the module docstring) that no registered medium refers to and that
+    have not changed for ORPHAN_MIN_AGE seconds; dangling media are registry
+    entries whose file no longer exists.
+    """
+    cutoff = time.time() - ORPHAN_MIN_AGE
+    media = vm_manager.list_hdds()
+    registered = {os.path.normcase(os.path.abspath(m["Location"])) for m in media}
+    dangling = [
+        (m["UUID"], m["Location"])
+        for m in media
+        if m.get("State") == "inaccessible" or not os.path.exists(m["Location"])
+    ]
+    orphans = []
+    with os.scandir(machine_folder) as entries:
+        folders = [entry for entry in entries if entry.is_dir()]
+    for entry in folders:
+        if prefix and not entry.name.startswith(prefix):
+            continue
+        if os.path.exists(os.path.join(entry.path, f"{entry.name}.vbox")):
+            continue
+        for directory, _, filenames in os.walk(entry.path):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                parts = os.path.relpath(path, entry.path).split(os.sep)
+                if not _is_clone_disk(entry.name, parts):
+                    continue
+                if os.path.normcase(os.path.abspath(path)) in registered:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime <= cutoff:
+                    orphans.append((path, stat.st_size))
+    return sorted(orphans), dangling
+
+
+def collect(
+    prefix=None,
+    tag=None,
+    older_than=None,
+    jobs=DEFAULT_JOBS,
+    sweep=False,
+    dry_run=False,
+):
+    """Delete the selected VMs (and, with 'sweep', orphaned disks); returns a GcReport."""
+    report = GcReport(dry_run, find_vms(prefix, tag, older_than))
+    if report.vms and not dry_run:
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(report.vms)))) as pool:
+            errors = pool.map(lambda vm: context.copy().run(remove_vm, vm), report.vms)
+            report.failed = [
+                (vm.name, error) for vm, error in zip(report.vms, errors) if error
+            ]
+        inventory.invalidate()
+
+    if sweep:
+        machine_folder = vm_manager.get_default_machine_folder()
+        orphans, dangling = find_orphans(machine_folder, prefix)
+        if dry_run:
+            # The disks of the VMs above are deleted with them, not swept.
+            report.orphaned_disks, report.dangling_media = orphans, dangling
+            return report
+        for uuid, location in dangling:
+            try:
+                vm_manager.close_medium(uuid)
+                report.dangling_media.append((uuid, location))
+            except Exception as e:
+                report.failed.append((location, getattr(e, "stderr", None) or str(e)))
+        for path, size in orphans:
+            try:
+                os.remove(path)
+                report.orphaned_disks.append((path, size))
+            except OSError as e:
+                report.failed.append((path, str(e)))
+    return report
+
+
+def print_report(report):
+    """Print a human-readable summary of a collection."""
+    verb = "Would delete" if report.dry_run else "Deleted"
+    failed = dict(report.failed)
+    print(f"--- {verb} {len(report.vms)} VM(s) ---")
+    for vm in report.vms:
+        age = f"{vm.age / 3600:.1f}h" if vm.age is not None else "?"
+        status = f"FAILED: {failed[vm.name].strip()}" if vm.name in failed else ""
+        print(
+            f"  {vm.name:<30} {vm.state:<10} {age:>7} {format_size(vm.size):>10} {status}"
+        )
+    print(f"--- {verb} {len(report.orphaned_disks)} orphaned disk(s) ---")
+    for path, size in report.orphaned_disks:
+        print(f"  {path} ({format_size(size)})")
+    closed = "Would close" if report.dry_run else "Closed"
+    print(f"--- {closed} {len(report.dangling_media)} dangling registry entries ---")
+    for uuid, location in report.dangling_media:
+        print(f"  {uuid} {location}")
+    for name, error in report.failed:
+        if name not in {vm.name for vm in report.vms}:
+            print(f"  FAILED {name}: {error.strip()}", file=sys.stderr)
+    reclaim = "Reclaimable" if report.dry_run else "Reclaimed"
+    print(f"\n{reclaim}: {format_size(report.reclaimable)}")
+
+
+def main(argv=None):
+    """Main execution function."""
+    parser = argparse.ArgumentParser(
+        description="Delete clones and sweep orphaned disk images."
+    )
+    parser.add_argument("--prefix", help="Select VMs whose name starts with this.")
+    parser.add_argument("--tag", help="Select VMs in the VirtualBox group '/<tag>'.")
+    parser.add_argument(
+        "--older-than",
+        type=parse_age,
+        metavar="AGE",
+        help="Only VMs not started or stopped within AGE (e.g. 90m, 12h, 2d).",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"VMs deleted at the same time (default: {DEFAULT_JOBS}).",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Also delete orphaned clone disks and close dangling registry entries.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be deleted and how much space it frees.",
+    )
+    parser.add_argument("--json", action="store_true", help="Print JSON output.")
+    args = parser.parse_args(argv)
+
+    if not vm_manager.setup_environment():
+        return 1
+
+    options = (args.prefix, args.tag, args.older_than, args.jobs, args.sweep)
+    if args.json:
+        log_to_stderr = lambda message, error: print(message, file=sys.stderr)
+        with vm_manager.capture_output(log_to_stderr):
+            report = collect(*options, dry_run=args.dry_run)
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        report = collect(*options, dry_run=args.dry_run)
+        print_report(report)
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
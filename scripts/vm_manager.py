@@ -4,17 +4,100 @@ A module of helper functions to manage VirtualBox VMs using a simple,
 single Bridged Adapter network configuration.
 """
 
+import contextlib
+import contextvars
+import datetime
+import hashlib
 import os
 import platform
 import random
+import re
 import shutil
 import subprocess
 import sys
+import threading
+import time
+
+# capacity and inventory import this module lazily, inside functions, to
+# avoid an import cycle.
+from scripts import backends, capacity, inventory
+from scripts.backends import format_command
+
+# Process accounting lives with the backends; it is re-exported for callers.
+from scripts.backends import get_spawn_count, reset_spawn_count  # noqa: F401
+
+# --- Configuration ---
+# The snapshot of the master template that linked clones are based on.
+LINKED_BASE_SNAPSHOT = "pivm-linked-base"
+FINGERPRINT_PREFIX = "pivm-fingerprint:"
+# A running guest applies its identity properties when REIDENTIFY_PROPERTY
+# changes and then echoes the value to IDENTITY_PROPERTY (see the
+# 'pivm-identity' service in create_master_vm).
+REIDENTIFY_PROPERTY = "/PiSelfhosting/Reidentify"
+IDENTITY_PROPERTY = "/PiSelfhosting/Identity"
+
+# The 'showvminfo' keys a template fingerprint covers. Every backend reports
+# them, so switching backends does not make the base snapshot look outdated.
+_FINGERPRINT_KEYS = (
+    "UUID",
+    "CfgFile",
+    "VMStateChangeTime",
+    "memory",
+    "cpus",
+    "macaddress1",
+    "description",
+    "groups",
+)
+_STORAGE_SLOT_KEY = re.compile(r"(-ImageUUID)?-\d+-\d+$")
+
+# VirtualBox writes machine registrations and the media registry to a single
+# global settings file. Steps that touch it are serialized when clones run in
+# parallel threads; everything else (modifyvm, guest properties) runs freely.
+_registry_lock = threading.Lock()
+
+# VirtualBox can hold a VM's session lock for a moment after a poweroff
+# returns; unregistering it is retried for that long.
+UNREGISTER_ATTEMPTS = 5
+UNREGISTER_RETRY_DELAY = 0.5
+
+# The backend that executes VBoxManage commands. Chosen with set_backend() or
+# the PIVM_BACKEND environment variable ('subprocess' or 'vboxapi').
+BACKEND_ENV_VAR = "PIVM_BACKEND"
+_backend = None
+_backend_lock = threading.Lock()
+
+# Where progress messages go. They are printed unless the caller captures
+# them with capture_output() (the web app does this for each clone job).
+_output = contextvars.ContextVar("pivm_output", default=None)
 
 
 # --- Public Functions ---
 
 
+def log(message="", error=False):
+    """Report a progress (or, with 'error', an error) message."""
+    write = _output.get()
+    if write is None:
+        print(message, file=sys.stderr if error else sys.stdout)
+    else:
+        write(message, error)
+
+
+@contextlib.contextmanager
+def capture_output(write):
+    """
+    Send every message logged in this context to 'write(message, error)'.
+
+    Worker threads do not inherit the context; run their tasks in a copy of
+    the caller's (contextvars.copy_context()) so they log where it does.
+    """
+    token = _output.set(write)
+    try:
+        yield
+    finally:
+        _output.reset(token)
+
+
 def setup_environment():
     """Finds the VBoxManage executable and adds its directory to the system PATH."""
     if shutil.which("VBoxManage"):
@@ -39,22 +122,50 @@ def setup_environment():
         os.environ["PATH"] = f'{os.environ["PATH"]}{os.pathsep}{vbox_path}'
         return True
 
-    print("Error: Could not find VBoxManage executable.", file=sys.stderr)
+    log("Error: Could not find VBoxManage executable.", error=True)
     return False
 
 
-def run(cmd):
-    """Execute a shell command and raise an exception if it fails."""
-    print(f"Running: {cmd}")
-    subprocess.run(cmd, shell=True, check=True, capture_output=True, text=True)
+def set_backend(backend):
+    """Select the command backend, either by name or as a backend instance."""
+    global _backend
+    if isinstance(backend, str):
+        backend = backends.create_backend(backend)
+    with _backend_lock:
+        if _backend is not None and _backend is not backend:
+            _backend.close()
+        _backend = backend
+
+
+def get_backend():
+    """Return the active command backend, creating the default one if needed."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.environ.get(BACKEND_ENV_VAR, backends.SubprocessBackend.name)
+            _backend = backends.create_backend(name)
+        return _backend
+
+
+def run(args):
+    """Execute a VBoxManage command and raise an exception if it fails."""
+    log(f"Running: {format_command(args)}")
+    started = time.perf_counter()
+    try:
+        return get_backend().execute(args)
+    finally:
+        # Step timing makes slow VBoxManage calls easy to spot in the logs.
+        log(f"  ({time.perf_counter() - started:.2f}s)")
+
+
+def query(args, check=True):
+    """Run a read-only VBoxManage command and return its standard output."""
+    return get_backend().execute(args, check=check)
 
 
 def vm_exists(name):
     """Check if a virtual machine with the given name already exists."""
-    result = subprocess.run(
-        ["VBoxManage", "list", "vms"], capture_output=True, text=True, check=False
-    )
-    return f'"{name}"' in result.stdout
+    return inventory.get_inventory().exists(name)
 
 
 def generate_pi_mac():
@@ -72,50 +183,490 @@ def generate_serial_number():
 
 def get_first_bridged_adapter():
     """Find the name of the first available bridged network adapter."""
-    result = subprocess.run(
-        ["VBoxManage", "list", "bridgedifs"], capture_output=True, text=True, check=True
-    )
-    for line in result.stdout.splitlines():
+    for line in query(["list", "bridgedifs"]).splitlines():
         if line.strip().startswith("Name:"):
             return line.split(":", 1)[1].strip()
     raise RuntimeError("No bridged network adapter found.")
 
 
-def create_vm(name, ram, cpus, disk, iso):
+def get_default_machine_folder():
+    """Return the folder in which VirtualBox creates new VMs by default."""
+    for line in query(["list", "systemproperties"]).splitlines():
+        if line.startswith("Default machine folder:"):
+            return line.split(":", 1)[1].strip()
+    raise RuntimeError("Could not determine the default machine folder.")
+
+
+def parse_machine_readable(output):
+    """Parse 'VBoxManage ... --machinereadable' output into a dictionary."""
+    info = {}
+    pending_key, pending_value = None, None
+    for line in output.splitlines():
+        if pending_key is not None:
+            # Continuation of a multi-line quoted value (e.g. a description).
+            pending_value += "\n" + line
+            if line.endswith('"'):
+                info[pending_key] = pending_value[:-1]
+                pending_key = None
+            continue
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key = key.strip('"')
+        if value.startswith('"') and (len(value) == 1 or not value.endswith('"')):
+            pending_key, pending_value = key, value[1:]
+            continue
+        info[key] = value.strip('"')
+    return info
+
+
+def get_vm_info(name):
+    """Return the machine-readable VM information of a VM as a dictionary."""
+    return parse_machine_readable(query(["showvminfo", name, "--machinereadable"]))
+
+
+def get_state_change_time(info):
+    """Return when a VM last started or stopped (epoch seconds), or None."""
+    try:
+        changed = datetime.datetime.strptime(
+            info["VMStateChangeTime"][:26], "%Y-%m-%dT%H:%M:%S.%f"
+        )
+    except (KeyError, ValueError):
+        return None
+    # VirtualBox reports the time in UTC.
+    return changed.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+def get_template_fingerprint(info):
+    """
+    Compute a fingerprint of a VM's configuration from its 'showvminfo' data.
+
+    Only _FINGERPRINT_KEYS are used, so taking snapshots does not change it.
+    The state change time is included, so booting the template (to update
+    it) invalidates the fingerprint just like changing its settings does.
+    """
+    digest = hashlib.sha256()
+    for key in _FINGERPRINT_KEYS:
+        digest.update(f"{key}={info.get(key, '')}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def find_snapshot(info, name, description=None):
+    """Return the UUID of the newest snapshot with the given name (and description)."""
+    found = None
+    for key, snapshot_name in info.items():
+        if not key.startswith("SnapshotName") or snapshot_name != name:
+            continue
+        suffix = key[len("SnapshotName") :]
+        if (
+            description is not None
+            and info.get(f"SnapshotDescription{suffix}") != description
+        ):
+            continue
+        found = info.get(f"SnapshotUUID{suffix}")
+    return found
+
+
+def ensure_linked_base_snapshot(source):
+    """
+    Return the UUID of an up-to-date base snapshot of the source VM.
+
+    The snapshot is tagged with a fingerprint of the template. It is reused
+    while the template is unchanged; after a change a new base snapshot is
+    taken. Outdated snapshots are kept because existing linked clones
+    still depend on them.
+    """
+    info = get_vm_info(source)
+    fingerprint = get_template_fingerprint(info)
+    description = f"{FINGERPRINT_PREFIX}{fingerprint}"
+
+    snapshot_uuid = find_snapshot(info, LINKED_BASE_SNAPSHOT, description)
+    if snapshot_uuid:
+        log(f"Reusing base snapshot '{LINKED_BASE_SNAPSHOT}' ({snapshot_uuid}).")
+        return snapshot_uuid
+
+    log(f"Taking a new base snapshot '{LINKED_BASE_SNAPSHOT}' of '{source}'...")
+    run(
+        [
+            "snapshot",
+            source,
+            "take",
+            LINKED_BASE_SNAPSHOT,
+            "--description",
+            description,
+        ]
+    )
+    info = get_vm_info(source)
+    snapshot_uuid = info["CurrentSnapshotUUID"]
+
+    # Taking the snapshot must not make it look outdated on the next run.
+    new_description = f"{FINGERPRINT_PREFIX}{get_template_fingerprint(info)}"
+    if new_description != description:
+        run(
+            [
+                "snapshot",
+                source,
+                "edit",
+                snapshot_uuid,
+                "--description",
+                new_description,
+            ]
+        )
+    return snapshot_uuid
+
+
+class CommandPlan:
+    """
+    Collects the VBoxManage commands needed to configure one VM.
+
+    All 'modifyvm' settings are merged into a single invocation (placed where
+    the first setting was requested), so configuring a VM costs as few
+    VBoxManage processes as possible. A plan can be printed instead of
+    executed with 'dry_run'.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.steps = []
+        self._settings = None
+
+    def add(self, *args):
+        """Append a VBoxManage command (given as its arguments) to the plan."""
+        self.steps.append(list(args))
+
+    def call(self, description, func):
+        """Append a step that runs Python code (which may run commands itself)."""
+        self.steps.append((description, func))
+
+    def modify(self, **settings):
+        """Request 'modifyvm' settings; all of them end up in one invocation."""
+        if self._settings is None:
+            self._settings = {}
+            self.steps.append(self._settings)
+        for key, value in settings.items():
+            if value is not None:
+                self._settings[key] = value
+
+    def set_property(self, key, value, secret=False):
+        """
+        Set a guest property (VBoxManage sets one property per process).
+        The value of a 'secret' property is shown as '***' in every log.
+        """
+        self.add(
+            "guestproperty",
+            "set",
+            self.name,
+            key,
+            backends.Secret(value) if secret else value,
+        )
+
+    def _arguments(self, step):
+        if isinstance(step, dict):
+            if not step:
+                return None
+            options = [arg for k, v in step.items() for arg in (f"--{k}", str(v))]
+            return ["modifyvm", self.name, *options]
+        return step
+
+    def commands(self):
+        """Return the plan as printable lines, in execution order."""
+        lines = []
+        for step in self.steps:
+            if isinstance(step, tuple):
+                lines.append(f"# {step[0]}")
+            elif self._arguments(step) is not None:
+                lines.append(format_command(self._arguments(step)))
+        return lines
+
+    def execute(self, dry_run=False):
+        """Run (or, with 'dry_run', only print) every step of the plan."""
+        if dry_run:
+            log(f"Plan for '{self.name}':")
+            for line in self.commands():
+                log(f"  {line}")
+            return
+        for step in self.steps:
+            if isinstance(step, tuple):
+                step[1]()
+                continue
+            args = self._arguments(step)
+            if args is not None:
+                run(args)
+
+
+def _execute_and_invalidate(plan, dry_run):
+    """Execute a plan that registers a VM, then drop the cached inventory."""
+    try:
+        plan.execute(dry_run)
+    finally:
+        if not dry_run:
+            inventory.invalidate()
+
+
+def create_vm(name, ram, cpus, disk, iso, dry_run=False):
     """Creates, configures, and starts a new VM with a single bridged adapter."""
-    run(f'VBoxManage createvm --name "{name}" --register')
+    plan = CommandPlan(name)
+    plan.add("createvm", "--name", name, "--register")
 
-    bridge_adapter_name = get_first_bridged_adapter()
+    # A dry run runs no VBoxManage command at all, so the adapter is not looked up.
+    if dry_run:
+        bridge_adapter_name = "<first bridged adapter>"
+    else:
+        bridge_adapter_name = get_first_bridged_adapter()
     # Programmatically set Promiscuous Mode to 'Allow All' for better network discovery.
-    run(
-        f'VBoxManage modifyvm "{name}" --memory {ram} --cpus {cpus} '
-        f'--boot1 dvd --nic1 bridged --bridgeadapter1="{bridge_adapter_name}" '
-        f"--nicpromisc1 allow-all"
+    plan.modify(
+        memory=ram,
+        cpus=cpus,
+        boot1="dvd",
+        nic1="bridged",
+        bridgeadapter1=bridge_adapter_name,
+        nicpromisc1="allow-all",
+        macaddress1=generate_pi_mac(),
+        description=f"serial:{generate_serial_number()}",
     )
 
     disk_path = os.path.abspath(disk)
     iso_path = os.path.abspath(iso)
-    run(f'VBoxManage createhd --filename "{disk_path}" --size 8000')
-    run(
-        f'VBoxManage storagectl "{name}" --name="SATA Controller" '
-        "--add sata --controller IntelAhci"
+    plan.add("createhd", "--filename", disk_path, "--size", "8000")
+    plan.add(
+        "storagectl",
+        name,
+        "--name",
+        "SATA Controller",
+        "--add",
+        "sata",
+        "--controller",
+        "IntelAhci",
     )
-    run(
-        f'VBoxManage storageattach "{name}" --storagectl="SATA Controller" '
-        f'--port 0 --device 0 --type hdd --medium "{disk_path}"'
-    )
-    run(
-        f'VBoxManage storageattach "{name}" --storagectl="SATA Controller" '
-        f'--port 1 --device 0 --type dvddrive --medium "{iso_path}"'
+    plan.add(*_storage_attach(name, 0, "hdd", disk_path))
+    plan.add(*_storage_attach(name, 1, "dvddrive", iso_path))
+
+    _plan_start(plan)
+    _execute_and_invalidate(plan, dry_run)
+
+
+def start_vm(name, timeout=None):
+    """
+    Start a VM once the host has capacity for it (see scripts.capacity).
+    Waits in the start queue for up to 'timeout' seconds (by default
+    PIVM_START_TIMEOUT) and raises capacity.CapacityError if it cannot start.
+    """
+    memory_mb, cpus = capacity.vm_allocation(get_vm_info(name))
+    if timeout is None:
+        timeout = capacity.get_start_timeout()
+
+    def queued(budget):
+        log(
+            f"Waiting for host capacity to start '{name}' ({memory_mb} MB, "
+            f"{cpus} CPUs; {budget.free_memory_mb} MB and {budget.free_cpus} "
+            f"CPUs free, {budget.queued - 1} ahead in the queue)..."
+        )
+
+    scheduler = capacity.get_scheduler()
+    with scheduler.reserve(name, memory_mb, cpus, timeout, on_queued=queued):
+        try:
+            run(["startvm", name])
+        finally:
+            # The VM must show up as running before its reservation ends.
+            inventory.invalidate()
+
+
+def _plan_start(plan):
+    """Add a capacity-checked start of the plan's VM to the plan."""
+    plan.call(
+        f"{format_command(['startvm', plan.name])} (when the host has capacity)",
+        lambda: start_vm(plan.name),
     )
 
-    mac = generate_pi_mac()
-    run(f'VBoxManage modifyvm "{name}" --macaddress1 {mac}')
 
-    serial = generate_serial_number()
-    run(f'VBoxManage modifyvm "{name}" --description "serial:{serial}"')
+def poweroff_vm(name):
+    """Power off a running VM (like pulling the plug)."""
+    try:
+        run(["controlvm", name, "poweroff"])
+    finally:
+        inventory.invalidate()
+
+
+def discard_state(name):
+    """Throw away the saved state of a VM, leaving it powered off."""
+    try:
+        run(["discardstate", name])
+    finally:
+        inventory.invalidate()
+
+
+def _unregister(name):
+    for attempt in range(1, UNREGISTER_ATTEMPTS + 1):
+        try:
+            with _registry_lock:
+                run(["unregistervm", name])
+            return
+        except subprocess.CalledProcessError as e:
+            if attempt == UNREGISTER_ATTEMPTS or "lock" not in (e.stderr or ""):
+                raise
+        # The session of a VM that was just powered off may still be closing.
+        time.sleep(UNREGISTER_RETRY_DELAY)
+
+
+def delete_vm(name):
+    """
+    Unregister a VM and delete its files, including its disk images.
+
+    Only the registry changes hold the registry lock; the (possibly
+    multi-GB) files are deleted afterwards, so several VMs can be deleted
+    at the same time. A disk that is still used by another VM is kept.
+    """
+    info = get_vm_info(name)
+    closed = []
+    try:
+        _unregister(name)
+        with _registry_lock:
+            for path in attached_media(info):
+                try:
+                    run(["closemedium", "disk", path])
+                    closed.append(path)
+                except subprocess.CalledProcessError as e:
+                    log(f"Keeping '{path}': {(e.stderr or '').strip()}", error=True)
+    finally:
+        inventory.invalidate()
+    _remove_vm_files(info["CfgFile"], closed)
+
+
+def _remove_vm_files(settings_file, disks):
+    """Delete what 'unregistervm --delete' would: disks, settings and logs."""
+    folder = os.path.dirname(settings_file)
+    for path in [*disks, settings_file, f"{settings_file}-prev"]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+    shutil.rmtree(os.path.join(folder, "Logs"), ignore_errors=True)
+    # The folders go only if nothing else (such as a user's file) is left.
+    for directory in (os.path.join(folder, "Snapshots"), folder):
+        with contextlib.suppress(OSError):
+            os.rmdir(directory)
+
+
+def attached_media(info):
+    """Return the paths of the disk images attached to a VM ('showvminfo' data)."""
+    return [
+        value
+        for key, value in info.items()
+        if _STORAGE_SLOT_KEY.search(key)
+        and "-ImageUUID-" not in key
+        and value.lower().endswith((".vdi", ".vmdk", ".vhd"))
+    ]
+
+
+def list_hdds():
+    """Return the media registry ('list hdds') as a list of dictionaries."""
+    media, current = [], {}
+    for line in query(["list", "hdds"]).splitlines() + [""]:
+        if not line.strip():
+            if current:
+                media.append(current)
+            current = {}
+            continue
+        key, _, value = line.partition(":")
+        current[key.strip()] = value.strip()
+    return media
+
+
+def close_medium(uuid):
+    """Remove a disk image from the media registry (its file is left alone)."""
+    with _registry_lock:
+        run(["closemedium", "disk", uuid])
+
+
+def _storage_attach(name, port, medium_type, medium):
+    """Return the 'storageattach' arguments for the VM's SATA controller."""
+    return [
+        "storageattach",
+        name,
+        "--storagectl",
+        "SATA Controller",
+        "--port",
+        str(port),
+        "--device",
+        "0",
+        "--type",
+        medium_type,
+        "--medium",
+        medium,
+    ]
+
+
+def _register_clone(source, target, linked, machine_folder):
+    """Run 'clonevm' and register the new VM, holding the registry lock as needed."""
+    clone_command = ["clonevm", source, "--name", target]
+    if linked:
+        with _registry_lock:
+            snapshot_uuid = ensure_linked_base_snapshot(source)
+        clone_command += ["--snapshot", snapshot_uuid, "--options=link"]
+
+    if machine_folder:
+        run([*clone_command, "--basefolder", machine_folder])
+        settings_file = os.path.join(machine_folder, target, f"{target}.vbox")
+        with _registry_lock:
+            run(["registervm", settings_file])
+    else:
+        with _registry_lock:
+            run([*clone_command, "--register"])
+
 
-    run(f'VBoxManage startvm "{name}"')
+def _attach_secondary_disk(target, disk_size):
+    """Create a new disk of 'disk_size' GB next to the VM and attach it."""
+    log(f"Creating and attaching a new {disk_size}GB secondary disk...")
+    vm_dir = os.path.dirname(get_vm_info(target)["CfgFile"])
+    disk_path = os.path.join(vm_dir, f"{target}-disk2.vdi")
+    disk_size_mb = disk_size * 1024
+    with _registry_lock:
+        run(["createhd", "--filename", disk_path, "--size", str(disk_size_mb)])
+        run(_storage_attach(target, 2, "hdd", disk_path))
+
+
+def _plan_identity(plan, hostname, serial, user, password):
+    """Add the guest properties that give a VM its identity to the plan."""
+    plan.set_property("/VirtualBox/GuestAdd/hostname", hostname)
+    if user:
+        plan.set_property("/VirtualBox/GuestAdd/user", user)
+    if password:
+        plan.set_property("/VirtualBox/GuestAdd/password", password, secret=True)
+        # Create the content for the PiSelfhosting info file
+        log("--- ACTION: Preparing PiSelfhosting identity file content ---")
+        info_file_content = f"""MODEL_NAME=PiSelfhosting Virtual Pi
+    SERIAL_NUMBER={serial}
+    HOSTNAME={hostname}""".strip()
+
+        # Set the content as a new Guest Property
+        plan.set_property(
+            "/VirtualBox/GuestAdd/PiSelfhostingInfo", info_file_content, secret=True
+        )
+        log("✅ PiSelfhosting identity file content has been added to the plan.")
+
+
+def reidentify(name, hostname, user=None, password=None):
+    """
+    Ask a running VM to take a new hostname and user. The identity is set in
+    its guest properties and REIDENTIFY_PROPERTY is set to a new token; the
+    guest applies the identity and echoes the token to IDENTITY_PROPERTY,
+    which the caller can wait for. Returns the token. The VM keeps its serial
+    number and MAC address.
+    """
+    description = get_vm_info(name).get("description", "")
+    serial = description[len("serial:") :] if description.startswith("serial:") else ""
+    token = f"{hostname}:{generate_serial_number()}"
+    plan = CommandPlan(name)
+    _plan_identity(plan, hostname, serial or generate_serial_number(), user, password)
+    plan.set_property(REIDENTIFY_PROPERTY, token)
+    plan.execute()
+    return token
+
+
+def get_guest_property(name, key):
+    """Return the value of a guest property, or None if it is not set."""
+    output = query(["guestproperty", "get", name, key], check=False)
+    if output.startswith("Value: "):
+        return output[len("Value: ") :].rstrip("\n")
+    return None
 
 
 def clone_vm(
@@ -127,69 +678,50 @@ def clone_vm(
     user=None,
     password=None,
     start_vm=False,
+    linked=False,
+    machine_folder=None,
+    dry_run=False,
+    tag=None,
 ):
     """
     Clones an existing VM and applies customizations. Assumes a single Bridged Adapter.
+
+    With 'linked', the clone is a copy-on-write linked clone of a managed base
+    snapshot of the source, which takes seconds instead of copying the disk.
+
+    When a 'machine_folder' is given, the (slow) disk copy runs without holding
+    the registry lock and only the registration itself is serialized. This is
+    used when several clones are created in parallel.
+
+    A 'tag' puts the clone in the VirtualBox group '/<tag>', by which
+    scripts.vm_gc can find it again.
+
+    With 'dry_run', the planned commands are printed instead of executed.
     """
-    run(f'VBoxManage clonevm "{source}" --name "{target}" --register')
+    plan = CommandPlan(target)
+    kind = "linked clone" if linked else "full clone"
+    plan.call(
+        f"Clone '{source}' to '{target}' ({kind}) and register it",
+        lambda: _register_clone(source, target, linked, machine_folder),
+    )
 
     # Assign new unique identifiers
-    new_mac = generate_pi_mac()
     serial = generate_serial_number()
-    run(f'VBoxManage modifyvm "{target}" --macaddress1 {new_mac}')
-    run(f'VBoxManage modifyvm "{target}" --description "serial:{serial}"')
+    plan.modify(macaddress1=generate_pi_mac(), description=f"serial:{serial}")
 
     # Set guest properties for the first-boot configuration script
-    run(
-        f'VBoxManage guestproperty set "{target}" /VirtualBox/GuestAdd/hostname "{target}"'
-    )
-    if user:
-        run(
-            f'VBoxManage guestproperty set "{target}" /VirtualBox/GuestAdd/user "{user}"'
-        )
-    if password:
-        run(
-            f'VBoxManage guestproperty set "{target}" /VirtualBox/GuestAdd/password "{password}"'
-        )
-        # Create the content for the PiSelfhosting info file
-        print("--- ACTION: Preparing PiSelfhosting identity file content ---")
-        info_file_content = f"""MODEL_NAME=PiSelfhosting Virtual Pi
-    SERIAL_NUMBER={serial}
-    HOSTNAME={target}""".strip()
+    _plan_identity(plan, target, serial, user, password)
 
-        # Set the content as a new Guest Property
-        run(
-            f'VBoxManage guestproperty set "{target}" /VirtualBox/GuestAdd/PiSelfhostingInfo "{info_file_content}"'
-        )
-        print("✅ PiSelfhosting identity file content has been set.")
-
-    # Apply optional hardware customizations
-    if ram:
-        run(f'VBoxManage modifyvm "{target}" --memory {ram}')
-    if cpus:
-        run(f'VBoxManage modifyvm "{target}" --cpus {cpus}')
+    # Apply optional hardware customizations (merged into the same modifyvm)
+    plan.modify(memory=ram, cpus=cpus, groups=f"/{tag}" if tag else None)
     if disk_size:
-        print(f"Creating and attaching a new {disk_size}GB secondary disk...")
-        vm_info_result = subprocess.run(
-            ["VBoxManage", "showvminfo", target, "--machinereadable"],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
-        cfg_file_line = [
-            line
-            for line in vm_info_result.stdout.splitlines()
-            if line.startswith("CfgFile=")
-        ][0]
-        vm_dir = os.path.dirname(cfg_file_line.split("=", 1)[1].strip().strip('"'))
-        disk_path = os.path.join(vm_dir, f"{target}-disk2.vdi")
-        disk_size_mb = disk_size * 1024
-        run(f'VBoxManage createhd --filename "{disk_path}" --size {disk_size_mb}')
-        run(
-            f'VBoxManage storageattach "{target}" --storagectl="SATA Controller" '
-            f'--port 2 --device 0 --type hdd --medium "{disk_path}"'
+        plan.call(
+            f"Create and attach a new {disk_size}GB secondary disk",
+            lambda: _attach_secondary_disk(target, disk_size),
         )
 
     # Conditionally start the VM
     if start_vm:
-        run(f'VBoxManage startvm "{target}"')
+        _plan_start(plan)
+
+    _execute_and_invalidate(plan, dry_run)
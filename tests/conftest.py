@@ -0,0 +1,226 @@
+# tests/conftest.py
+import json
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+from fake_vboxmanage import FakeVBox, new_vm
+
+sys.path.insert(0, ".")
+
+from scripts import (  # noqa: E402
+    artifact_cache,
+    capacity,
+    inventory,
+    readiness,
+    vm_manager,
+)
+
+FAKE_VBOXMANAGE = os.path.join(os.path.dirname(__file__), "fake_vboxmanage.py")
+FAKE_GH = os.path.join(os.path.dirname(__file__), "fake_gh.py")
+
+
+class FakeVBoxManage:
+    """Test-side handle on the fake VBoxManage installed on PATH."""
+
+    def __init__(self, directory):
+        self.state_path = str(directory / "vbox-state.json")
+        self.log_path = str(directory / "vbox-calls.log")
+        cfg_dir = directory / "VirtualBox VMs"
+        cfg_dir.mkdir()
+        self.write_state({"vms": {}, "cfg_dir": str(cfg_dir)})
+
+    def read_state(self):
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        with open(self.state_path, "w") as f:
+            json.dump(state, f)
+
+    def add_vm(self, name, **settings):
+        """Register a powered-off VM, optionally overriding its settings."""
+        state = self.read_state()
+        vm = new_vm(name, state["cfg_dir"])
+        vm["settings"].update({k: str(v) for k, v in settings.items()})
+        state["vms"][name] = vm
+        self.write_state(state)
+        return vm
+
+    def calls(self):
+        """Return every recorded invocation as a list of argument lists."""
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path) as f:
+            return [json.loads(line) for line in f]
+
+    def commands(self, name):
+        """Return the recorded invocations of one VBoxManage sub-command."""
+        return [call for call in self.calls() if call and call[0] == name]
+
+
+@pytest.fixture(autouse=True)
+def boot_history(tmp_path, monkeypatch):
+    """Keep the boot times recorded by a test out of the user's history."""
+    path = tmp_path / "boot-times.json"
+    monkeypatch.setenv(readiness.HISTORY_ENV_VAR, str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def artifact_cache_dir(tmp_path, monkeypatch):
+    """Give every test its own, empty artifact cache."""
+    cache_dir = tmp_path / "artifact-cache"
+    monkeypatch.setenv(artifact_cache.CACHE_DIR_ENV_VAR, str(cache_dir))
+    return cache_dir
+
+
+def write_fake_proc(root, cpus, memory_mb):
+    """Write the /proc files that scripts.capacity reads."""
+    root.mkdir(exist_ok=True)
+    (root / "cpuinfo").write_text(
+        "".join(f"processor\t: {i}\nmodel name\t: Fake CPU\n\n" for i in range(cpus))
+    )
+    (root / "meminfo").write_text(
+        f"MemTotal:       {memory_mb * 1024} kB\nMemFree:        1024 kB\n"
+    )
+
+
+@pytest.fixture(autouse=True)
+def fake_proc(tmp_path, monkeypatch):
+    """Give every test a roomy fake host, independent of the machine running it."""
+    root = tmp_path / "proc"
+    write_fake_proc(root, cpus=16, memory_mb=65536)
+    monkeypatch.setenv(capacity.PROC_ROOT_ENV_VAR, str(root))
+    # Starts queued by one test must not wait for VMs of another.
+    monkeypatch.setattr(capacity, "_scheduler", None)
+    return root
+
+
+@pytest.fixture
+def fake_vbox(tmp_path, monkeypatch):
+    """Install a stateful fake 'VBoxManage' at the front of the PATH."""
+    if sys.platform == "win32":
+        pytest.skip("The fake VBoxManage wrapper is a POSIX shell script.")
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    wrapper = bin_dir / "VBoxManage"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_VBOXMANAGE}" "$@"\n')
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IEXEC)
+
+    # A VM inventory cached by an earlier test would describe another fake.
+    inventory.invalidate()
+    fake = FakeVBoxManage(tmp_path)
+    monkeypatch.setenv("FAKE_VBOX_STATE", fake.state_path)
+    monkeypatch.setenv("FAKE_VBOX_LOG", fake.log_path)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return fake
+
+
+class FakeGh:
+    """Test-side handle on the fake 'gh' installed on PATH."""
+
+    def __init__(self, directory):
+        self.state_path = str(directory / "gh-state.json")
+        self.log_path = str(directory / "gh-calls.log")
+        self.write_state({"releases": {}})
+
+    def read_state(self):
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        with open(self.state_path, "w") as f:
+            json.dump(state, f)
+
+    def update(self, **changes):
+        state = self.read_state()
+        state.update(changes)
+        self.write_state(state)
+
+    def assets(self, tag):
+        return self.read_state()["releases"][tag]["assets"]
+
+    def uploads(self):
+        """Return the names of the files passed to every 'release upload' call."""
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path) as f:
+            calls = [json.loads(line) for line in f]
+        return [
+            os.path.basename(arg)
+            for call in calls
+            if call[:2] == ["release", "upload"]
+            for arg in call[3:]
+            if not arg.startswith("--")
+        ]
+
+
+@pytest.fixture
+def fake_gh(tmp_path, monkeypatch):
+    """Install a stateful fake GitHub CLI ('gh') at the front of the PATH."""
+    if sys.platform == "win32":
+        pytest.skip("The fake gh wrapper is a POSIX shell script.")
+
+    bin_dir = tmp_path / "gh-bin"
+    bin_dir.mkdir()
+    wrapper = bin_dir / "gh"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_GH}" "$@"\n')
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IEXEC)
+
+    fake = FakeGh(tmp_path)
+    monkeypatch.setenv("FAKE_GH_STATE", fake.state_path)
+    monkeypatch.setenv("FAKE_GH_LOG", fake.log_path)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return fake
+
+
+class FakeBackend:
+    """An in-process command backend: runs the fake VBoxManage without processes."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.state = {"vms": {}, "cfg_dir": "/fake/VirtualBox VMs"}
+        self.calls = []
+
+    def add_vm(self, name, **settings):
+        vm = new_vm(name, self.state["cfg_dir"])
+        vm["settings"].update({k: str(v) for k, v in settings.items()})
+        self.state["vms"][name] = vm
+        return vm
+
+    def commands(self, name):
+        return [call for call in self.calls if call and call[0] == name]
+
+    def execute(self, args, check=True):
+        self.calls.append(list(args))
+        fake = FakeVBox(self.state)
+        returncode, stdout, stderr = fake.handle(list(args))
+        time.sleep(fake.pending_sleep)
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args, stdout, stderr)
+        return stdout
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """Route all vm_manager commands to an in-process fake; forbid real processes."""
+
+    def no_processes(*args, **kwargs):
+        raise AssertionError(f"Unexpected process spawn: {args}")
+
+    inventory.invalidate()
+    backend = FakeBackend()
+    monkeypatch.setattr(vm_manager, "_backend", backend)
+    monkeypatch.setattr(subprocess, "run", no_processes)
+    monkeypatch.setattr(subprocess, "Popen", no_processes)
+    return backend
@@ -0,0 +1,82 @@
+# tests/fake_gh.py
+"""
+A small, stateful stand-in for the GitHub CLI ('gh') used by the release tests.
+
+Only 'gh release view <tag> --json assets', 'gh release upload <tag> <file>'
+and 'gh release download <tag> --pattern <name> --dir <dir>' are understood;
+a download produces a zip with the Windows executables. The releases and their assets are kept in a JSON file (given
+by FAKE_GH_STATE) and every invocation is appended to FAKE_GH_LOG. To simulate
+trouble, the state can hold:
+  "failures": {"<asset name>": <number of uploads that fail first>}
+  "missing_views": <number of 'release view' calls that report no release>
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import zipfile
+
+
+def main(argv):
+    with open(os.environ["FAKE_GH_LOG"], "a") as f:
+        f.write(json.dumps(argv) + "\n")
+    with open(os.environ["FAKE_GH_STATE"]) as f:
+        state = json.load(f)
+
+    if argv[:2] == ["release", "view"]:
+        tag = argv[2]
+        if state.get("missing_views", 0) > 0 or tag not in state["releases"]:
+            state["missing_views"] = max(0, state.get("missing_views", 0) - 1)
+            save(state)
+            print("release not found", file=sys.stderr)
+            return 1
+        assets = [
+            dict(asset, name=name)
+            for name, asset in state["releases"][tag]["assets"].items()
+        ]
+        print(json.dumps({"assets": assets}))
+        return 0
+
+    if argv[:2] == ["release", "upload"]:
+        tag = argv[2]
+        paths = [arg for arg in argv[3:] if not arg.startswith("--")]
+        for path in paths:
+            name = os.path.basename(path)
+            if state.get("failures", {}).get(name, 0) > 0:
+                state["failures"][name] -= 1
+                save(state)
+                print(f"HTTP 502: upload of {name} failed", file=sys.stderr)
+                return 1
+            with open(path, "rb") as f:
+                content = f.read()
+            state["releases"][tag]["assets"][name] = {
+                "size": len(content),
+                "digest": f"sha256:{hashlib.sha256(content).hexdigest()}",
+            }
+        save(state)
+        return 0
+
+    if argv[:2] == ["release", "download"]:
+        pattern = argv[argv.index("--pattern") + 1]
+        directory = argv[argv.index("--dir") + 1]
+        with zipfile.ZipFile(os.path.join(directory, pattern), "w") as archive:
+            for app in ("download-assets", "clone-vm"):
+                archive.writestr(f"{app}/{app}.exe", f"MZ {app}")
+        return 0
+
+    print(f"fake gh: unsupported command {argv}", file=sys.stderr)
+    return 2
+
+
+def save(state):
+    with open(os.environ["FAKE_GH_STATE"], "w") as f:
+        json.dump(state, f)
+
+
+if __name__ == "__main__":
+    # Uploads run concurrently; take turns with the state file.
+    with open(f"{os.environ['FAKE_GH_STATE']}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sys.exit(main(sys.argv[1:]))
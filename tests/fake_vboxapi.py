@@ -0,0 +1,236 @@
+# tests/fake_vboxapi.py
+"""
+A small stand-in for the 'vboxapi' module of the VirtualBox SDK, used to
+test the 'vboxapi' backend without VirtualBox.
+
+Only the parts of the API that scripts/backends.py uses are modelled.
+Long-running operations (clones, VM starts, snapshots) return a Progress
+whose waitForCompletion() sleeps for OPERATION_SECONDS.
+"""
+
+import time
+import uuid
+
+OPERATION_SECONDS = 0.0
+
+
+class Constants:
+    MachineState_PoweredOff = 1
+    MachineState_Saved = 2
+    MachineState_Aborted = 4
+    MachineState_Running = 5
+    MachineState_Paused = 6
+    MachineState_Starting = 10
+    MachineState_Stopping = 11
+    LockType_Shared = 1
+    LockType_Write = 2
+    HostNetworkInterfaceType_Bridged = 1
+    CloneMode_MachineState = 1
+    CloneOptions_Link = 1
+
+
+class ApiError(Exception):
+    pass
+
+
+class Progress:
+    def __init__(self, on_complete=None, error=None):
+        self._on_complete = on_complete
+        self.resultCode = 1 if error else 0
+        self.errorInfo = type("ErrorInfo", (), {"text": error or ""})()
+
+    def waitForCompletion(self, timeout):
+        time.sleep(OPERATION_SECONDS)
+        if self._on_complete is not None and not self.resultCode:
+            self._on_complete()
+
+
+class NetworkAdapter:
+    def __init__(self):
+        self.MACAddress = "080027000001"
+
+
+class Medium:
+    def __init__(self, location):
+        self.location = location
+        self.id = str(uuid.uuid4())
+
+
+class Attachment:
+    def __init__(self, controller, port, medium):
+        self.controller = controller
+        self.port = port
+        self.device = 0
+        self.medium = medium
+
+
+class Snapshot:
+    def __init__(self, machine, name, description):
+        self.machine = machine
+        self.name = name
+        self.id = str(uuid.uuid4())
+        self.description = description
+        self.children = []
+
+
+class Machine:
+    def __init__(self, name, settings_file="", os_type="Debian_64"):
+        self.name = name
+        self.id = str(uuid.uuid4())
+        self.settingsFilePath = settings_file or f"/vms/{name}/{name}.vbox"
+        self.state = Constants.MachineState_PoweredOff
+        self.lastStateChange = 1_700_000_000_000  # Milliseconds.
+        self.memorySize = 1024
+        self.CPUCount = 1
+        self.description = ""
+        self.groups = ["/"]
+        self.OSTypeId = os_type
+        self.mediumAttachments = []
+        self.properties = {}
+        self.snapshots = []
+        self.saved = False
+        self.locked_by = None
+        self._adapter = NetworkAdapter()
+
+    @property
+    def snapshotCount(self):
+        return len(self.snapshots)
+
+    @property
+    def currentSnapshot(self):
+        return self.snapshots[-1]
+
+    def findSnapshot(self, name_or_id):
+        if not name_or_id:
+            return self.snapshots[0]
+        for snapshot in self.snapshots:
+            if name_or_id in (snapshot.name, snapshot.id):
+                return snapshot
+        raise ApiError(f"Could not find snapshot '{name_or_id}'")
+
+    def getNetworkAdapter(self, slot):
+        return self._adapter
+
+    def getGuestPropertyValue(self, key):
+        return self.properties.get(key, "")
+
+    def setGuestPropertyValue(self, key, value):
+        if self.locked_by is None:
+            raise ApiError("The session is not locked")
+        self.properties[key] = value
+
+    def saveSettings(self):
+        if self.locked_by is None:
+            raise ApiError("The session is not locked")
+        self.saved = True
+
+    def lockMachine(self, session, lock_type):
+        if self.locked_by is not None:
+            raise ApiError(f"The machine '{self.name}' is already locked")
+        self.locked_by = lock_type
+        session.machine = self
+
+    def takeSnapshot(self, name, description, pause):
+        snapshot = Snapshot(self, name, description)
+        if self.snapshots:
+            self.snapshots[-1].children.append(snapshot)
+        return Progress(lambda: self.snapshots.append(snapshot)), snapshot.id
+
+    def cloneTo(self, target, mode, options):
+        target.memorySize = self.memorySize
+        target.CPUCount = self.CPUCount
+        target.linked = Constants.CloneOptions_Link in options
+        return Progress()
+
+    def launchVMProcess(self, session, kind, environment):
+        self.locked_by = "launch"
+        session.machine = self
+
+        def started():
+            self.state = Constants.MachineState_Running
+
+        return Progress(started)
+
+
+class Session:
+    def __init__(self):
+        self.machine = None
+
+    def unlockMachine(self):
+        if self.machine is None or self.machine.locked_by is None:
+            raise ApiError("The session is not locked")
+        self.machine.locked_by = None
+
+
+class Interface:
+    def __init__(self, name):
+        self.name = name
+
+
+class Host:
+    def __init__(self):
+        self.interfaces = [Interface("eth0"), Interface("wlan0")]
+
+    def findHostNetworkInterfacesOfType(self, kind):
+        return self.interfaces
+
+
+class SystemProperties:
+    defaultMachineFolder = "/vms"
+
+
+class VirtualBox:
+    def __init__(self):
+        self.machines = []
+        self.host = Host()
+        self.systemProperties = SystemProperties()
+        self._opened = {}
+
+    def add_machine(self, name, **attributes):
+        machine = Machine(name)
+        for key, value in attributes.items():
+            setattr(machine, key, value)
+        self.machines.append(machine)
+        return machine
+
+    def findMachine(self, name_or_id):
+        for machine in self.machines:
+            if name_or_id in (machine.name, machine.id):
+                return machine
+        raise ApiError(f"Could not find a registered machine named '{name_or_id}'")
+
+    def composeMachineFilename(self, name, group, flags, base_folder):
+        return f"{base_folder}/{name}/{name}.vbox"
+
+    def createMachine(self, settings_file, name, groups, os_type, *flags):
+        machine = Machine(name, settings_file, os_type)
+        self._opened[machine.settingsFilePath] = machine
+        return machine
+
+    def openMachine(self, settings_file):
+        try:
+            return self._opened[settings_file]
+        except KeyError:
+            raise ApiError(f"Could not open '{settings_file}'")
+
+    def registerMachine(self, machine):
+        self.machines.append(machine)
+
+
+class VirtualBoxManager:
+    def __init__(self, style, params):
+        self.constants = Constants
+        self.vbox = VirtualBox()
+        self.deinitialised = False
+
+    def getVirtualBox(self):
+        return self.vbox
+
+    def getSessionObject(self):
+        return Session()
+
+    def getArray(self, obj, attribute):
+        return list(getattr(obj, attribute))
+
+    def deinit(self):
+        self.deinitialised = True
@@ -0,0 +1,450 @@
+# tests/fake_vboxmanage.py
+"""
+A small, stateful stand-in for the 'VBoxManage' command used by the tests.
+
+The state of the fake VirtualBox installation is kept in a JSON file (given by
+the FAKE_VBOX_STATE environment variable) and every invocation is appended to
+a log file (FAKE_VBOX_LOG) so tests can assert on the exact commands that were
+run. Setting FAKE_VBOX_DELAY makes every call sleep for that many seconds,
+which is useful to simulate the cost of a real VBoxManage process.
+
+Started VMs "boot": 'boot_seconds' in the state (default 0, or a dict by VM
+name) after 'startvm', the Guest Additions report an IP address in
+/VirtualBox/GuestInfo/Net/0/V4/IP and the template's readiness service sets
+/PiSelfhosting/Ready (unless 'ready_service' is false in the state).
+'guestproperty wait' sleeps until then or until its timeout; the sleep is
+left to the caller (see 'pending_sleep'), so other calls are not blocked.
+Setting /PiSelfhosting/Reidentify on a running VM makes its identity
+service apply the identity properties at once (unless 'identity_service'
+is false): it records 'guest_hostname', deletes the password property and
+echoes the value to /PiSelfhosting/Identity.
+
+After 'controlvm poweroff' the VM's session stays locked for the next
+'poweroff_lock' (default 0) 'unregistervm' calls, as VirtualBox's can for
+a moment.
+
+Disk images are registered in 'media' (path -> size in MB). When the machine
+folder exists, VMs get a settings file and their disks a real file of one
+KB per MB, so tests can measure and delete them.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+
+BRIDGED_ADAPTER = "eth0"
+IP_PROPERTY = "/VirtualBox/GuestInfo/Net/0/V4/IP"
+READY_PROPERTY = "/PiSelfhosting/Ready"
+REIDENTIFY_PROPERTY = "/PiSelfhosting/Reidentify"
+IDENTITY_PROPERTY = "/PiSelfhosting/Identity"
+
+
+def timestamp():
+    """The current time as VirtualBox formats it (UTC, nanoseconds)."""
+    return datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%f000"
+    )
+
+
+def new_vm(name, cfg_dir):
+    """Return the state record of a freshly registered, powered-off VM."""
+    return {
+        "name": name,
+        "uuid": str(uuid.uuid4()),
+        "state": "poweroff",
+        "state_change": timestamp(),
+        "cfgfile": os.path.join(cfg_dir, name, f"{name}.vbox"),
+        "settings": {"memory": "1024", "cpus": "1"},
+        "properties": {},
+        "snapshots": [],
+        "disks": {},
+    }
+
+
+def write_file(path, size):
+    """Create a file of 'size' bytes if its directory can exist."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(os.path.dirname(directory)):
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+
+
+class FakeVBox:
+    """Interprets VBoxManage command lines against an in-memory state."""
+
+    def __init__(self, state):
+        self.state = state
+        # Seconds the caller should sleep after the command (outside any lock).
+        self.pending_sleep = 0
+        self.state.setdefault("vms", {})
+        self.state.setdefault("cfg_dir", "/fake/VirtualBox VMs")
+
+    # --- Helpers ---
+
+    def _vm(self, name_or_uuid):
+        for vm in self.state["vms"].values():
+            if name_or_uuid in (vm["name"], vm["uuid"]):
+                return vm
+        raise LookupError(
+            f"VBoxManage: error: Could not find a registered machine named "
+            f"'{name_or_uuid}'"
+        )
+
+    @staticmethod
+    def _options(args):
+        """Split '--key value' and '--key=value' style options into a dict."""
+        options, positional = {}, []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg.startswith("--"):
+                if "=" in arg:
+                    key, value = arg[2:].split("=", 1)
+                elif i + 1 < len(args) and not args[i + 1].startswith("--"):
+                    key, value = arg[2:], args[i + 1]
+                    i += 1
+                else:
+                    key, value = arg[2:], True
+                options[key] = value
+            else:
+                positional.append(arg)
+            i += 1
+        return options, positional
+
+    # --- Dispatch ---
+
+    def handle(self, argv):
+        """Run one command. Returns a (returncode, stdout, stderr) tuple."""
+        if not argv:
+            return 1, "", "VBoxManage: error: no command given\n"
+        handler = getattr(self, "cmd_" + argv[0].replace("-", "_"), None)
+        if handler is None:
+            return 1, "", f"VBoxManage: error: unknown command '{argv[0]}'\n"
+        try:
+            return 0, handler(argv[1:]) or "", ""
+        except LookupError as e:
+            return 1, "", f"{e.args[0]}\n"
+
+    def cmd_list(self, args):
+        if args[0] == "vms":
+            return "".join(
+                f'"{vm["name"]}" {{{vm["uuid"]}}}\n'
+                for vm in self.state["vms"].values()
+            )
+        if args[0] == "runningvms":
+            return "".join(
+                f'"{vm["name"]}" {{{vm["uuid"]}}}\n'
+                for vm in self.state["vms"].values()
+                if vm["state"] == "running"
+            )
+        if args[0] == "systemproperties":
+            return f"Default machine folder:          {self.state['cfg_dir']}\n"
+        if args[0] == "hdds":
+            return self._list_hdds()
+        if args[0] == "bridgedifs":
+            return f"Name:            {BRIDGED_ADAPTER}\nStatus:          Up\n\n"
+        raise LookupError(f"VBoxManage: error: unknown list '{args[0]}'")
+
+    def _add_medium(self, path, size_mb):
+        self.state.setdefault("media", {})[path] = size_mb
+        # Only disks in the machine folder are written, never in the repo.
+        folder = os.path.abspath(self.state["cfg_dir"]) + os.sep
+        if os.path.abspath(path).startswith(folder):
+            write_file(path, size_mb * 1024)
+
+    def cmd_createvm(self, args):
+        options, _ = self._options(args)
+        vm = new_vm(options["name"], self.state["cfg_dir"])
+        self.state["vms"][vm["name"]] = vm
+        write_file(vm["cfgfile"], 1024)
+
+    def cmd_clonevm(self, args):
+        options, positional = self._options(args)
+        source = self._vm(positional[0])
+        if "snapshot" in options:
+            if not any(s["uuid"] == options["snapshot"] for s in source["snapshots"]):
+                raise LookupError("VBoxManage: error: Could not find the snapshot")
+        if options.get("options") == "link" and "snapshot" not in options:
+            raise LookupError(
+                "VBoxManage: error: Linked clone requires specifying a snapshot"
+            )
+        vm = new_vm(options["name"], options.get("basefolder", self.state["cfg_dir"]))
+        vm["settings"] = dict(source["settings"])
+        vm["linked_to"] = options.get("snapshot")
+        write_file(vm["cfgfile"], 1024)
+        folder = os.path.dirname(vm["cfgfile"])
+        if vm["linked_to"]:
+            disk = os.path.join(folder, "Snapshots", f"{{{uuid.uuid4()}}}.vdi")
+            self._add_medium(disk, 2)
+        else:
+            disk = os.path.join(folder, f"{vm['name']}.vdi")
+            self._add_medium(disk, 64)
+        vm["disks"]["0"] = disk
+        if options.get("register"):
+            self.state["vms"][vm["name"]] = vm
+        else:
+            self.state.setdefault("unregistered", {})[vm["cfgfile"]] = vm
+
+    def cmd_registervm(self, args):
+        unregistered = self.state.setdefault("unregistered", {})
+        if args[0] not in unregistered:
+            raise LookupError(f"VBoxManage: error: Could not find file '{args[0]}'")
+        vm = unregistered.pop(args[0])
+        self.state["vms"][vm["name"]] = vm
+
+    def cmd_modifyvm(self, args):
+        vm = self._vm(args[0])
+        options, _ = self._options(args[1:])
+        for key, value in options.items():
+            vm["settings"][key] = str(value)
+
+    def cmd_startvm(self, args):
+        vm = self._vm(args[0])
+        vm["state"] = "running"
+        vm["state_change"] = timestamp()
+        boot_seconds = self.state.get("boot_seconds", 0)
+        if isinstance(boot_seconds, dict):
+            boot_seconds = boot_seconds.get(vm["name"], 0)
+        vm["booted_at"] = time.time() + boot_seconds
+
+    def _guest_info(self, vm):
+        """Publish what the guest reports once it has booted."""
+        if vm["state"] == "running" and time.time() >= vm.get("booted_at", 0):
+            index = list(self.state["vms"]).index(vm["name"])
+            vm["properties"].setdefault(IP_PROPERTY, f"10.0.2.{index + 10}")
+            if self.state.get("ready_service", True):
+                vm["properties"].setdefault(READY_PROPERTY, "12.34")
+
+    def _apply_identity(self, vm):
+        """What the guest's 'pivm-identity' service does."""
+        if vm["state"] != "running" or not self.state.get("identity_service", True):
+            return
+        properties = vm["properties"]
+        vm["guest_hostname"] = properties.get("/VirtualBox/GuestAdd/hostname")
+        properties.pop("/VirtualBox/GuestAdd/password", None)
+        properties[IDENTITY_PROPERTY] = properties[REIDENTIFY_PROPERTY]
+
+    def cmd_guestproperty(self, args):
+        action, vm = args[0], self._vm(args[1])
+        if action == "set":
+            vm["properties"][args[2]] = args[3] if len(args) > 3 else ""
+            if args[2] == REIDENTIFY_PROPERTY:
+                self._apply_identity(vm)
+            return None
+        if action == "get":
+            self._guest_info(vm)
+            if args[2] in vm["properties"]:
+                return f"Value: {vm['properties'][args[2]]}\n"
+            return "No value set!\n"
+        if action == "wait":
+            options, _ = self._options(args[3:])
+            timeout = int(options.get("timeout", 60000)) / 1000
+            booting = vm["state"] == "running" and "booted_at" in vm
+            until_boot = vm["booted_at"] - time.time() if booting else timeout
+            # Like VirtualBox, only changes after the wait began are reported.
+            if 0 < until_boot <= timeout:
+                self.pending_sleep = until_boot
+                return f"Name: {IP_PROPERTY}, value: 10.0.2.99, flags:\n"
+            self.pending_sleep = timeout
+            raise LookupError(
+                "Time out or interruption while waiting for a notification."
+            )
+        raise LookupError(f"VBoxManage: error: unknown guestproperty '{action}'")
+
+    def cmd_snapshot(self, args):
+        vm = self._vm(args[0])
+        action = args[1]
+        if action == "take":
+            options, _ = self._options(args[3:])
+            vm["snapshots"].append(
+                {
+                    "name": args[2],
+                    "uuid": str(uuid.uuid4()),
+                    "description": options.get("description", ""),
+                }
+            )
+            return None
+        if action == "edit":
+            options, _ = self._options(args[3:])
+            for snapshot in vm["snapshots"]:
+                if args[2] in (snapshot["name"], snapshot["uuid"]):
+                    snapshot["description"] = options.get("description", "")
+                    return None
+            raise LookupError("VBoxManage: error: Could not find the snapshot")
+        raise LookupError(f"VBoxManage: error: unknown snapshot action '{action}'")
+
+    def cmd_showvminfo(self, args):
+        vm = self._vm(args[0])
+        lines = [
+            f'name="{vm["name"]}"',
+            f'UUID="{vm["uuid"]}"',
+            f'CfgFile="{vm["cfgfile"]}"',
+            f'VMState="{vm["state"]}"',
+            f'VMStateChangeTime="{vm["state_change"]}"',
+        ]
+        for key, value in vm["settings"].items():
+            lines.append(f'{key}="{value}"')
+        for port, disk in sorted(vm["disks"].items()):
+            lines.append(f'"SATA Controller-{port}-0"="{disk}"')
+        suffix = ""
+        for snapshot in vm["snapshots"]:
+            lines.append(f'SnapshotName{suffix}="{snapshot["name"]}"')
+            lines.append(f'SnapshotUUID{suffix}="{snapshot["uuid"]}"')
+            if snapshot["description"]:
+                lines.append(f'SnapshotDescription{suffix}="{snapshot["description"]}"')
+            suffix += "-1"
+        if vm["snapshots"]:
+            current = vm["snapshots"][-1]
+            lines.append(f'CurrentSnapshotName="{current["name"]}"')
+            lines.append(f'CurrentSnapshotUUID="{current["uuid"]}"')
+        return "\n".join(lines) + "\n"
+
+    def cmd_createhd(self, args):
+        options, _ = self._options(args)
+        self._add_medium(options["filename"], int(options["size"]))
+
+    cmd_createmedium = cmd_createhd
+
+    def cmd_export(self, args):
+        """Write a synthetic appliance: 'export_size' bytes derived from the name."""
+        vm = self._vm(args[0])
+        options, _ = self._options(args[1:])
+        pattern = f"{vm['name']} appliance data\n".encode()
+        size = self.state.get("export_size", 256 * 1024)
+        with open(options["output"], "wb") as f:
+            f.write((pattern * (size // len(pattern) + 1))[:size])
+
+    def cmd_controlvm(self, args):
+        vm = self._vm(args[0])
+        if args[1] != "poweroff":
+            raise LookupError(f"VBoxManage: error: unknown controlvm '{args[1]}'")
+        if vm["state"] not in ("running", "paused", "stuck"):
+            raise LookupError("VBoxManage: error: Machine is not currently running")
+        vm["state"] = "poweroff"
+        vm["state_change"] = timestamp()
+        vm["session_locked"] = self.state.get("poweroff_lock", 0)
+        # Transient properties are cleared when the VM powers off.
+        for key in (IP_PROPERTY, READY_PROPERTY, IDENTITY_PROPERTY):
+            vm["properties"].pop(key, None)
+
+    def cmd_discardstate(self, args):
+        vm = self._vm(args[0])
+        if vm["state"] != "saved":
+            raise LookupError("VBoxManage: error: Machine is not in saved state")
+        vm["state"] = "poweroff"
+        vm["state_change"] = timestamp()
+
+    def cmd_unregistervm(self, args):
+        vm = self._vm(args[0])
+        if vm["state"] in ("running", "paused", "stuck", "saved"):
+            raise LookupError(
+                f"VBoxManage: error: Cannot unregister the machine '{vm['name']}' "
+                "while it is locked"
+            )
+        if vm.get("session_locked"):
+            vm["session_locked"] -= 1
+            raise LookupError(
+                f"VBoxManage: error: Cannot unregister the machine '{vm['name']}' "
+                "while it is locked"
+            )
+        del self.state["vms"][vm["name"]]
+        if "--delete" in args:
+            for disk in vm["disks"].values():
+                if self.state.get("media", {}).pop(disk, None) is not None:
+                    if os.path.exists(disk):
+                        os.remove(disk)
+            shutil.rmtree(os.path.dirname(vm["cfgfile"]), ignore_errors=True)
+
+    def _medium_uuid(self, path):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, path))
+
+    def cmd_closemedium(self, args):
+        media = self.state.get("media", {})
+        for path in list(media):
+            if args[1] in (path, self._medium_uuid(path)):
+                users = [
+                    vm
+                    for vm in self.state["vms"].values()
+                    if path in vm["disks"].values()
+                ]
+                if users:
+                    raise LookupError(
+                        f"VBoxManage: error: Cannot close medium '{path}' because it "
+                        f"is still attached to {len(users)} virtual machines"
+                    )
+                del media[path]
+                if "--delete" in args and os.path.exists(path):
+                    os.remove(path)
+                return None
+        raise LookupError(f"VBoxManage: error: Could not find file '{args[1]}'")
+
+    def _list_hdds(self):
+        users = {}
+        for vm in self.state["vms"].values():
+            for disk in vm["disks"].values():
+                users.setdefault(disk, []).append(f"{vm['name']} (UUID: {vm['uuid']})")
+        blocks = []
+        for path, size in self.state.get("media", {}).items():
+            lines = [
+                f"UUID:           {self._medium_uuid(path)}",
+                "Parent UUID:    base",
+                f"State:          {'created' if os.path.exists(path) else 'inaccessible'}",
+                "Type:           normal (base)",
+                f"Location:       {path}",
+                "Storage format: VDI",
+                f"Capacity:       {size} MBytes",
+            ]
+            if path in users:
+                lines.append(f"In use by VMs:  {', '.join(users[path])}")
+            blocks.append("\n".join(lines) + "\n")
+        return "\n".join(blocks)
+
+    def cmd_storagectl(self, args):
+        self._vm(args[0])
+
+    def cmd_storageattach(self, args):
+        vm = self._vm(args[0])
+        options, _ = self._options(args[1:])
+        vm["disks"][str(options["port"])] = options["medium"]
+
+
+def main(argv):
+    """Entry point used by the VBoxManage wrapper script on PATH."""
+    state_path = os.environ["FAKE_VBOX_STATE"]
+    log_path = os.environ.get("FAKE_VBOX_LOG")
+    delay = float(os.environ.get("FAKE_VBOX_DELAY", "0"))
+
+    if delay:
+        time.sleep(delay)
+
+    # Serialize access to the state file so parallel callers don't lose updates.
+    with open(state_path + ".lock", "a") as lock:
+        if sys.platform != "win32":
+            import fcntl
+
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(state_path) as f:
+            state = json.load(f)
+        fake = FakeVBox(state)
+        returncode, stdout, stderr = fake.handle(argv)
+        with open(state_path, "w") as f:
+            json.dump(state, f)
+        if log_path:
+            with open(log_path, "a") as f:
+                f.write(json.dumps(argv) + "\n")
+
+    time.sleep(fake.pending_sleep)
+
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
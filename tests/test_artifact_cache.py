@@ -0,0 +1,99 @@
+# tests/test_artifact_cache.py
+import hashlib
+import os
+import threading
+
+import pytest
+
+from scripts import artifact_cache
+
+
+def make_file(path, content):
+    path.write_bytes(content)
+    return str(path), hashlib.sha256(content).hexdigest()
+
+
+def test_insert_and_fetch_round_trip(tmp_path, artifact_cache_dir):
+    """Tests that an artifact can be found by digest from any working directory."""
+    cache = artifact_cache.ArtifactCache()
+    source, digest = make_file(tmp_path / "debian.iso", b"iso contents")
+
+    assert cache.insert(source, digest) == digest
+    assert cache.root == str(artifact_cache_dir)
+
+    target = tmp_path / "other-project" / "isos" / "debian.iso"
+    assert cache.fetch(digest, str(target))
+    assert target.read_bytes() == b"iso contents"
+    assert not cache.fetch("0" * 64, str(tmp_path / "missing.iso"))
+
+
+def test_insert_rejects_wrong_digest(tmp_path):
+    """Tests that a file that does not match its digest is not cached."""
+    cache = artifact_cache.ArtifactCache()
+    source, _ = make_file(tmp_path / "setup.exe", b"tampered")
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        cache.insert(source, "1" * 64)
+
+    assert cache.entries() == []
+    assert os.listdir(os.path.join(cache.root, "tmp")) == []
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    """Tests that eviction keeps the most recently used artifacts."""
+    cache = artifact_cache.ArtifactCache(max_size=10**9)
+    digests = []
+    for index, name in enumerate(["a.iso", "b.iso", "c.iso"]):
+        _, digest = make_file(tmp_path / name, bytes([index]) * 1000)
+        cache.insert(str(tmp_path / name), digest)
+        # Make the usage order explicit: a.iso oldest, c.iso newest.
+        os.utime(cache._meta_path(digest), (1000 + index, 1000 + index))
+        digests.append(digest)
+
+    cache.lookup(digests[0])  # Using a.iso makes b.iso the oldest.
+    removed = cache.prune(max_size=2000)
+
+    assert [entry.name for entry in removed] == ["b.iso"]
+    assert [entry.name for entry in cache.entries()] == ["a.iso", "c.iso"]
+
+
+def test_concurrent_inserts_leave_one_complete_copy(tmp_path):
+    """Tests that racing inserts of the same artifact are safe."""
+    content = os.urandom(256 * 1024)
+    sources = [make_file(tmp_path / f"copy{i}.ova", content) for i in range(8)]
+    cache = artifact_cache.ArtifactCache()
+
+    threads = [
+        threading.Thread(target=cache.insert, args=(path, None)) for path, _ in sources
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    (entry,) = cache.entries()
+    assert entry.digest == sources[0][1]
+    assert entry.size == len(content)
+    assert os.listdir(os.path.join(cache.root, "tmp")) == []
+
+
+def test_cli_lists_and_prunes(tmp_path, capsys):
+    """Tests the 'ls' and 'prune' commands."""
+    source, digest = make_file(tmp_path / "debian.iso", b"x" * 2048)
+    artifact_cache.ArtifactCache().insert(source, digest)
+
+    assert artifact_cache.main(["ls"]) == 0
+    output = capsys.readouterr().out
+    assert digest[:16] in output and "debian.iso" in output
+    assert "1 artifacts, 2.0 KB" in output
+
+    assert artifact_cache.main(["prune", "--max-size", "0"]) == 0
+    assert "Removed debian.iso" in capsys.readouterr().out
+    assert artifact_cache.ArtifactCache().entries() == []
+
+
+def test_parse_size():
+    """Tests human-readable size limits."""
+    assert artifact_cache.parse_size("0") == 0
+    assert artifact_cache.parse_size("500M") == 500 * 1024**2
+    assert artifact_cache.parse_size("1.5GB") == int(1.5 * 1024**3)
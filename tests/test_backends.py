@@ -0,0 +1,233 @@
+# tests/test_backends.py
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import fake_vboxapi
+from scripts import backends, vm_manager
+
+
+class RecordingFallback:
+    """Stands in for the subprocess backend behind the 'vboxapi' backend."""
+
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, args, check=True):
+        self.calls.append(list(args))
+        return "passed on\n"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """A 'vboxapi' backend talking to the fake VirtualBox API."""
+    monkeypatch.setitem(sys.modules, "vboxapi", fake_vboxapi)
+    monkeypatch.setattr(fake_vboxapi, "OPERATION_SECONDS", 0.0)
+    backend = backends.VBoxApiBackend(fallback=RecordingFallback())
+    yield backend
+    if backend._manager is not None:
+        backend.close()
+
+
+def test_showvminfo_is_machine_readable(api):
+    """Tests that the translated 'showvminfo' parses like VBoxManage output."""
+    machine = api._vbox.add_machine(
+        "pi-master-template", description="serial:abc", groups=["/ci", "/pi"]
+    )
+    disk = fake_vboxapi.Medium("/vms/pi-master-template/disk.vdi")
+    machine.mediumAttachments = [fake_vboxapi.Attachment("SATA Controller", 0, disk)]
+
+    info = vm_manager.parse_machine_readable(
+        api.execute(["showvminfo", "pi-master-template", "--machinereadable"])
+    )
+
+    assert info["UUID"] == machine.id
+    assert info["VMState"] == "poweroff"
+    assert (info["memory"], info["cpus"]) == ("1024", "1")
+    assert info["description"] == "serial:abc"
+    assert info["groups"] == "/ci,/pi"
+    assert vm_manager.attached_media(info) == [disk.location]
+    assert info["SATA Controller-ImageUUID-0-0"] == disk.id
+    # lastStateChange is in milliseconds since the epoch, reported in UTC.
+    assert info["VMStateChangeTime"] == "2023-11-14T22:13:20.000000000"
+    assert vm_manager.get_state_change_time(info) == 1_700_000_000
+
+
+def test_snapshots_are_listed_as_a_tree(api):
+    """Tests the snapshot keys used to find the linked-clone base snapshot."""
+    api._vbox.add_machine("pi-master-template")
+    api.execute(
+        ["snapshot", "pi-master-template", "take", "base", "--description", "one"]
+    )
+    api.execute(["snapshot", "pi-master-template", "take", "next"])
+
+    info = vm_manager.parse_machine_readable(
+        api.execute(["showvminfo", "pi-master-template", "--machinereadable"])
+    )
+
+    assert info["SnapshotName"] == "base"
+    assert info["SnapshotDescription"] == "one"
+    assert info["SnapshotName-1"] == "next"
+    assert info["CurrentSnapshotName"] == "next"
+    assert vm_manager.find_snapshot(info, "base", "one") == info["SnapshotUUID"]
+
+    api.execute(
+        ["snapshot", "pi-master-template", "edit", "base", "--description", "two"]
+    )
+    assert api._vbox.machines[0].snapshots[0].description == "two"
+    assert api._vbox.machines[0].locked_by is None
+
+
+def test_lists(api):
+    """Tests the 'list' commands, including the running-only filter."""
+    api._vbox.add_machine("pi-off")
+    running = api._vbox.add_machine(
+        "pi-on", state=fake_vboxapi.Constants.MachineState_Running
+    )
+
+    assert api.execute(["list", "vms"]).count("\n") == 2
+    assert api.execute(["list", "runningvms"]) == f'"pi-on" {{{running.id}}}\n'
+    assert api.execute(["list", "bridgedifs"]).startswith("Name:            eth0\n")
+    assert "Default machine folder:          /vms" in api.execute(
+        ["list", "systemproperties"]
+    )
+
+
+def test_modifyvm_translates_and_passes_on_the_rest(api):
+    """Tests that known settings use the API and the others go to VBoxManage."""
+    machine = api._vbox.add_machine("pi-vm")
+
+    api.execute(
+        ["modifyvm", "pi-vm", "--memory", "2048", "--cpus", "2", "--groups", "/ci"]
+    )
+
+    assert (machine.memorySize, machine.CPUCount, machine.saved) == (2048, 2, True)
+    assert machine.locked_by is None
+    assert api._fallback.calls == [["modifyvm", "pi-vm", "--groups=/ci"]]
+
+
+def test_guest_properties(api):
+    """Tests 'guestproperty get/set' and that 'wait' is passed on."""
+    api._vbox.add_machine("pi-vm")
+
+    assert api.execute(["guestproperty", "get", "pi-vm", "/x"]) == "No value set!\n"
+    api.execute(["guestproperty", "set", "pi-vm", "/x", "1"])
+    assert api.execute(["guestproperty", "get", "pi-vm", "/x"]) == "Value: 1\n"
+    assert api.execute(["guestproperty", "wait", "pi-vm", "/x"]) == "passed on\n"
+
+
+def test_clone_register_and_start(api):
+    """Tests 'clonevm' (linked, into a base folder), 'registervm' and 'startvm'."""
+    source = api._vbox.add_machine("pi-master-template", memorySize=512)
+    api.execute(["snapshot", "pi-master-template", "take", "base"])
+    snapshot = source.snapshots[0].id
+
+    api.execute(
+        [
+            "clonevm",
+            "pi-master-template",
+            "--name",
+            "pi-new",
+            "--snapshot",
+            snapshot,
+            "--options=link",
+            "--basefolder",
+            "/vms",
+        ]
+    )
+    assert "pi-new" not in api.execute(["list", "vms"])
+    api.execute(["registervm", "/vms/pi-new/pi-new.vbox"])
+    api.execute(["startvm", "pi-new", "--type", "headless"])
+
+    clone = api._vbox.findMachine("pi-new")
+    assert (clone.linked, clone.memorySize) == (True, 512)
+    assert clone.state == fake_vboxapi.Constants.MachineState_Running
+    assert clone.locked_by is None
+
+
+def test_errors_become_called_process_errors(api):
+    """Tests that API errors look like failed VBoxManage commands."""
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        api.execute(["startvm", "no-such-vm"])
+
+    assert e.value.cmd == "VBoxManage startvm no-such-vm"
+    assert "Could not find a registered machine" in e.value.stderr
+    assert api.execute(["showvminfo", "no-such-vm"], check=False) == ""
+
+
+def test_long_operations_do_not_block_other_commands(api, monkeypatch):
+    """Tests that clones run in parallel and queries answer during a clone."""
+    monkeypatch.setattr(fake_vboxapi, "OPERATION_SECONDS", 0.5)
+    api._vbox.add_machine("pi-master-template")
+    clones = [
+        threading.Thread(
+            target=api.execute,
+            args=(
+                ["clonevm", "pi-master-template", "--name", f"pi-{i}", "--register"],
+            ),
+        )
+        for i in range(3)
+    ]
+
+    started = time.perf_counter()
+    for thread in clones:
+        thread.start()
+    time.sleep(0.1)
+    query_started = time.perf_counter()
+    api.execute(["list", "vms"])
+    query_seconds = time.perf_counter() - query_started
+    for thread in clones:
+        thread.join()
+
+    assert query_seconds < 0.2
+    assert time.perf_counter() - started < 1.0
+    assert api.execute(["list", "vms"]).count("\n") == 4
+
+
+def test_close_deinitialises_the_manager(api):
+    """Tests that closing the backend ends the session with VBoxSVC."""
+    manager = api._manager
+
+    api.close()
+
+    assert manager.deinitialised
+    assert api._manager is None
+
+
+def test_template_fingerprint_does_not_depend_on_the_backend(api, fake_backend):
+    """Tests that both backends fingerprint the same machine identically."""
+    machine = api._vbox.add_machine(
+        "pi-master-template", memorySize=2048, CPUCount=2, description="serial:abc"
+    )
+    vm = fake_backend.add_vm(
+        "pi-master-template",
+        memory=2048,
+        cpus=2,
+        macaddress1=machine.getNetworkAdapter(0).MACAddress,
+        description="serial:abc",
+        groups="/",
+        # VBoxManage reports many more settings than the API backend does.
+        ostype="Debian (64-bit)",
+        vram=16,
+    )
+    vm.update(
+        uuid=machine.id,
+        cfgfile=machine.settingsFilePath,
+        state_change="2023-11-14T22:13:20.000000000",
+    )
+
+    fingerprints = [
+        vm_manager.get_template_fingerprint(
+            vm_manager.parse_machine_readable(
+                backend.execute(
+                    ["showvminfo", "pi-master-template", "--machinereadable"]
+                )
+            )
+        )
+        for backend in (api, fake_backend)
+    ]
+
+    assert fingerprints[0] == fingerprints[1]
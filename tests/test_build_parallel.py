@@ -0,0 +1,191 @@
+# tests/test_build_parallel.py
+import os
+import shutil
+import stat
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, ".")
+
+import build  # noqa: E402
+
+# Stands in for PyInstaller: sleeps, then writes dist/<spec>/<spec>.
+FAKE_PYINSTALLER = """
+import argparse, os, sys, time
+parser = argparse.ArgumentParser()
+parser.add_argument("--noconfirm", action="store_true")
+parser.add_argument("--workpath")
+parser.add_argument("--distpath")
+parser.add_argument("spec")
+args = parser.parse_args()
+name = os.path.splitext(args.spec)[0]
+with open(os.environ["FAKE_PYINSTALLER_CALLS"], "a") as f:
+    print(args.spec, file=f)
+print(f"INFO: Building {name}")
+time.sleep(float(os.environ.get("FAKE_PYINSTALLER_DELAY", "0")))
+if name.startswith("broken"):
+    print("ERROR: spec file is broken")
+    sys.exit(1)
+os.makedirs(os.path.join(args.workpath, name), exist_ok=True)
+os.makedirs(os.path.join(args.distpath, name))
+with open(os.path.join(args.distpath, name, name), "w") as f:
+    f.write("binary")
+print(f"INFO: Build complete! The results are available in: {args.distpath}")
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A project directory with a fake 'pyinstaller' at the front of the PATH."""
+    if sys.platform == "win32":
+        pytest.skip("The fake pyinstaller wrapper is a POSIX shell script.")
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "fake_pyinstaller.py"
+    script.write_text(FAKE_PYINSTALLER)
+    wrapper = bin_dir / "pyinstaller"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_PYINSTALLER_CALLS", str(tmp_path / "calls.log"))
+
+    root = tmp_path / "project"
+    root.mkdir()
+    for name in ("clone-vm", "create-master-vm", "downloader", "web-app"):
+        (root / f"{name}.spec").write_text("# spec\n")
+    monkeypatch.chdir(root)
+    return root
+
+
+def test_specs_build_in_parallel(project, monkeypatch, capsys):
+    """Tests that four slow builds take about as long as one."""
+    monkeypatch.setenv("FAKE_PYINSTALLER_DELAY", "1.0")
+
+    started = time.perf_counter()
+    assert build.main(["--jobs", "4"]) == 0
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 3.0  # Sequential builds would need more than 4 seconds.
+    for name in ("clone-vm", "create-master-vm", "downloader", "web-app"):
+        assert (project / "dist" / name / name).read_text() == "binary"
+        log = (project / "build" / "logs" / f"{name}.log").read_text()
+        assert f"--workpath {os.path.join('build', name)} " in log
+        assert "Build complete!" in log
+    output = capsys.readouterr().out
+    assert "--- Build summary ---" in output
+    assert "Wall clock" in output
+
+
+def test_failed_build_reports_log_and_keeps_others(project, capsys):
+    """Tests that one failing spec fails the run without hiding the others."""
+    (project / "broken.spec").write_text("# spec\n")
+
+    assert build.main(["--jobs", "2"]) == 1
+
+    captured = capsys.readouterr()
+    assert "ERROR building broken.spec" in captured.err
+    assert "spec file is broken" in captured.err  # The tail of its log.
+    assert "FAILED (1)" in captured.out
+    assert not (project / "dist" / "broken").exists()
+    assert (project / "dist" / "web-app" / "web-app").exists()
+
+
+def test_rebuild_replaces_previous_output(project):
+    """Tests that an app from an earlier build is replaced, not merged."""
+    stale = project / "dist" / "clone-vm" / "old-file"
+    stale.parent.mkdir(parents=True)
+    stale.write_text("old")
+
+    assert build.main() == 0
+
+    assert not stale.exists()
+    assert (project / "dist" / "clone-vm" / "clone-vm").exists()
+
+
+def built_specs(project):
+    """Return the specs the fake pyinstaller was run for, and forget them."""
+    calls = project.parent / "calls.log"
+    if not calls.exists():
+        return []
+    specs = sorted(calls.read_text().split())
+    calls.unlink()
+    return specs
+
+
+def test_unchanged_specs_are_skipped(project, capsys):
+    """Tests that a second build without changes runs no PyInstaller at all."""
+    assert build.main() == 0
+    assert len(built_specs(project)) == 4
+
+    assert build.main() == 0
+
+    assert built_specs(project) == []
+    assert capsys.readouterr().out.count("up to date") == 4
+
+
+def test_changed_module_rebuilds_only_its_specs(project):
+    """Tests that an import several levels deep is part of a spec's inputs."""
+    (project / "pkg").mkdir()
+    (project / "pkg" / "helper.py").write_text("VALUE = 1\n")
+    (project / "pkg" / "tool.py").write_text("from pkg import helper\n")
+    (project / "app.py").write_text("from pkg.tool import main\n")
+    (project / "templates").mkdir()
+    (project / "templates" / "index.html").write_text("<html>")
+    (project / "web-app.spec").write_text(
+        "a = Analysis(['app.py'], pathex=['.'], datas=[('templates', 'templates')])\n"
+    )
+    assert build.main() == 0
+    built_specs(project)
+
+    (project / "pkg" / "helper.py").write_text("VALUE = 2\n")
+    assert build.main() == 0
+    assert built_specs(project) == ["web-app.spec"]
+
+    (project / "templates" / "index.html").write_text("<html><body>")
+    assert build.main() == 0
+    assert built_specs(project) == ["web-app.spec"]
+
+
+def test_force_and_missing_output_rebuild(project):
+    """Tests --force, and that a deleted app in dist/ is rebuilt."""
+    assert build.main() == 0
+    built_specs(project)
+
+    shutil.rmtree(project / "dist" / "downloader")
+    assert build.main() == 0
+    assert built_specs(project) == ["downloader.spec"]
+
+    assert build.main(["--force"]) == 0
+    assert len(built_specs(project)) == 4
+
+
+def test_failed_build_is_retried(project):
+    """Tests that a failed spec is not recorded as up to date."""
+    (project / "broken.spec").write_text("# spec\n")
+    assert build.main() == 1
+    built_specs(project)
+
+    assert build.main() == 1
+
+    assert built_specs(project) == ["broken.spec"]
+
+
+def test_build_dir_holds_work_files_logs_and_manifest(project, tmp_path):
+    """Tests that --build-dir keeps every intermediate file out of the project."""
+    build_dir = tmp_path / "out"
+
+    assert build.main(["--build-dir", str(build_dir)]) == 0
+    assert build.main(["--build-dir", str(build_dir)]) == 0
+
+    assert not (project / "build").exists()
+    assert (project / "dist" / "clone-vm" / "clone-vm").exists()
+    assert (build_dir / "logs" / "clone-vm.log").exists()
+    assert (build_dir / "clone-vm").is_dir()
+    assert len(build.load_manifest(str(build_dir))) == 4
+    assert built_specs(project) == sorted(
+        f"{name}.spec"
+        for name in ("clone-vm", "create-master-vm", "downloader", "web-app")
+    )
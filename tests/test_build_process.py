@@ -5,6 +5,7 @@ import unittest
 import os
 import sys
 import shutil
+import tempfile
 
 # This test should be run from the root of the project, not the 'tests' directory.
 # We will configure PyCharm or the command line to do this.
@@ -24,6 +25,8 @@ class TestBuildProcessIntegration(unittest.TestCase):
             shutil.rmtree("build")
         if os.path.isdir("dist"):
             shutil.rmtree("dist")
+        # Work files, logs and the build manifest stay out of the project.
+        self.build_dir = tempfile.mkdtemp()
         print("✅ Setup complete.")
 
     def test_build_script_runs_successfully_and_creates_artifacts(self):
@@ -36,7 +39,7 @@ class TestBuildProcessIntegration(unittest.TestCase):
 
         # We call the main function directly.
         # We check its return code to see if it succeeded.
-        return_code = build_main()
+        return_code = build_main(["--build-dir", self.build_dir])
 
         # --- 2. ASSERT: Check that the script reported success ---
         print("\n--- ASSERT: Verifying build script success ---")
@@ -79,6 +82,7 @@ class TestBuildProcessIntegration(unittest.TestCase):
             shutil.rmtree("build")
         if os.path.isdir("dist"):
             shutil.rmtree("dist")
+        shutil.rmtree(self.build_dir, ignore_errors=True)
         print("✅ Teardown complete.")
 
 
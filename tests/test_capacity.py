@@ -0,0 +1,145 @@
+# tests/test_capacity.py
+import threading
+import time
+
+import pytest
+from conftest import write_fake_proc
+
+from scripts import capacity, clone_vm, inventory, vm_manager
+
+TEMPLATE = "pi-master-template"
+
+
+@pytest.fixture
+def small_host(fake_proc, fake_backend, monkeypatch):
+    """A 4-CPU, 5 GB host (4 GB for VMs) that notices stopped VMs quickly."""
+    write_fake_proc(fake_proc, cpus=4, memory_mb=5120)
+    monkeypatch.setenv(capacity.OVERCOMMIT_ENV_VAR, "1")
+    monkeypatch.setenv(inventory.TTL_ENV_VAR, "0")
+    monkeypatch.setattr(capacity, "_scheduler", capacity.Scheduler(poll=0.05))
+    fake_backend.add_vm(TEMPLATE)
+    return fake_backend
+
+
+def test_host_resources_come_from_proc(fake_proc):
+    """Tests that CPUs and memory are read from the (fake) /proc."""
+    write_fake_proc(fake_proc, cpus=6, memory_mb=8192)
+
+    assert capacity.read_host_resources() == (6, 8192)
+
+
+def test_budget_counts_running_vms(small_host):
+    """Tests that running VMs use the budget and stopped ones do not."""
+    small_host.add_vm("pi-up", memory=2048, cpus=2)["state"] = "running"
+    small_host.add_vm("pi-down", memory=2048, cpus=2)
+
+    budget = capacity.get_scheduler().budget()
+
+    assert (budget.memory_limit_mb, budget.cpu_limit) == (4096, 4)
+    assert (budget.used_memory_mb, budget.used_cpus) == (2048, 2)
+    assert (budget.free_memory_mb, budget.free_cpus, budget.running) == (2048, 2, 1)
+
+
+def test_start_waits_until_capacity_is_free(small_host):
+    """Tests that a start that does not fit is queued until a VM stops."""
+    small_host.add_vm("pi-big", memory=3072, cpus=1)["state"] = "running"
+    small_host.add_vm("pi-next", memory=2048, cpus=1)
+    messages = []
+
+    def start():
+        with vm_manager.capture_output(lambda msg, error: messages.append(msg)):
+            vm_manager.start_vm("pi-next", timeout=30)
+
+    thread = threading.Thread(target=start)
+    thread.start()
+    time.sleep(0.3)
+    assert small_host.state["vms"]["pi-next"]["state"] == "poweroff"
+    assert capacity.get_scheduler().budget().queued == 1
+
+    small_host.state["vms"]["pi-big"]["state"] = "poweroff"
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert small_host.state["vms"]["pi-next"]["state"] == "running"
+    assert any("Waiting for host capacity" in msg for msg in messages)
+
+
+def test_start_times_out_in_the_queue(small_host):
+    """Tests that a start gives up when capacity does not free up in time."""
+    small_host.add_vm("pi-big", memory=4096, cpus=1)["state"] = "running"
+    small_host.add_vm("pi-next", memory=512, cpus=1)
+
+    with pytest.raises(capacity.CapacityError, match="Timed out"):
+        vm_manager.start_vm("pi-next", timeout=0.2)
+
+    assert small_host.commands("startvm") == []
+    assert capacity.get_scheduler().budget().queued == 0
+
+
+def test_oversized_clone_is_created_but_not_started(small_host):
+    """Tests that a VM bigger than the host is refused without waiting."""
+    result = clone_vm.clone(clone_vm.CloneRequest("pi-huge", ram=8192, start=True))
+
+    assert not result.ok
+    assert "not started" in result.error
+    assert "at most 4096 MB" in result.error
+    assert small_host.state["vms"]["pi-huge"]["state"] == "poweroff"
+
+
+def test_parallel_starts_do_not_overcommit(small_host):
+    """Tests that concurrent starts are admitted only as far as memory allows."""
+    names = [f"pi-{i}" for i in range(3)]
+    for name in names:
+        small_host.add_vm(name, memory=2048, cpus=1)
+    errors = []
+
+    def start(name):
+        try:
+            vm_manager.start_vm(name, timeout=0.5)
+        except capacity.CapacityError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=start, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    running = [n for n in names if small_host.state["vms"][n]["state"] == "running"]
+    assert len(running) == 2
+    assert len(errors) == 1
+
+
+def test_resized_vm_is_measured_again_after_a_restart(small_host):
+    """Tests that a VM's cached size is dropped once it stops."""
+    vm = small_host.add_vm("pi-up", memory=1024, cpus=1)
+    vm["state"] = "running"
+    scheduler = capacity.get_scheduler()
+    assert scheduler.budget().used_memory_mb == 1024
+
+    vm["state"] = "poweroff"
+    assert scheduler.budget().used_memory_mb == 0
+    vm_manager.run(["modifyvm", "pi-up", "--memory", "3072"])
+    vm["state"] = "running"
+
+    assert scheduler.budget().used_memory_mb == 3072
+
+
+def test_vms_are_read_without_holding_the_lock(small_host):
+    """Tests that a slow VBoxManage does not block other scheduler calls."""
+    small_host.add_vm("pi-up", memory=1024, cpus=1)["state"] = "running"
+    reading = threading.Event()
+
+    def slow_vm_info(uuid):
+        reading.set()
+        time.sleep(0.5)
+        return vm_manager.get_vm_info(uuid)
+
+    scheduler = capacity.Scheduler(vm_info=slow_vm_info, poll=0.05)
+    thread = threading.Thread(target=scheduler.budget)
+    thread.start()
+    assert reading.wait(timeout=5)
+    started = time.monotonic()
+    scheduler.release("pi-other")
+    assert time.monotonic() - started < 0.25
+    thread.join(timeout=5)
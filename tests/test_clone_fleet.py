@@ -0,0 +1,94 @@
+# tests/test_clone_fleet.py
+import time
+
+import pytest
+
+from scripts import clone_fleet
+
+TEMPLATE = "pi-master-template"
+
+
+def test_fleet_names_are_zero_padded():
+    """Tests that fleet names sort naturally and honour the first index."""
+    assert clone_fleet.fleet_names("pi-ci-", 3) == ["pi-ci-1", "pi-ci-2", "pi-ci-3"]
+    assert clone_fleet.fleet_names("pi-ci-", 12)[0] == "pi-ci-01"
+    assert clone_fleet.fleet_names("pi-ci-", 2, first_index=99) == [
+        "pi-ci-099",
+        "pi-ci-100",
+    ]
+
+
+def test_fleet_creates_all_vms(fake_vbox, capsys):
+    """Tests that every fleet member is cloned, registered and reported."""
+    fake_vbox.add_vm(TEMPLATE)
+
+    return_code = clone_fleet.main(
+        ["--count", "3", "--prefix", "pi-ci-", "--ram", "512"]
+    )
+
+    assert return_code == 0
+    vms = fake_vbox.read_state()["vms"]
+    for name in ("pi-ci-1", "pi-ci-2", "pi-ci-3"):
+        assert vms[name]["settings"]["memory"] == "512"
+    assert len(fake_vbox.commands("registervm")) == 3
+    output = capsys.readouterr().out
+    assert "3/3 VMs cloned successfully." in output
+    assert "Total wall-clock time:" in output
+
+
+def test_fleet_refuses_existing_names(fake_vbox, capsys):
+    """Tests that no clone is started when a fleet name is already taken."""
+    fake_vbox.add_vm(TEMPLATE)
+    fake_vbox.add_vm("pi-ci-2")
+
+    return_code = clone_fleet.main(["--count", "3", "--prefix", "pi-ci-"])
+
+    assert return_code == 1
+    assert fake_vbox.commands("clonevm") == []
+    assert "pi-ci-2" in capsys.readouterr().err
+
+
+def test_fleet_runs_clones_concurrently(fake_vbox, monkeypatch):
+    """Tests that parallel cloning is much faster than cloning one VM at a time."""
+    fake_vbox.add_vm(TEMPLATE)
+    # Every VBoxManage process sleeps first, like a real one starting up.
+    delay = 0.2
+    monkeypatch.setenv("FAKE_VBOX_DELAY", str(delay))
+    args = clone_fleet.parse_arguments(["--count", "8", "--jobs", "8"])
+    names = clone_fleet.fleet_names(args.prefix, args.count)
+
+    started = time.perf_counter()
+    results = clone_fleet.clone_fleet(names, args)
+    wall_clock = time.perf_counter() - started
+
+    assert all(error is None for _, error, _ in results)
+    # One after another, the fleet would take as long as all clones together.
+    sequential_time = sum(seconds for _, _, seconds in results)
+    assert wall_clock < 0.5 * sequential_time
+    # Registrations are serialized, everything else overlaps.
+    assert len(fake_vbox.commands("registervm")) == 8
+    assert sorted(fake_vbox.read_state()["vms"]) == sorted(names + [TEMPLATE])
+
+
+def test_help_works_without_virtualbox(monkeypatch, capsys):
+    """Tests that --help is answered before VBoxManage is looked for."""
+
+    def no_virtualbox():
+        raise AssertionError("setup_environment() was called")
+
+    monkeypatch.setattr(clone_fleet.vm_manager, "setup_environment", no_virtualbox)
+
+    with pytest.raises(SystemExit) as exit_info:
+        clone_fleet.main(["--help"])
+
+    assert exit_info.value.code == 0
+    assert "--count" in capsys.readouterr().out
+
+
+def test_wait_ready_requires_start(capsys):
+    """Tests that --wait-ready without --start is a usage error, not a no-op."""
+    with pytest.raises(SystemExit) as exit_info:
+        clone_fleet.parse_arguments(["--count", "2", "--wait-ready"])
+
+    assert exit_info.value.code == 2
+    assert "--wait-ready requires --start" in capsys.readouterr().err
@@ -1,5 +1,7 @@
 # tests/test_clone_vm.py
 
+import pytest
+
 from scripts import clone_vm
 
 
@@ -50,6 +52,15 @@ def test_parsing_with_only_required_name(monkeypatch):
     assert args.disk_size is None
 
 
+def test_wait_ready_requires_start(capsys):
+    """Tests that --wait-ready without --start is a usage error, not a no-op."""
+    with pytest.raises(SystemExit) as exit_info:
+        clone_vm.parse_arguments(["my-pi", "--wait-ready"])
+
+    assert exit_info.value.code == 2
+    assert "--wait-ready requires --start" in capsys.readouterr().err
+
+
 def test_parsing_with_some_arguments(monkeypatch):
     """
     Tests if the script correctly parses a mix of provided and omitted arguments.
@@ -63,3 +74,71 @@ def test_parsing_with_some_arguments(monkeypatch):
     assert args.ram == 4096
     assert args.cpus is None
     assert args.disk_size is None
+
+
+def test_parsing_linked_flag(monkeypatch):
+    """
+    Tests that the --linked flag is parsed and defaults to a full clone.
+    """
+    monkeypatch.setattr("sys.argv", ["clone_vm.py", "my-linked-pi", "--linked"])
+    assert clone_vm.parse_arguments().linked is True
+
+    monkeypatch.setattr("sys.argv", ["clone_vm.py", "my-full-pi"])
+    assert clone_vm.parse_arguments().linked is False
+
+
+def test_main_clones_with_fake_backend(fake_backend, monkeypatch, capsys):
+    """
+    Tests the complete command-line clone flow against an in-process backend.
+    """
+    fake_backend.add_vm(clone_vm.SOURCE_VM_NAME)
+    monkeypatch.setattr(clone_vm.vm_manager, "setup_environment", lambda: True)
+    monkeypatch.setattr(
+        "sys.argv", ["clone_vm.py", "my-fast-pi", "--cpus", "2", "--start"]
+    )
+
+    assert clone_vm.main() == 0
+    assert fake_backend.state["vms"]["my-fast-pi"]["settings"]["cpus"] == "2"
+    assert "Cloning complete!" in capsys.readouterr().out
+
+
+def test_clone_returns_structured_errors(fake_backend):
+    """
+    Tests that clone() reports problems as a result instead of printing them.
+    """
+    result = clone_vm.clone(clone_vm.CloneRequest("my-orphan-pi"))
+
+    assert not result.ok
+    assert "does not exist" in result.error
+    assert "my-orphan-pi" not in fake_backend.state["vms"]
+
+
+def test_clone_output_can_be_captured(fake_backend, capsys):
+    """
+    Tests that progress messages go to a capture function instead of stdout.
+    """
+    fake_backend.add_vm(clone_vm.SOURCE_VM_NAME)
+    messages = []
+
+    with clone_vm.vm_manager.capture_output(lambda msg, error: messages.append(msg)):
+        result = clone_vm.clone(clone_vm.CloneRequest("my-quiet-pi", ram=512))
+
+    assert result.ok
+    assert result.duration > 0
+    assert any(msg.startswith("Running: VBoxManage clonevm") for msg in messages)
+    assert capsys.readouterr().out == ""
+
+
+def test_main_waits_until_started_clone_is_ready(fake_backend, monkeypatch, capsys):
+    """
+    Tests that --wait-ready reports the clone once the guest is ready.
+    """
+    fake_backend.add_vm(clone_vm.SOURCE_VM_NAME)
+    fake_backend.state["boot_seconds"] = 0.2
+    monkeypatch.setattr(clone_vm.vm_manager, "setup_environment", lambda: True)
+    monkeypatch.setattr(
+        "sys.argv", ["clone_vm.py", "my-ready-pi", "--start", "--wait-ready"]
+    )
+
+    assert clone_vm.main() == 0
+    assert "VM 'my-ready-pi' is ready at 10.0.2." in capsys.readouterr().out
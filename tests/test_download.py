@@ -0,0 +1,309 @@
+# tests/test_download.py
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts import create_master_vm, download
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with optional range support and injected disconnects."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.payload)))
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        payload = self.server.payload
+        start, end = 0, len(payload) - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        with self.server.lock:
+            self.server.ranges_requested.append(self.headers.get("Range"))
+            drop_after = (
+                self.server.disconnects.pop(0) if self.server.disconnects else None
+            )
+        if match and self.server.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else end
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+        else:
+            self.send_response(200)
+        body = payload[start : end + 1]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if drop_after is not None:
+            # Send part of the body, then drop the connection.
+            self.wfile.write(body[:drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    httpd.payload = PAYLOAD
+    httpd.ranges = True
+    httpd.disconnects = []
+    httpd.ranges_requested = []
+    httpd.lock = threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/debian.iso"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_is_verified_and_moved_into_place(server, tmp_path):
+    """Tests a plain download: the file only appears once it is verified."""
+    target = tmp_path / "isos" / "debian.iso"
+
+    download.download_file(server.url, str(target), sha256=DIGEST)
+
+    assert target.read_bytes() == PAYLOAD
+    assert not os.path.exists(f"{target}.part")
+
+
+def test_download_resumes_after_disconnect(server, tmp_path):
+    """Tests that a dropped connection is resumed with a Range request."""
+    server.disconnects = [1024 * 1024]
+    target = tmp_path / "debian.iso"
+
+    download.download_file(server.url, str(target), sha256=DIGEST)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.ranges_requested == ["bytes=0-", f"bytes={1024 * 1024}-"]
+
+
+def test_download_resumes_existing_part_file(server, tmp_path):
+    """Tests that a '.part' file left by an earlier run is continued."""
+    target = tmp_path / "debian.iso"
+    (tmp_path / "debian.iso.part").write_bytes(PAYLOAD[:5000])
+
+    download.download_file(server.url, str(target), sha256=DIGEST)
+
+    assert target.read_bytes() == PAYLOAD
+    assert server.ranges_requested == ["bytes=5000-"]
+
+
+def test_segmented_download_survives_disconnects(server, tmp_path, monkeypatch):
+    """Tests parallel range segments, each resuming after a disconnect."""
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 512 * 1024)
+    server.disconnects = [100_000, 200_000, 300_000]
+    target = tmp_path / "debian.iso"
+    seen = []
+
+    download.download_file(
+        server.url,
+        str(target),
+        sha256=DIGEST,
+        segments=4,
+        progress=lambda done, total: seen.append((done, total)),
+    )
+
+    assert target.read_bytes() == PAYLOAD
+    assert len(server.ranges_requested) == 4 + 3
+    assert seen[-1] == (len(PAYLOAD), len(PAYLOAD))
+    assert not os.path.exists(f"{target}.part.json")
+
+
+def test_interrupted_segmented_download_resumes(server, tmp_path, monkeypatch):
+    """Tests that the saved segment state lets a later run skip finished bytes."""
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 512 * 1024)
+    monkeypatch.setattr(download, "RETRIES", 0)
+    server.disconnects = [0, 0, 0, 0]
+    target = tmp_path / "debian.iso"
+
+    with pytest.raises(download.DownloadError):
+        download.download_file(server.url, str(target), sha256=DIGEST, segments=2)
+    assert os.path.exists(f"{target}.part.json")
+
+    server.disconnects = []
+    download.download_file(server.url, str(target), sha256=DIGEST, segments=2)
+
+    assert target.read_bytes() == PAYLOAD
+
+
+def test_checksum_mismatch_removes_download(server, tmp_path):
+    """Tests that a corrupt download is neither kept nor moved into place."""
+    target = tmp_path / "debian.iso"
+
+    with pytest.raises(download.DownloadError, match="Checksum mismatch"):
+        download.download_file(server.url, str(target), sha256="0" * 64)
+
+    assert not target.exists()
+    assert not os.path.exists(f"{target}.part")
+
+
+def test_server_without_ranges_downloads_whole_file(server, tmp_path):
+    """Tests that a stale '.part' file is discarded when ranges are unsupported."""
+    server.ranges = False
+    target = tmp_path / "debian.iso"
+    (tmp_path / "debian.iso.part").write_bytes(b"stale")
+
+    download.download_file(server.url, str(target), sha256=DIGEST, segments=4)
+
+    assert target.read_bytes() == PAYLOAD
+
+
+def test_digest_is_computed_while_downloading(server, tmp_path, monkeypatch):
+    """Tests that verification needs no extra pass and records the result."""
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 512 * 1024)
+
+    def no_rehash(path, chunk_size=None):
+        raise AssertionError("the downloaded file was hashed again")
+
+    monkeypatch.setattr(download, "file_sha256", no_rehash)
+    target = tmp_path / "debian.iso"
+    (tmp_path / "debian.iso.part").write_bytes(PAYLOAD[:5000])
+
+    download.download_file(server.url, str(target), sha256=DIGEST)
+    assert download.recorded_sha256(str(target)) == DIGEST
+    assert download.verify_file(str(target), DIGEST)
+
+    segmented = tmp_path / "segmented.iso"
+    download.download_file(server.url, str(segmented), sha256=DIGEST, segments=4)
+    assert download.verify_file(str(segmented), DIGEST)
+
+
+def test_changed_file_is_hashed_again(tmp_path):
+    """Tests that a verification record is ignored once the file changes."""
+    iso = tmp_path / "debian.iso"
+    iso.write_bytes(b"original")
+    digest = hashlib.sha256(b"original").hexdigest()
+    assert download.verify_file(str(iso), digest)
+
+    iso.write_bytes(b"tampered")
+
+    assert download.recorded_sha256(str(iso)) is None
+    assert not download.verify_file(str(iso), digest)
+
+
+def test_create_master_vm_reuses_cached_iso(server, tmp_path, monkeypatch):
+    """Tests that a second working directory gets the ISO from the cache."""
+    monkeypatch.chdir(tmp_path)
+    first = os.path.abspath(
+        create_master_vm.verify_and_download_iso("debian.iso", server.url, DIGEST)
+    )
+    requests_after_download = len(server.ranges_requested)
+
+    monkeypatch.chdir(tmp_path / "isos")  # Another checkout, another 'isos/'.
+    second = create_master_vm.verify_and_download_iso("debian.iso", server.url, DIGEST)
+
+    assert len(server.ranges_requested) == requests_after_download
+    assert open(second, "rb").read() == PAYLOAD
+    assert first != os.path.abspath(second)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progress_is_throttled(tmp_path):
+    """Tests that thousands of chunk updates produce only a few lines."""
+    clock = FakeClock()
+    out = io.StringIO()
+    reporter = download.ProgressReporter("json", interval=0.1, stream=out, clock=clock)
+    update = reporter.track("debian.iso")
+
+    for done in range(0, 1_000_001, 100):  # 10,001 chunks over one second.
+        clock.now = done / 1_000_000
+        update(done, 1_000_000)
+    reporter.finish()
+
+    events = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(events) <= 13
+    assert events[-2]["done"] == events[-2]["total"] == 1_000_000
+    assert events[-1] == {"event": "done"}
+
+
+def test_json_progress_reports_rate_and_eta():
+    """Tests the machine-readable progress fields for concurrent downloads."""
+    clock = FakeClock()
+    out = io.StringIO()
+    reporter = download.ProgressReporter("json", stream=out, clock=clock)
+    reporter.track("a.ova")(0, 4000)
+    reporter.track("b.exe")(0, 1000)
+    clock.now = 2.0
+    reporter.track("a.ova")(1000, 4000)
+    clock.now = 4.0
+    reporter.track("b.exe")(1000, 1000)
+
+    event = json.loads(out.getvalue().splitlines()[-1])
+    assert event["done"] == 2000 and event["total"] == 5000
+    assert event["rate"] == 500.0
+    assert event["eta"] == 6.0
+    assert event["files"]["b.exe"] == {"done": 1000, "total": 1000}
+
+
+def test_quiet_progress_writes_nothing(server, tmp_path):
+    """Tests that quiet mode leaves the output to the caller."""
+    out = io.StringIO()
+    reporter = download.ProgressReporter("quiet", stream=out)
+
+    download.download_file(
+        server.url,
+        str(tmp_path / "debian.iso"),
+        sha256=DIGEST,
+        progress=reporter.track("debian.iso"),
+    )
+    reporter.finish()
+
+    assert out.getvalue() == ""
+
+
+def test_resumed_download_keeps_json_output_parseable(server, tmp_path, capsys):
+    """Tests that resume notices become JSON events in 'json' mode."""
+    server.disconnects = [1024 * 1024]
+    target = tmp_path / "debian.iso"
+    (tmp_path / "debian.iso.part").write_bytes(PAYLOAD[:5000])
+    reporter = download.ProgressReporter("json")
+
+    download.download_file(
+        server.url,
+        str(target),
+        sha256=DIGEST,
+        progress=reporter.track("debian.iso"),
+        log=reporter.notice,
+    )
+    reporter.finish()
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    messages = [event["text"] for event in events if event["event"] == "message"]
+    assert messages[0] == "Resuming download at 0.00MB."
+    assert messages[1].startswith("Connection lost")
+    assert events[-1] == {"event": "done"}
+
+
+def test_quiet_progress_hides_resume_notices(server, tmp_path, capsys):
+    """Tests that quiet mode does not report resumed downloads either."""
+    (tmp_path / "debian.iso.part").write_bytes(PAYLOAD[:5000])
+    reporter = download.ProgressReporter("quiet")
+
+    download.download_file(
+        server.url, str(tmp_path / "debian.iso"), sha256=DIGEST, log=reporter.notice
+    )
+
+    assert capsys.readouterr().out == ""
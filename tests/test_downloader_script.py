@@ -1,103 +1,260 @@
 # tests/test_downloader_script.py
-import pytest
-import requests
+import hashlib
+import json
 import os
-from unittest.mock import patch, MagicMock, mock_open
-
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
 
 sys.path.insert(0, ".")
 
-from download_latest_release import download_latest_release_assets
+from download_latest_release import download_latest_release_assets  # noqa: E402
+from scripts import artifact_cache  # noqa: E402
 
+OVA = os.urandom(512 * 1024)
+EXE = b"MZ" + os.urandom(20 * 1024)
 
-@patch("requests.get")
-@patch("os.path.exists")
-@patch("os.makedirs")
-@patch("builtins.open", new_callable=mock_open)
-def test_download_happy_path(
-    mock_open_file, mock_makedirs, mock_exists, mock_requests_get
-):
-    """Tests the ideal workflow where everything succeeds."""
-    # Arrange
-    # 1. Mock the GitHub API response
-    mock_api_response = MagicMock()
-    mock_api_response.json.return_value = {
-        "name": "v1.2.3",
-        "assets": [
-            {
-                "name": "pi-server-vm.ova",
-                "browser_download_url": "http://example.com/pi.ova",
-            },
-            {
-                "name": "setup.exe",
-                "browser_download_url": "http://example.com/setup.exe",
-            },
-            {
-                "name": "source.zip",
-                "browser_download_url": "http://example.com/source.zip",
-            },  # Should be ignored
-        ],
+
+class GitHubHandler(BaseHTTPRequestHandler):
+    """A stand-in for the GitHub releases API and its asset downloads."""
+
+    def log_message(self, *args):
+        pass
+
+    def _release(self):
+        base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        return {
+            "name": "v1.2.3",
+            "assets": [
+                {
+                    "id": int(hashlib.sha256(content).hexdigest()[:8], 16),
+                    "name": name,
+                    "size": len(content),
+                    "digest": f"sha256:{hashlib.sha256(content).hexdigest()}",
+                    "browser_download_url": f"{base}/download/{name}",
+                }
+                for name, content in self.server.assets.items()
+            ],
+        }
+
+    def _send_asset(self, body):
+        content = self.server.assets[self.path.rsplit("/", 1)[-1]]
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if body:
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(
+                    self.server.max_in_flight, self.server.in_flight
+                )
+            # Serve slowly enough for downloads to overlap.
+            for i in range(0, len(content), 64 * 1024):
+                self.wfile.write(content[i : i + 64 * 1024])
+                time.sleep(self.server.delay)
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", self.path))
+        self._send_asset(body=False)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        if self.path.startswith("/download/"):
+            return self._send_asset(body=True)
+        if self.server.api_status != 200:
+            self.send_response(self.server.api_status)
+            self.end_headers()
+            return
+        body = json.dumps(self._release()).encode()
+        etag = f'W/"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def github():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), GitHubHandler)
+    httpd.assets = {
+        "pi-server-vm.ova": OVA,
+        "setup.exe": EXE,
+        "source.zip": b"ignored",
     }
-    mock_api_response.raise_for_status = MagicMock()
-
-    # 2. Mock the asset download response
-    mock_download_response = MagicMock()
-    mock_download_response.raise_for_status = MagicMock()
-    mock_download_response.iter_content.return_value = [b"chunk1", b"chunk2"]
-    mock_download_response.headers = {"content-length": "16"}
-
-    mock_requests_get.side_effect = [
-        mock_api_response,
-        mock_download_response,
-        mock_download_response,
-    ]
-    mock_exists.return_value = False
-
-    # Act
-    download_latest_release_assets("TestOwner", "TestRepo")
-
-    # Assert
-    mock_exists.assert_called_once_with("latest_release")
-    mock_makedirs.assert_called_once_with("latest_release")
-    assert mock_requests_get.call_count == 3
-    mock_requests_get.assert_any_call(
-        "https://api.github.com/repos/TestOwner/TestRepo/releases/latest"
+    httpd.api_status = 200
+    httpd.delay = 0
+    httpd.requests = []
+    httpd.lock = threading.Lock()
+    httpd.in_flight = httpd.max_in_flight = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.api_base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def asset_requests(server):
+    return [path for _, path in server.requests if path.startswith("/download/")]
+
+
+def run(github, tmp_path, **kwargs):
+    return download_latest_release_assets(
+        "TestOwner",
+        "TestRepo",
+        download_dir=str(tmp_path / "latest_release"),
+        api_base=github.api_base,
+        **kwargs,
     )
-    mock_requests_get.assert_any_call("http://example.com/pi.ova", stream=True)
-    mock_requests_get.assert_any_call("http://example.com/setup.exe", stream=True)
-    expected_ova_path = os.path.join("latest_release", "pi-server-vm.ova")
-    expected_exe_path = os.path.join("latest_release", "setup.exe")
-    mock_open_file.assert_any_call(expected_ova_path, "wb")
-    mock_open_file.assert_any_call(expected_exe_path, "wb")
 
 
-@patch("requests.get")
-def test_download_api_fails(mock_requests_get, capsys):
+def test_download_happy_path(github, tmp_path, capsys):
+    """Tests the ideal workflow where everything succeeds."""
+    results = run(github, tmp_path)
+
+    assert {r.name: r.status for r in results} == {
+        "pi-server-vm.ova": "downloaded",
+        "setup.exe": "downloaded",
+    }
+    assert (tmp_path / "latest_release" / "pi-server-vm.ova").read_bytes() == OVA
+    assert (tmp_path / "latest_release" / "setup.exe").read_bytes() == EXE
+    assert not (tmp_path / "latest_release" / "source.zip").exists()
+    assert ("GET", "/repos/TestOwner/TestRepo/releases/latest") in github.requests
+    output = capsys.readouterr().out
+    assert "MB/s)" in output
+    assert "aggregate" in output
+
+
+def test_json_progress_keeps_stdout_machine_readable(github, tmp_path, capsys):
+    """Tests that '--progress json' prints only JSON lines on stdout."""
+    run(github, tmp_path, progress_mode="json")
+
+    captured = capsys.readouterr()
+    events = [json.loads(line) for line in captured.out.splitlines()]
+    messages = [e["text"] for e in events if e["event"] == "message"]
+    assert len(messages) == 2 and all("downloaded" in text for text in messages)
+    assert events[-1] == {"event": "done"}
+    assert "Starting download process" in captured.err
+    assert "aggregate" in captured.err
+
+
+def test_assets_download_concurrently(github, tmp_path):
+    """Tests that the installer does not wait for the OVA to finish."""
+    github.delay = 0.02
+
+    run(github, tmp_path, jobs=2)
+
+    assert github.max_in_flight == 2
+
+
+def test_present_assets_are_skipped(github, tmp_path):
+    """Tests that a second run only asks for the release metadata."""
+    run(github, tmp_path)
+    github.requests.clear()
+
+    results = run(github, tmp_path)
+
+    assert {r.status for r in results} == {"present"}
+    assert asset_requests(github) == []
+
+
+def test_changed_asset_is_downloaded_again(github, tmp_path):
+    """Tests that a file with the wrong size is replaced."""
+    run(github, tmp_path)
+    (tmp_path / "latest_release" / "setup.exe").write_bytes(b"truncated")
+    artifact_cache.ArtifactCache().prune(max_size=0)
+    github.requests.clear()
+
+    results = run(github, tmp_path)
+
+    assert {r.name: r.status for r in results}["setup.exe"] == "downloaded"
+    assert (tmp_path / "latest_release" / "setup.exe").read_bytes() == EXE
+    assert set(asset_requests(github)) == {"/download/setup.exe"}
+
+
+def test_download_uses_artifact_cache(github, tmp_path):
+    """Tests that assets with a published digest are taken from the cache."""
+    run(github, tmp_path / "first-checkout")
+    github.requests.clear()
+
+    results = run(github, tmp_path / "second-checkout")
+
+    assert {r.status for r in results} == {"cached"}
+    assert asset_requests(github) == []
+    ova = tmp_path / "second-checkout" / "latest_release" / "pi-server-vm.ova"
+    assert ova.read_bytes() == OVA
+
+
+def test_download_api_fails(github, tmp_path, capsys):
     """Tests that the script handles a failure to connect to the GitHub API."""
-    # Arrange
-    mock_requests_get.side_effect = requests.exceptions.RequestException("API is down")
+    github.api_status = 500
 
-    # Act
-    download_latest_release_assets("TestOwner", "TestRepo")
+    assert run(github, tmp_path) is None
 
-    # Assert
     captured = capsys.readouterr()
-    assert "Error fetching release data: API is down" in captured.out
+    assert "Error fetching release data: 500" in captured.out
 
 
-@patch("requests.get")
-def test_download_no_assets_in_release(mock_requests_get, capsys):
+def test_download_no_assets_in_release(github, tmp_path, capsys):
     """Tests that the script handles a release with no downloadable assets."""
-    # Arrange
-    mock_api_response = MagicMock()
-    mock_api_response.json.return_value = {"name": "v1.2.4", "assets": []}
-    mock_api_response.raise_for_status = MagicMock()
-    mock_requests_get.return_value = mock_api_response
+    github.assets = {}
 
-    # Act
-    download_latest_release_assets("TestOwner", "TestRepo")
+    assert run(github, tmp_path) == []
 
-    # Assert
     captured = capsys.readouterr()
     assert "No assets found in the latest release." in captured.out
+
+
+def test_unchanged_release_is_a_fast_no_op(github, tmp_path, capsys, monkeypatch):
+    """Tests that a 304 for the release JSON ends the run without more requests."""
+    run(github, tmp_path)
+    github.requests.clear()
+    capsys.readouterr()
+
+    def no_hashing(*args):
+        raise AssertionError("unchanged assets should not be verified again")
+
+    monkeypatch.setattr("scripts.download.verify_file", no_hashing)
+    results = run(github, tmp_path)
+
+    assert github.requests == [("GET", "/repos/TestOwner/TestRepo/releases/latest")]
+    assert {r.status for r in results} == {"present"}
+    assert "nothing new to download" in capsys.readouterr().out
+
+
+def test_new_asset_version_is_downloaded(github, tmp_path):
+    """Tests that a re-uploaded asset (new ID, new ETag) is fetched again."""
+    run(github, tmp_path)
+    github.assets["setup.exe"] = b"MZ new installer"
+    github.requests.clear()
+
+    results = run(github, tmp_path)
+
+    assert {r.name: r.status for r in results}["setup.exe"] == "downloaded"
+    assert asset_requests(github) == ["/download/setup.exe"] * 2  # HEAD + GET
+    assert (tmp_path / "latest_release" / "setup.exe").read_bytes() == (
+        b"MZ new installer"
+    )
+
+
+def test_missing_file_is_restored_despite_304(github, tmp_path):
+    """Tests that an unchanged release still restores a deleted asset."""
+    run(github, tmp_path)
+    (tmp_path / "latest_release" / "setup.exe").unlink()
+
+    results = run(github, tmp_path)
+
+    assert {r.name: r.status for r in results}["setup.exe"] == "cached"
+    assert (tmp_path / "latest_release" / "setup.exe").read_bytes() == EXE
@@ -4,6 +4,7 @@ import subprocess
 import os
 import sys
 import shutil
+import tempfile
 
 # This test should be run from the root of the project.
 sys.path.insert(0, ".")
@@ -29,9 +30,12 @@ class TestInstallerCreationIntegration(unittest.TestCase):
         if os.path.isdir("dist"):
             shutil.rmtree("dist")
 
-        # Run the main build script to create the contents for the installer
-        return_code = build_main()
+        # Run the main build script to create the contents for the installer.
+        # Work files, logs and the build manifest stay out of the project.
+        cls.build_dir = tempfile.mkdtemp()
+        return_code = build_main(["--build-dir", cls.build_dir])
         if return_code != 0:
+            shutil.rmtree(cls.build_dir, ignore_errors=True)
             raise RuntimeError(
                 "Prerequisite build failed. Cannot proceed with installer test."
             )
@@ -75,6 +79,7 @@ class TestInstallerCreationIntegration(unittest.TestCase):
             shutil.rmtree("build")
         if os.path.isdir("dist"):
             shutil.rmtree("dist")
+        shutil.rmtree(cls.build_dir, ignore_errors=True)
         print("✅ Teardown complete.")
 
 
@@ -0,0 +1,82 @@
+# tests/test_inventory.py
+import json
+
+from scripts import inventory, vm_manager
+
+TEMPLATE = "pi-master-template"
+
+
+def list_calls(backend):
+    return [call for call in backend.calls if call[0] == "list"]
+
+
+def test_parse_vm_list_handles_names_with_spaces():
+    """Tests that names with spaces and quotes are split from their UUIDs."""
+    output = (
+        '"pi-master-template" {11111111-2222-3333-4444-555555555555}\n'
+        '"My "quoted" VM" {aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee}\n'
+        "\n"
+    )
+
+    assert inventory.parse_vm_list(output) == [
+        ("pi-master-template", "11111111-2222-3333-4444-555555555555"),
+        ('My "quoted" VM', "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"),
+    ]
+
+
+def test_many_lookups_cost_one_list_call(fake_backend):
+    """Tests that repeated existence checks are served from one snapshot."""
+    fake_backend.add_vm(TEMPLATE)
+
+    for i in range(200):
+        vm_manager.vm_exists(f"pi-{i}")
+    assert vm_manager.vm_exists(TEMPLATE)
+
+    assert list_calls(fake_backend) == [["list", "vms"]]
+
+
+def test_state_lookup_reads_running_vms_once(fake_backend):
+    """Tests that VM states come from a single 'list runningvms' call."""
+    fake_backend.add_vm(TEMPLATE)
+    fake_backend.add_vm("pi-up")["state"] = "running"
+
+    snapshot = inventory.get_inventory()
+    assert snapshot.state("pi-up") == inventory.RUNNING
+    assert snapshot.state(TEMPLATE) == inventory.STOPPED
+    assert snapshot.state("pi-missing") is None
+    record = snapshot.get("pi-up")
+    assert snapshot.get(record.uuid) == record
+
+    assert list_calls(fake_backend) == [["list", "vms"], ["list", "runningvms"]]
+
+
+def test_cache_expires_after_ttl(fake_backend, monkeypatch):
+    """Tests that an inventory older than the TTL is reloaded."""
+    monkeypatch.setenv(inventory.TTL_ENV_VAR, "0")
+
+    inventory.get_inventory()
+    inventory.get_inventory()
+
+    assert len(list_calls(fake_backend)) == 2
+
+
+def test_clone_invalidates_inventory(fake_backend):
+    """Tests that our own clone operation makes the new VM visible at once."""
+    fake_backend.add_vm(TEMPLATE)
+    assert not vm_manager.vm_exists("pi-new")
+
+    vm_manager.clone_vm(TEMPLATE, "pi-new")
+
+    assert vm_manager.vm_exists("pi-new")
+
+
+def test_main_prints_json(fake_backend, monkeypatch, capsys):
+    """Tests the inventory command line in JSON mode."""
+    fake_backend.add_vm(TEMPLATE)
+    monkeypatch.setattr(vm_manager, "setup_environment", lambda: True)
+
+    assert inventory.main(["--json"]) == 0
+
+    (record,) = json.loads(capsys.readouterr().out)
+    assert record["name"] == TEMPLATE
+    assert record["state"] == inventory.STOPPED
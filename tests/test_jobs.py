@@ -0,0 +1,106 @@
+# tests/test_jobs.py
+import threading
+import time
+
+from webapp import jobs
+
+
+def test_job_queue_limits_concurrency():
+    """Tests that no more than 'max_workers' jobs run at the same time."""
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def runner(job):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return 0
+
+    queue = jobs.JobQueue(max_workers=2, runner=runner)
+    submitted = [queue.submit(f"pi-{i}", []) for i in range(6)]
+    for job in submitted:
+        assert queue.wait(job.id, timeout=10)
+    queue.shutdown()
+
+    assert peak[0] == 2
+    assert all(job.status == jobs.SUCCEEDED for job in submitted)
+    assert [job.id for job in queue.list()] == [job.id for job in reversed(submitted)]
+
+
+def test_failing_runner_marks_job_failed():
+    """Tests that exceptions and non-zero exit codes mark a job as failed."""
+
+    def runner(job):
+        if job.name == "boom":
+            raise RuntimeError("VBoxSVC went away")
+        return 3
+
+    queue = jobs.JobQueue(max_workers=1, runner=runner)
+    exploding = queue.submit("boom", [])
+    failing = queue.submit("pi-bad", [])
+    queue.shutdown()
+
+    assert exploding.status == jobs.FAILED
+    assert "VBoxSVC went away" in exploding.error
+    assert failing.status == jobs.FAILED
+    assert failing.returncode == 3
+
+
+def test_job_history_is_bounded():
+    """Tests that only the most recent finished jobs are remembered."""
+    queue = jobs.JobQueue(max_workers=1, runner=lambda job: 0, history=3)
+    for i in range(5):
+        job = queue.submit(f"pi-{i}", [])
+        queue.wait(job.id, timeout=10)
+    queue.shutdown()
+
+    assert [job.name for job in queue.list()] == ["pi-4", "pi-3", "pi-2"]
+
+
+def test_followers_see_output_while_job_runs():
+    """Tests that several viewers receive each line before the job has finished."""
+    release = threading.Event()
+
+    def runner(job):
+        job.append_output("Running: VBoxManage clonevm\n")
+        release.wait(10)
+        job.append_output("Cloning complete!\n")
+        return 0
+
+    queue = jobs.JobQueue(max_workers=1, runner=runner)
+    job = queue.submit("pi-live", [])
+    followers = [job.follow(timeout=0.1) for _ in range(2)]
+
+    for follower in followers:
+        assert next(follower) == "Running: VBoxManage clonevm\n"
+    assert not job.done.is_set()
+    release.set()
+    queue.shutdown()
+
+    for follower in followers:
+        assert [line for line in follower if line is not None] == [
+            "Cloning complete!\n"
+        ]
+
+
+def test_job_output_buffer_is_bounded(monkeypatch):
+    """Tests that only the newest lines are kept and late viewers skip the rest."""
+    monkeypatch.setattr(jobs, "MAX_LOG_LINES", 3)
+    job = jobs.Job("1", "pi-chatty", [])
+    for i in range(5):
+        job.append_output(f"line {i}\n")
+    job.finish(0)
+
+    assert job.output == "line 2\nline 3\nline 4\n"
+    assert list(job.follow()) == ["line 2\n", "line 3\n", "line 4\n"]
+    assert job.line_count == 5
+    # Line numbers count from the start of the job, also past dropped lines.
+    assert list(job.follow_numbered(start=1)) == [
+        (2, "line 2\n"),
+        (3, "line 3\n"),
+        (4, "line 4\n"),
+    ]
+    assert list(job.follow_numbered(start=4)) == [(4, "line 4\n")]
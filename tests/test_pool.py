@@ -0,0 +1,133 @@
+# tests/test_pool.py
+import json
+
+import pytest
+
+from scripts import pool, readiness, vm_manager
+
+TEMPLATE = "pi-master-template"
+
+
+def fast_ready(name):
+    return pool.wait_until_ready(name, timeout=5)
+
+
+@pytest.fixture
+def template(fake_backend):
+    fake_backend.add_vm(TEMPLATE)
+    return fake_backend
+
+
+def test_fill_boots_idle_members(template):
+    """Tests that filling the pool leaves 'size' booted, idle clones."""
+    with pool.WarmPool(size=2, ready=fast_ready) as warm_pool:
+        assert warm_pool.fill() == 2
+
+    members = warm_pool.idle
+    assert len(members) == 2
+    for name in members:
+        vm = template.state["vms"][name]
+        assert name.startswith(pool.DEFAULT_PREFIX)
+        assert vm["state"] == "running"
+        assert vm["properties"][pool.POOL_PROPERTY] == pool.IDLE
+        assert readiness.IP_PROPERTY in vm["properties"]
+
+
+def test_claim_is_a_hit_and_refills(template):
+    """Tests that a warm VM is handed out immediately and then replaced."""
+    with pool.WarmPool(size=1, ready=fast_ready) as warm_pool:
+        warm_pool.fill()
+        first = warm_pool.idle[0]
+
+        lease = warm_pool.acquire("ci-runner-1", user="ci", password="secret")
+
+    assert (lease.vm, lease.hit) == (first, True)
+    properties = template.state["vms"][first]["properties"]
+    assert properties[pool.POOL_PROPERTY] == "claimed:ci-runner-1"
+    assert properties["/VirtualBox/GuestAdd/hostname"] == "ci-runner-1"
+    assert (
+        "HOSTNAME=ci-runner-1" in properties["/VirtualBox/GuestAdd/PiSelfhostingInfo"]
+    )
+    # The running guest applied the identity and confirmed it.
+    assert template.state["vms"][first]["guest_hostname"] == "ci-runner-1"
+    assert properties[vm_manager.IDENTITY_PROPERTY].startswith("ci-runner-1:")
+    assert "/VirtualBox/GuestAdd/password" not in properties
+    # The replacement was warmed in the background.
+    assert len(warm_pool.idle) == 1 and warm_pool.idle[0] != first
+    assert warm_pool.stats.to_dict()["hit_rate"] == 1.0
+
+
+def test_claim_from_empty_pool_waits_for_boot(template):
+    """Tests that a miss waits for a clone to boot and is counted as such."""
+    template.state["boot_seconds"] = 0.3
+
+    with pool.WarmPool(size=1, ready=fast_ready) as warm_pool:
+        lease = warm_pool.acquire("ci-runner-2", refill=False)
+
+    assert lease.hit is False
+    assert lease.waited >= 0.3
+    stats = warm_pool.stats.to_dict()
+    assert (stats["hits"], stats["misses"], stats["warmed"]) == (0, 1, 1)
+
+
+def test_new_pool_adopts_idle_members(template):
+    """Tests that idle members of an earlier pool are reused, claimed ones not."""
+    with pool.WarmPool(size=2, ready=fast_ready) as earlier:
+        earlier.fill()
+        earlier.acquire("taken", refill=False)
+        idle = earlier.idle
+
+    with pool.WarmPool(size=2, ready=fast_ready) as later:
+        assert later.adopt() == 1
+
+    assert later.idle == idle
+
+
+def test_claim_fails_if_guest_does_not_apply_identity(template, monkeypatch):
+    """Tests that a template without the identity service is not silently used."""
+    monkeypatch.setattr(pool, "IDENTITY_TIMEOUT", 0.3)
+    template.state["identity_service"] = False
+
+    with pool.WarmPool(size=1, ready=fast_ready) as warm_pool:
+        warm_pool.fill()
+        with pytest.raises(RuntimeError, match="pivm-identity"):
+            warm_pool.acquire("ci-runner-4", refill=False)
+
+
+def test_two_pools_never_claim_the_same_member(template):
+    """Tests that a member adopted by two pools is handed out only once."""
+    with pool.WarmPool(size=1, ready=fast_ready) as first:
+        first.fill()
+    with pool.WarmPool(size=1, ready=fast_ready) as second:
+        second.adopt()
+        assert second.idle == first.idle
+
+        taken = first.acquire("ci-a", refill=False)
+        other = second.acquire("ci-b", refill=False)
+
+    assert other.vm != taken.vm
+    properties = template.state["vms"][taken.vm]["properties"]
+    assert properties[pool.POOL_PROPERTY] == "claimed:ci-a"
+
+
+def test_warm_failure_is_reported(fake_backend):
+    """Tests that a claim fails instead of waiting forever without a template."""
+    with pool.WarmPool(size=1, ready=fast_ready) as warm_pool:
+        with pytest.raises(RuntimeError, match="could not warm"):
+            warm_pool.acquire("ci-runner-3", timeout=10)
+
+    assert warm_pool.stats.warm_failures >= 1
+
+
+def test_cli_claim_prints_lease(template, monkeypatch, capsys):
+    """Tests 'claim' on the command line, including JSON output."""
+    monkeypatch.setattr(vm_manager, "setup_environment", lambda: True)
+
+    assert pool.main(["--size", "1", "fill"]) == 0
+    capsys.readouterr()
+    assert pool.main(["--size", "1", "--json", "claim", "ci-cli", "--no-refill"]) == 0
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["lease"]["hostname"] == "ci-cli"
+    assert report["lease"]["hit"] is True
+    assert report["idle"] == []
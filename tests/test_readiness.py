@@ -0,0 +1,124 @@
+# tests/test_readiness.py
+import json
+import time
+
+from scripts import readiness, vm_manager
+
+
+def started_vm(backend, name, boot_seconds):
+    """Register a VM and start it; it becomes ready after 'boot_seconds'."""
+    backend.add_vm(name)
+    boot_times = backend.state.setdefault("boot_seconds", {})
+    boot_times[name] = boot_seconds
+    vm_manager.run(["startvm", name])
+
+
+def test_wait_ready_blocks_on_guestproperty_wait(fake_backend):
+    """Tests that readiness is awaited with 'guestproperty wait', not polling."""
+    started_vm(fake_backend, "pi-boot", 0.4)
+
+    result = readiness.wait_ready("pi-boot", timeout=10)
+
+    assert result.ready and result.ip.startswith("10.0.2.")
+    assert 0.3 <= result.boot_seconds < 2.0
+    waits = [c for c in fake_backend.commands("guestproperty") if c[1] == "wait"]
+    assert len(waits) == 1
+    assert readiness.READY_PROPERTY in waits[0][3]
+
+
+def test_vm_that_is_already_up_has_no_boot_time(fake_backend):
+    """Tests that a VM found ready is not counted as a (very long) boot."""
+    started_vm(fake_backend, "pi-up", 0)
+
+    result = readiness.wait_ready("pi-up", timeout=10)
+
+    assert result.ready and result.boot_seconds is None
+
+
+def test_wait_ready_times_out_without_readiness_service(fake_backend):
+    """Tests the timeout, and that --ip-only suits templates without the service."""
+    fake_backend.state["ready_service"] = False
+    started_vm(fake_backend, "pi-old", 0)
+
+    result = readiness.wait_ready("pi-old", timeout=0.3)
+    assert not result.ready
+    assert readiness.READY_PROPERTY in result.error
+    assert result.ip is not None
+
+    assert readiness.wait_ready("pi-old", 0.3, (readiness.IP_PROPERTY,)).ready
+
+
+def test_timeout_costs_one_wait_and_one_reread(fake_backend):
+    """Tests that a VM that never gets ready is not polled in short slices."""
+    fake_backend.state["ready_service"] = False
+    started_vm(fake_backend, "pi-slow", 0)
+
+    result = readiness.wait_ready("pi-slow", timeout=1.0)
+
+    assert not result.ready and result.waited >= 0.9
+    calls = fake_backend.commands("guestproperty")
+    assert [c[1] for c in calls if c[1] == "wait"] == ["wait"]
+    # Both properties are read once; the missing one again after the wait.
+    gets = [c[3] for c in calls if c[1] == "get"]
+    assert sorted(gets) == sorted(
+        [*readiness.READY_PROPERTIES, readiness.READY_PROPERTY]
+    )
+
+
+def test_stopped_vm_is_not_waited_for(fake_backend):
+    """Tests that a powered-off VM fails immediately."""
+    fake_backend.add_vm("pi-off")
+
+    result = readiness.wait_ready("pi-off", timeout=60)
+
+    assert not result.ready and "not running" in result.error
+
+
+def test_many_vms_are_waited_for_concurrently(fake_backend):
+    """Tests that four one-second boots are awaited in about one second."""
+    names = [f"pi-{i}" for i in range(4)]
+    for name in names:
+        started_vm(fake_backend, name, 1.0)
+
+    started = time.perf_counter()
+    results = readiness.wait_many(names, timeout=10)
+
+    assert time.perf_counter() - started < 2.5
+    assert [result.name for result in results] == names
+    assert all(result.ready for result in results)
+
+
+def test_histogram_buckets():
+    """Tests that samples land in the right buckets, including the open one."""
+    counts = dict(readiness.histogram([5, 10, 11, 59, 400], buckets=(10, 60)))
+
+    assert counts == {"<= 10s": 2, "<= 60s": 2, "> 60s": 1}
+
+
+def test_cli_records_history_and_prints_histogram(fake_vbox, capsys, boot_history):
+    """Tests the CLI against the fake VBoxManage, across two boots."""
+    fake_vbox.add_vm("pi-cli")
+    fake_vbox.write_state(dict(fake_vbox.read_state(), boot_seconds=1.0))
+
+    for _ in range(2):
+        state = fake_vbox.read_state()
+        state["vms"]["pi-cli"].update(state="poweroff", properties={})
+        fake_vbox.write_state(state)
+        vm_manager.run(["startvm", "pi-cli"])
+        assert readiness.main(["pi-cli", "--timeout", "10", "--histogram"]) == 0
+
+    output = capsys.readouterr().out
+    assert "pi-cli: 2 boots" in output
+    assert "<= 10s    2 ####" in output
+    assert len(json.loads(boot_history.read_text())["pi-cli"]) == 2
+
+
+def test_cli_fails_for_unready_vm(fake_backend, monkeypatch, capsys):
+    """Tests the exit code and JSON report when a VM does not become ready."""
+    monkeypatch.setattr(vm_manager, "setup_environment", lambda: True)
+    fake_backend.add_vm("pi-off")
+
+    assert readiness.main(["pi-off", "--json", "--timeout", "1"]) == 1
+
+    (report,) = json.loads(capsys.readouterr().out)
+    assert report["ready"] is False
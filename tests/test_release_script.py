@@ -1,4 +1,9 @@
 # tests/test_release_script.py
+import hashlib
+import json
+import os
+import shutil
+import time
 import pytest
 import subprocess
 from unittest.mock import patch, MagicMock
@@ -10,6 +15,7 @@ import sys
 sys.path.insert(0, ".")
 
 # Now we can import the functions we want to test
+import release
 from release import is_git_clean, handle_deploy_docs
 
 # --- Existing Tests (converted to pytest style) ---
@@ -57,18 +63,19 @@ def test_is_git_clean_returns_false_when_output_is_not_empty(mock_run):
 # --- New Tests for Documentation Deployment ---
 
 
-@patch("release.shutil.copytree")
+@patch("release.sync_site")
 @patch("release.subprocess.run")
 @patch("release.os.path.isdir")
 @patch("release.os.getenv")
 @patch("release.load_dotenv")
 def test_handle_deploy_docs_happy_path(
-    mock_load_dotenv, mock_getenv, mock_isdir, mock_subprocess_run, mock_copytree
+    mock_load_dotenv, mock_getenv, mock_isdir, mock_subprocess_run, mock_sync_site
 ):
     """Tests the successful execution of the deploy_docs command."""
     # Arrange: Mock all external dependencies to simulate a perfect run.
     mock_getenv.return_value = "/fake/deploy/path"
     mock_isdir.return_value = True
+    mock_sync_site.return_value = release.SyncReport()
 
     # Act: Run the function.
     handle_deploy_docs()
@@ -81,9 +88,7 @@ def test_handle_deploy_docs_happy_path(
     mock_subprocess_run.assert_called_once_with(
         ["python", "-m", "mkdocs", "build", "--clean"], check=True, capture_output=True
     )
-    mock_copytree.assert_called_once_with(
-        "site/", "/fake/deploy/path", dirs_exist_ok=True
-    )
+    mock_sync_site.assert_called_once_with("site/", "/fake/deploy/path", prune=False)
 
 
 @patch("release.load_dotenv")
@@ -119,13 +124,13 @@ def test_handle_deploy_docs_invalid_deploy_path(
     mock_isdir.assert_called_once_with("/not/a/real/path")
 
 
-@patch("release.shutil.copytree")
+@patch("release.sync_site")
 @patch("release.subprocess.run")
 @patch("release.os.path.isdir")
 @patch("release.os.getenv")
 @patch("release.load_dotenv")
 def test_handle_deploy_docs_mkdocs_build_fails(
-    mock_load_dotenv, mock_getenv, mock_isdir, mock_subprocess_run, mock_copytree
+    mock_load_dotenv, mock_getenv, mock_isdir, mock_subprocess_run, mock_sync_site
 ):
     """Tests that the script exits if the 'mkdocs build' command fails."""
     # Arrange: Configure the subprocess mock to raise an error.
@@ -138,4 +143,381 @@ def test_handle_deploy_docs_mkdocs_build_fails(
         handle_deploy_docs()
     assert e.value.code == 1
     # Ensure we didn't try to copy files after the build failed.
-    mock_copytree.assert_not_called()
+    mock_sync_site.assert_not_called()
+
+
+def make_site(root, files):
+    for name, content in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def test_sync_site_copies_only_changed_files(tmp_path):
+    """Tests that a second deploy copies just the file that changed."""
+    site, target = tmp_path / "site", tmp_path / "www"
+    target.mkdir()
+    make_site(site, {"index.html": "home", "guide/setup.html": "setup", "a.css": "x"})
+
+    first = release.sync_site(str(site), str(target))
+    assert (first.copied, first.skipped, first.removed) == (3, 0, 0)
+    assert (target / "guide" / "setup.html").read_text() == "setup"
+
+    make_site(site, {"index.html": "new home"})
+    second = release.sync_site(str(site), str(target))
+
+    assert (second.copied, second.skipped) == (1, 2)
+    assert second.copied_bytes == len("new home")
+    assert second.skipped_bytes == len("setup") + len("x")
+    assert (target / "index.html").read_text() == "new home"
+    assert not list(target.rglob("*.deploy-tmp"))
+
+
+def test_sync_site_removes_orphans_but_not_foreign_files(tmp_path):
+    """Tests that pages dropped from the site are deleted, other files kept."""
+    site, target = tmp_path / "site", tmp_path / "www"
+    make_site(site, {"index.html": "home", "old/page.html": "old"})
+    make_site(target, {"favicon.ico": "icon"})  # Not deployed from the site.
+    release.sync_site(str(site), str(target))
+
+    shutil.rmtree(site / "old")
+    report = release.sync_site(str(site), str(target))
+
+    assert report.removed == 1
+    assert not (target / "old").exists()
+    assert (target / "favicon.ico").read_text() == "icon"
+    assert report.unmanaged == ["favicon.ico"]
+
+
+def test_sync_site_adopts_identical_existing_files(tmp_path):
+    """Tests that a first sync over an earlier full copy copies nothing."""
+    site, target = tmp_path / "site", tmp_path / "www"
+    make_site(site, {"index.html": "home", "about.html": "about"})
+    shutil.copytree(site, target)
+    (target / "about.html").write_text("abuot")  # Same size, other content.
+
+    report = release.sync_site(str(site), str(target))
+
+    assert (report.copied, report.skipped) == (1, 1)
+    assert (target / "about.html").read_text() == "about"
+
+
+def test_sync_site_prunes_pages_of_deploys_without_a_manifest(tmp_path):
+    """Tests upgrading a web root filled by full copies, which has no manifest."""
+    site, target = tmp_path / "site", tmp_path / "www"
+    make_site(site, {"index.html": "home", "old/page.html": "old"})
+    shutil.copytree(site, target)
+    shutil.rmtree(site / "old")
+
+    report = release.sync_site(str(site), str(target))
+
+    # Without --prune the stale page is only listed.
+    assert report.unmanaged == ["old/page.html"]
+    assert report.removed == 0
+    assert (target / "old" / "page.html").exists()
+
+    report = release.sync_site(str(site), str(target), prune=True)
+
+    assert (report.removed, report.skipped) == (1, 1)
+    assert not (target / "old").exists()
+    assert (target / "index.html").read_text() == "home"
+    assert (target / release.DEPLOY_MANIFEST).exists()
+
+
+# --- Tests for the asset upload (against a fake 'gh' on PATH) ---
+
+TAG = "v1.2.3"
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch, fake_gh):
+    """Three release assets in a working directory, and a release without them."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(release.time, "sleep", lambda seconds: None)
+    fake_gh.update(releases={TAG: {"assets": {}}})
+    paths = []
+    for name, size in (("setup.exe", 3000), ("template.ova", 50_000), ("dl.exe", 10)):
+        (tmp_path / name).write_bytes(os.urandom(size))
+        paths.append(name)
+    return paths
+
+
+def test_upload_assets_uploads_each_file_once(assets, fake_gh):
+    """Tests that every asset gets its own upload and ends up on the release."""
+    release.upload_assets(TAG, assets)
+
+    assert sorted(fake_gh.uploads()) == sorted(assets)
+    uploaded = fake_gh.assets(TAG)
+    for path in assets:
+        assert uploaded[path]["size"] == os.path.getsize(path)
+
+
+def test_upload_assets_skips_matching_assets(assets, fake_gh):
+    """Tests that only assets with another size or digest are uploaded again."""
+    release.upload_assets(TAG, assets)
+    with open("template.ova", "wb") as f:
+        f.write(os.urandom(50_000))  # Same size, new content.
+    os.remove(fake_gh.log_path)
+
+    release.upload_assets(TAG, assets)
+
+    assert fake_gh.uploads() == ["template.ova"]
+
+
+def test_upload_assets_retries_with_backoff(assets, fake_gh, monkeypatch):
+    """Tests that a failing upload is retried after growing, jittered delays."""
+    delays = []
+    monkeypatch.setattr(release.time, "sleep", delays.append)
+    monkeypatch.setattr(release.random, "uniform", lambda low, high: high)
+    fake_gh.update(failures={"template.ova": 3})
+
+    release.upload_assets(TAG, assets)
+
+    assert "template.ova" in fake_gh.assets(TAG)
+    assert delays == [2.0, 4.0, 8.0]
+
+
+def test_failed_upload_resumes_on_rerun(assets, fake_gh, monkeypatch, capsys):
+    """Tests that a rerun only uploads what failed, using the state file."""
+    monkeypatch.setattr(release, "UPLOAD_RETRIES", 1)
+    fake_gh.update(failures={"template.ova": 2})
+
+    with pytest.raises(SystemExit) as e:
+        release.upload_assets(TAG, assets)
+    assert e.value.code == 1
+    assert "Failed to upload template.ova" in capsys.readouterr().out
+
+    # GitHub reports no digests here, so skipping relies on the state file.
+    state = fake_gh.read_state()
+    for asset in state["releases"][TAG]["assets"].values():
+        del asset["digest"]
+    fake_gh.write_state(state)
+    os.remove(fake_gh.log_path)
+
+    release.upload_assets(TAG, assets)
+
+    assert fake_gh.uploads() == ["template.ova"]
+    with open(release.UPLOAD_STATE_FILE) as f:
+        assert sorted(json.load(f)["assets"]) == sorted(assets)
+
+
+def test_upload_waits_for_release(assets, fake_gh, capsys):
+    """Tests that uploads wait until the CI workflow has created the release."""
+    fake_gh.update(missing_views=2)
+
+    release.upload_assets(TAG, assets)
+
+    assert capsys.readouterr().out.count("Release page not found yet") == 2
+    assert sorted(fake_gh.assets(TAG)) == sorted(assets)
+
+
+# --- Tests for the VM export (against the fake 'VBoxManage' on PATH) ---
+
+
+@pytest.fixture
+def master_vm(tmp_path, monkeypatch, fake_vbox):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("dist")
+    fake_vbox.add_vm("pi-master-template")
+    return fake_vbox
+
+
+def test_export_vm_writes_sha256_manifest(master_vm, capsys):
+    """Tests that the export reports the OVA's digest and writes a manifest."""
+    result = release.export_vm(TAG)
+
+    with open(result.ova_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    assert result.sha256 == digest
+    with open(result.manifest_path) as f:
+        assert f.read() == f"{digest}  pi-server-template-{TAG}.ova\n"
+    assert result.asset_paths == [result.ova_path, result.manifest_path]
+    assert "SHA-256:" in capsys.readouterr().out
+
+
+@pytest.mark.skipif(not shutil.which("zstd"), reason="zstd is not installed")
+def test_export_vm_compresses_in_the_same_pass(master_vm):
+    """Tests the zstd variant: it decompresses to the OVA and is in the manifest."""
+    state = master_vm.read_state()
+    state["export_size"] = 3 * 1024 * 1024
+    master_vm.write_state(state)
+
+    result = release.export_vm(TAG, compress=True)
+
+    restored = subprocess.run(
+        ["zstd", "-d", "-c", result.compressed_path], capture_output=True, check=True
+    ).stdout
+    with open(result.ova_path, "rb") as f:
+        assert restored == f.read()
+    with open(result.compressed_path, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == result.compressed_sha256
+    assert result.compressed_size < result.size
+    with open(result.manifest_path) as f:
+        assert (
+            f"{result.compressed_sha256}  pi-server-template-{TAG}.ova.zst" in f.read()
+        )
+
+
+def install_fake_zstd(tmp_path, monkeypatch, source):
+    """Put a 'zstd' that runs the given Python source first on the PATH."""
+    bin_dir = tmp_path / "zstd-bin"
+    bin_dir.mkdir()
+    script = bin_dir / "fake_zstd.py"
+    script.write_text(source)
+    wrapper = bin_dir / "zstd"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    wrapper.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the fake zstd is a shell script")
+def test_export_vm_reports_a_zstd_that_dies(master_vm, tmp_path, monkeypatch, capsys):
+    """Tests that a zstd failing mid-stream, with a lot of stderr, fails cleanly."""
+    state = master_vm.read_state()
+    state["export_size"] = 4 * 1024 * 1024
+    master_vm.write_state(state)
+    install_fake_zstd(
+        tmp_path,
+        monkeypatch,
+        "import sys\n"
+        "sys.stdin.buffer.read(1024)\n"
+        "sys.stderr.write('zstd: out of space\\n' * 20000)\n"
+        "sys.exit(1)\n",
+    )
+
+    with pytest.raises(SystemExit):
+        release.export_vm(TAG, compress=True)
+
+    out = capsys.readouterr().out
+    assert "Failed to compress the OVA" in out
+    assert "zstd: out of space" in out
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="the fake zstd is a shell script")
+def test_export_vm_times_hashing_apart_from_compression(
+    master_vm, tmp_path, monkeypatch
+):
+    """Tests that a slow compressor does not inflate the hashing time."""
+    state = master_vm.read_state()
+    state["export_size"] = 2 * 1024 * 1024
+    master_vm.write_state(state)
+    install_fake_zstd(
+        tmp_path,
+        monkeypatch,
+        "import sys, time\n"
+        "for block in iter(lambda: sys.stdin.buffer.read(65536), b''):\n"
+        "    time.sleep(0.02)\n"
+        "    sys.stdout.buffer.write(block)\n",
+    )
+
+    result = release.export_vm(TAG, compress=True)
+
+    assert result.compress_seconds >= 0.5
+    assert result.hash_seconds < 0.25
+
+
+def test_upload_reuses_export_digest(master_vm, fake_gh, monkeypatch):
+    """Tests that the OVA is not read again to compute its digest for upload."""
+    monkeypatch.setattr(release.time, "sleep", lambda seconds: None)
+    fake_gh.update(releases={TAG: {"assets": {}}})
+    result = release.export_vm(TAG)
+    real_file_sha256 = release.download.file_sha256
+
+    def file_sha256(path, *args, **kwargs):
+        assert not path.endswith(".ova"), "the OVA was hashed again"
+        return real_file_sha256(path, *args, **kwargs)
+
+    monkeypatch.setattr(release.download, "file_sha256", file_sha256)
+    release.upload_assets(TAG, result.asset_paths)
+
+    ova = fake_gh.assets(TAG)[os.path.basename(result.ova_path)]
+    assert ova["digest"] == f"sha256:{result.sha256}"
+
+
+# --- Tests for the finalize pipeline (fake gh, VBoxManage and ISCC) ---
+
+FAKE_ISCC = """
+import os, sys, time
+version = next(a.split("=", 1)[1] for a in sys.argv if a.startswith("/DMyVersion="))
+time.sleep(float(os.environ.get("FAKE_ISCC_DELAY", "0")))
+assert not any(name.endswith(".ova") for name in os.listdir("dist"))
+with open(os.path.join("dist", f"pi-server-vm-setup-{version}.exe"), "w") as f:
+    f.write("MZ installer")
+"""
+
+
+@pytest.fixture
+def pipeline(master_vm, fake_gh, tmp_path, monkeypatch):
+    """A working directory where every tool that finalize runs is faked."""
+    monkeypatch.setattr(release.time, "sleep", lambda seconds: None)
+    fake_gh.update(releases={TAG: {"assets": {}}})
+    script = tmp_path / "fake_iscc.py"
+    script.write_text(FAKE_ISCC)
+    wrapper = tmp_path / "iscc"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    wrapper.chmod(0o755)
+    monkeypatch.setenv(release.ISCC_ENV_VAR, str(wrapper))
+    return fake_gh
+
+
+def test_finalize_overlaps_export_with_installer(pipeline, monkeypatch, capsys):
+    """Tests that the VM export runs while the installer is being built."""
+    monkeypatch.setenv("FAKE_ISCC_DELAY", "1.0")
+    monkeypatch.setenv("FAKE_VBOX_DELAY", "1.0")
+
+    started = time.perf_counter()
+    release.run_finalize(TAG, "1.2.3")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.9  # One after the other they take more than 2 seconds.
+    assert sorted(pipeline.assets(TAG)) == [
+        "download-assets.exe",
+        f"pi-server-template-{TAG}.ova",
+        f"pi-server-template-{TAG}.ova.sha256",
+        "pi-server-vm-setup-1.2.3.exe",
+    ]
+    output = capsys.readouterr().out
+    assert "--- Stage timing ---" in output
+    for stage in ("download", "export", "installer", "upload-ova"):
+        assert f"   {stage} " in output
+
+
+def test_finalize_failed_stage_skips_dependents(pipeline, master_vm, capsys):
+    """Tests that a failed export stops its upload but not the other stages."""
+    master_vm.write_state(dict(master_vm.read_state(), vms={}))
+
+    with pytest.raises(SystemExit) as e:
+        release.run_finalize(TAG, "1.2.3")
+
+    assert e.value.code == 1
+    output = capsys.readouterr().out
+    assert "Failed to export the VM" in output
+    assert "upload-ova           skipped" in output
+    assert "pi-server-vm-setup-1.2.3.exe" in pipeline.assets(TAG)
+
+
+def test_run_stages_follows_dependencies():
+    """Tests the order of a small stage graph and what a failure skips."""
+    order = []
+
+    def step(name, fail=False):
+        def run(results):
+            order.append(name)
+            if fail:
+                raise RuntimeError(f"{name} broke")
+            return name.upper()
+
+        return run
+
+    stages = [
+        release.Stage("b", step("b"), needs=("a",)),
+        release.Stage("a", step("a")),
+        release.Stage("c", step("c", fail=True), needs=("a",)),
+        release.Stage("d", step("d"), needs=("b", "c")),
+    ]
+    results = release.run_stages(stages)
+
+    assert order[0] == "a"
+    assert results == {"a": "A", "b": "B"}
+    assert [stage.status for stage in stages] == ["ok", "ok", "failed", "skipped"]
+    assert stages[2].error == "RuntimeError: c broke"
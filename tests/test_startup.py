@@ -0,0 +1,52 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def modules_after_import(module):
+    """Import 'module' in a fresh interpreter and return what got imported."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {module}; print(' '.join(sorted(sys.modules)))",
+        ],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize(
+    "module, heavy",
+    [
+        ("run_create_master", "requests"),
+        ("run_clone", "requests"),
+        ("webapp.app", "waitress"),
+    ],
+)
+def test_heavy_dependencies_are_imported_lazily(module, heavy):
+    """Tests that starting a tool does not pay for libraries it may not use."""
+    assert heavy not in modules_after_import(module)
+
+
+def test_help_needs_no_virtualbox(tmp_path):
+    """Tests that '--help' works on a machine without VBoxManage."""
+    env = dict(os.environ, PATH=str(tmp_path))
+    for script in ("run_clone.py", "run_create_master.py"):
+        result = subprocess.run(
+            [sys.executable, script, "--help"],
+            cwd=PROJECT_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "usage:" in result.stdout
@@ -0,0 +1,242 @@
+# tests/test_vm_gc.py
+import json
+import os
+import sys
+import time
+
+import pytest
+
+import fake_vboxapi
+from scripts import backends, inventory, vm_gc, vm_manager
+
+TEMPLATE = "pi-master-template"
+
+
+@pytest.fixture
+def clones(fake_vbox):
+    """The template plus clones: two tagged 'ci', one untagged and running."""
+    fake_vbox.add_vm(TEMPLATE)
+    vm_manager.clone_vm(TEMPLATE, "ci-1", tag="ci")
+    vm_manager.clone_vm(TEMPLATE, "ci-2", tag="ci")
+    vm_manager.clone_vm(TEMPLATE, "dev-1")
+    vm_manager.start_vm("ci-2")
+    return fake_vbox
+
+
+def set_state_change(fake_vbox, name, seconds_ago):
+    state = fake_vbox.read_state()
+    changed = time.gmtime(time.time() - seconds_ago)
+    state["vms"][name]["state_change"] = time.strftime(
+        "%Y-%m-%dT%H:%M:%S.000000000", changed
+    )
+    fake_vbox.write_state(state)
+
+
+def make_orphan(folder, name, size=4096, age=2 * vm_gc.ORPHAN_MIN_AGE):
+    path = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    old = time.time() - age
+    os.utime(path, (old, old))
+    return path
+
+
+def test_parse_age():
+    """Tests that ages accept seconds, minutes, hours and days."""
+    assert vm_gc.parse_age("45") == 45
+    assert vm_gc.parse_age("90m") == 5400
+    assert vm_gc.parse_age("12h") == 43200
+    assert vm_gc.parse_age("2d") == 172800
+
+
+def test_tag_selects_clones_and_powers_off_running_ones(clones):
+    """Tests that tagged clones are powered off if needed and deleted."""
+    folders = [
+        os.path.dirname(vm["cfgfile"])
+        for name, vm in clones.read_state()["vms"].items()
+        if name.startswith("ci-")
+    ]
+
+    report = vm_gc.collect(tag="ci")
+
+    assert sorted(vm.name for vm in report.vms) == ["ci-1", "ci-2"]
+    assert report.failed == []
+    assert sorted(clones.read_state()["vms"]) == ["dev-1", TEMPLATE]
+    assert [call[1:] for call in clones.commands("controlvm")] == [["ci-2", "poweroff"]]
+    assert not any(os.path.exists(folder) for folder in folders)
+    # Every deleted clone had a 64 MB disk image.
+    assert report.reclaimable >= 2 * 64 * 1024
+    assert not vm_manager.vm_exists("ci-1")
+
+
+def test_tag_selects_clones_with_the_api_backend(monkeypatch):
+    """Tests that --tag also works when 'showvminfo' comes from the API."""
+    monkeypatch.setitem(sys.modules, "vboxapi", fake_vboxapi)
+    api = backends.VBoxApiBackend()
+    monkeypatch.setattr(vm_manager, "_backend", api)
+    inventory.invalidate()
+    api._vbox.add_machine(TEMPLATE)
+    api._vbox.add_machine("ci-1", groups=["/ci"])
+    api._vbox.add_machine("ci-2", groups=["/pi", "/ci"])
+    api._vbox.add_machine("dev-1")
+
+    report = vm_gc.collect(tag="ci", dry_run=True)
+
+    assert sorted(vm.name for vm in report.vms) == ["ci-1", "ci-2"]
+
+
+def test_prefix_and_age_must_both_match(clones):
+    """Tests that --older-than keeps recently used VMs."""
+    set_state_change(clones, "ci-1", seconds_ago=3 * 3600)
+
+    report = vm_gc.collect(prefix="ci-", older_than=vm_gc.parse_age("1h"))
+
+    assert [vm.name for vm in report.vms] == ["ci-1"]
+    assert sorted(clones.read_state()["vms"]) == ["ci-2", "dev-1", TEMPLATE]
+
+
+def test_template_and_unselected_vms_are_kept(clones):
+    """Tests that the template is protected and no selection deletes no VMs."""
+    assert vm_gc.collect(prefix="pi-master").vms == []
+    assert vm_gc.collect().vms == []
+    assert len(clones.read_state()["vms"]) == 4
+    assert clones.commands("unregistervm") == []
+
+
+def test_dry_run_reports_without_deleting(clones):
+    """Tests that a dry run only reports the VMs, orphans and reclaimable bytes."""
+    folder = clones.read_state()["cfg_dir"]
+    orphan = make_orphan(folder, "lost/lost.vdi", size=8192)
+
+    report = vm_gc.collect(tag="ci", sweep=True, dry_run=True)
+
+    assert sorted(vm.name for vm in report.vms) == ["ci-1", "ci-2"]
+    assert report.orphaned_disks == [(orphan, 8192)]
+    assert report.reclaimable == sum(vm.size for vm in report.vms) + 8192
+    assert os.path.exists(orphan)
+    assert len(clones.read_state()["vms"]) == 4
+    assert clones.commands("controlvm") == []
+    assert clones.commands("unregistervm") == []
+
+
+def test_sweep_removes_orphans_and_dangling_media(clones):
+    """Tests that unregistered old clone disks are deleted and missing media closed."""
+    state = clones.read_state()
+    folder = state["cfg_dir"]
+    orphan = make_orphan(folder, "lost/lost.vdi")
+    recent = make_orphan(folder, "copying/copying.vdi", age=0)
+    kept = [
+        # Not laid out like a clone made by these scripts.
+        make_orphan(folder, "loose.vdi"),
+        make_orphan(folder, "lost/data.vdi"),
+        # A VM removed with "Remove only" keeps its settings file and disks.
+        make_orphan(folder, "kept/kept.vdi"),
+        make_orphan(folder, "kept/kept.vbox"),
+    ]
+    # A disk that was deleted behind VirtualBox's back.
+    missing = os.path.join(folder, "gone", "gone.vdi")
+    state["media"][missing] = 8
+    clones.write_state(state)
+
+    assert vm_gc.collect().orphaned_disks == []
+    report = vm_gc.collect(sweep=True)
+
+    assert report.vms == []
+    assert report.orphaned_disks == [(orphan, 4096)]
+    assert [location for _, location in report.dangling_media] == [missing]
+    assert not os.path.exists(orphan)
+    # Younger files may belong to a clone that is still being created.
+    assert os.path.exists(recent)
+    assert all(os.path.exists(path) for path in kept)
+    media = clones.read_state()["media"]
+    assert missing not in media
+    # The disks of registered VMs are left alone.
+    assert all(os.path.exists(path) for path in media)
+
+
+def test_sweep_with_prefix_only_looks_at_matching_folders(clones):
+    """Tests that --prefix also limits which folders are swept."""
+    folder = clones.read_state()["cfg_dir"]
+    ci_disk = make_orphan(
+        folder, "ci-9/Snapshots/{6f1c2d9e-0b7a-4c41-9d7e-2f5a8b3c1e00}.vdi"
+    )
+    other = make_orphan(folder, "dev-9/dev-9-disk2.vdi")
+
+    report = vm_gc.collect(prefix="ci-9", sweep=True)
+
+    assert report.orphaned_disks == [(ci_disk, 4096)]
+    assert os.path.exists(other)
+
+
+def test_paused_and_saved_vms_are_stopped_first(clones):
+    """Tests that paused VMs are powered off and saved states discarded."""
+    state = clones.read_state()
+    state["vms"]["ci-1"]["state"] = "paused"
+    state["vms"]["ci-2"]["state"] = "saved"
+    clones.write_state(state)
+
+    report = vm_gc.collect(tag="ci")
+
+    assert report.failed == []
+    assert [call[1:] for call in clones.commands("controlvm")] == [["ci-1", "poweroff"]]
+    assert [call[1:] for call in clones.commands("discardstate")] == [["ci-2"]]
+    assert sorted(clones.read_state()["vms"]) == ["dev-1", TEMPLATE]
+
+
+def test_unregister_is_retried_while_the_session_closes(clones, monkeypatch):
+    """Tests that a session lock lingering after the poweroff is waited out."""
+    monkeypatch.setattr(vm_manager, "UNREGISTER_RETRY_DELAY", 0.01)
+    clones.write_state(dict(clones.read_state(), poweroff_lock=2))
+
+    report = vm_gc.collect(prefix="ci-2")
+
+    assert report.failed == []
+    assert len(clones.commands("unregistervm")) == 3
+    assert "ci-2" not in clones.read_state()["vms"]
+
+
+def test_files_are_deleted_outside_the_registry_lock(clones, monkeypatch):
+    """Tests that only the registry changes of a deletion are serialized."""
+    held = []
+    remove_files = vm_manager._remove_vm_files
+
+    def remove_vm_files(settings_file, disks):
+        held.append(vm_manager._registry_lock.locked())
+        remove_files(settings_file, disks)
+
+    monkeypatch.setattr(vm_manager, "_remove_vm_files", remove_vm_files)
+
+    vm_gc.collect(tag="ci")
+
+    assert held == [False, False]
+    assert all(len(call) == 2 for call in clones.commands("unregistervm"))
+
+
+def test_failed_deletion_is_reported(clones, monkeypatch):
+    """Tests that a VM that cannot be deleted is reported and not counted."""
+    real_delete = vm_manager.delete_vm
+
+    def delete_vm(name):
+        if name == "ci-1":
+            raise RuntimeError("locked by another session")
+        real_delete(name)
+
+    monkeypatch.setattr(vm_manager, "delete_vm", delete_vm)
+
+    report = vm_gc.collect(tag="ci", sweep=False)
+
+    assert report.failed == [("ci-1", "locked by another session")]
+    sizes = {vm.name: vm.size for vm in report.vms}
+    assert report.reclaimable == sizes["ci-2"]
+    assert "ci-1" in clones.read_state()["vms"]
+
+
+def test_cli_json(clones, capsys):
+    """Tests that --json prints only the report on stdout."""
+    assert vm_gc.main(["--tag", "ci", "--dry-run", "--json"]) == 0
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["dry_run"] is True
+    assert sorted(vm["name"] for vm in report["vms"]) == ["ci-1", "ci-2"]
+    assert report["reclaimable_bytes"] > 0
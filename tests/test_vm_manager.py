@@ -0,0 +1,222 @@
+# tests/test_vm_manager.py
+import subprocess
+import sys
+
+import pytest
+
+from scripts import backends, vm_manager
+
+TEMPLATE = "pi-master-template"
+
+
+def test_parse_machine_readable_handles_quotes_and_multiline_values():
+    """Tests that quoted keys and multi-line values are parsed correctly."""
+    output = (
+        'name="pi-master-template"\n'
+        "memory=1024\n"
+        '"SATA Controller-0-0"="/vms/disk.vdi"\n'
+        'description="first line\n'
+        'second line"\n'
+    )
+
+    info = vm_manager.parse_machine_readable(output)
+
+    assert info["name"] == "pi-master-template"
+    assert info["memory"] == "1024"
+    assert info["SATA Controller-0-0"] == "/vms/disk.vdi"
+    assert info["description"] == "first line\nsecond line"
+
+
+def test_fingerprint_ignores_snapshot_keys():
+    """Tests that taking a snapshot does not change the template fingerprint."""
+    info = {"name": "t", "memory": "1024", "VMStateChangeTime": "x"}
+    with_snapshot = dict(
+        info,
+        SnapshotName="pivm-linked-base",
+        CurrentSnapshotUUID="1234",
+        **{"SATA Controller-0-0": "/vms/Snapshots/{diff}.vdi"},
+    )
+
+    assert vm_manager.get_template_fingerprint(
+        info
+    ) == vm_manager.get_template_fingerprint(with_snapshot)
+    assert vm_manager.get_template_fingerprint(
+        info
+    ) != vm_manager.get_template_fingerprint(dict(info, memory="2048"))
+
+
+def test_linked_clone_creates_base_snapshot_once(fake_vbox):
+    """Tests that the base snapshot is taken once and reused for later clones."""
+    fake_vbox.add_vm(TEMPLATE)
+
+    vm_manager.clone_vm(TEMPLATE, "pi-one", linked=True)
+    vm_manager.clone_vm(TEMPLATE, "pi-two", linked=True)
+
+    snapshots = fake_vbox.read_state()["vms"][TEMPLATE]["snapshots"]
+    assert len(snapshots) == 1
+    assert fake_vbox.commands("snapshot") == [
+        [
+            "snapshot",
+            TEMPLATE,
+            "take",
+            vm_manager.LINKED_BASE_SNAPSHOT,
+            "--description",
+            snapshots[0]["description"],
+        ]
+    ]
+    for clone in fake_vbox.commands("clonevm"):
+        assert "--options=link" in clone
+        assert clone[clone.index("--snapshot") + 1] == snapshots[0]["uuid"]
+
+
+def test_linked_clone_takes_new_snapshot_after_template_change(fake_vbox):
+    """Tests that a changed template invalidates the existing base snapshot."""
+    fake_vbox.add_vm(TEMPLATE)
+    vm_manager.clone_vm(TEMPLATE, "pi-one", linked=True)
+
+    vm_manager.run(["modifyvm", TEMPLATE, "--memory", "2048"])
+    vm_manager.clone_vm(TEMPLATE, "pi-two", linked=True)
+
+    state = fake_vbox.read_state()
+    snapshots = state["vms"][TEMPLATE]["snapshots"]
+    assert len(snapshots) == 2
+    assert state["vms"]["pi-one"]["linked_to"] == snapshots[0]["uuid"]
+    assert state["vms"]["pi-two"]["linked_to"] == snapshots[1]["uuid"]
+
+
+def test_full_clone_does_not_touch_snapshots(fake_vbox):
+    """Tests that the default (full) clone keeps the original behaviour."""
+    fake_vbox.add_vm(TEMPLATE)
+
+    vm_manager.clone_vm(TEMPLATE, "pi-full")
+
+    assert fake_vbox.commands("snapshot") == []
+    assert fake_vbox.commands("clonevm") == [
+        ["clonevm", TEMPLATE, "--name", "pi-full", "--register"]
+    ]
+
+
+def test_clone_merges_settings_into_one_modifyvm(fake_vbox):
+    """Tests that all hardware and identity settings cost a single modifyvm."""
+    fake_vbox.add_vm(TEMPLATE)
+    vm_manager.reset_spawn_count()
+
+    vm_manager.clone_vm(
+        TEMPLATE, "pi-batched", ram=2048, cpus=2, user="pi", password="secret"
+    )
+
+    # clonevm + one modifyvm + four guest properties
+    assert vm_manager.get_spawn_count() == 6
+    assert len(fake_vbox.calls()) == 6
+    (modifyvm,) = fake_vbox.commands("modifyvm")
+    for option in ("--macaddress1", "--description", "--memory", "--cpus"):
+        assert option in modifyvm
+    settings = fake_vbox.read_state()["vms"]["pi-batched"]["settings"]
+    assert settings["memory"] == "2048"
+    assert settings["cpus"] == "2"
+    assert settings["description"].startswith("serial:")
+
+
+def test_create_vm_uses_one_modifyvm(fake_vbox):
+    """Tests that create_vm applies all of its settings in one modifyvm call."""
+    vm_manager.reset_spawn_count()
+
+    vm_manager.create_vm("pi-new", 1024, 1, "pi-new.vdi", "debian.iso")
+
+    assert len(fake_vbox.commands("modifyvm")) == 1
+    assert vm_manager.get_spawn_count() == len(fake_vbox.calls())
+    settings = fake_vbox.read_state()["vms"]["pi-new"]["settings"]
+    assert settings["bridgeadapter1"] == "eth0"
+    assert settings["macaddress1"][:6] in ("b827eb", "dca632")
+
+
+def test_clone_dry_run_prints_plan_without_running(fake_vbox, capsys):
+    """Tests that a dry run prints the plan and does not start VBoxManage."""
+    vm_manager.reset_spawn_count()
+
+    vm_manager.clone_vm(TEMPLATE, "pi-dry", ram=512, start_vm=True, dry_run=True)
+
+    assert vm_manager.get_spawn_count() == 0
+    assert fake_vbox.calls() == []
+    output = capsys.readouterr().out
+    assert "Plan for 'pi-dry':" in output
+    assert "--memory 512" in output
+    assert "VBoxManage startvm pi-dry" in output
+
+
+def test_create_dry_run_does_not_look_up_the_adapter(fake_vbox, capsys):
+    """Tests that a dry run of create_vm() starts no VBoxManage at all."""
+    vm_manager.reset_spawn_count()
+
+    vm_manager.create_vm("pi-dry", 1024, 2, "pi-dry.vdi", "pi.iso", dry_run=True)
+
+    assert vm_manager.get_spawn_count() == 0
+    assert fake_vbox.calls() == []
+    output = capsys.readouterr().out
+    assert "<first bridged adapter>" in output
+    assert "VBoxManage startvm pi-dry" in output
+
+
+def test_command_plan_skips_empty_modifyvm():
+    """Tests that a plan without settings does not run an empty modifyvm."""
+    plan = vm_manager.CommandPlan("pi-empty")
+    plan.modify(memory=None, cpus=None)
+    vm_manager.reset_spawn_count()
+
+    plan.execute()
+
+    assert plan.commands() == []
+    assert vm_manager.get_spawn_count() == 0
+
+
+def test_backend_is_selected_from_environment(monkeypatch):
+    """Tests that PIVM_BACKEND picks the backend and bad names are rejected."""
+    monkeypatch.setattr(vm_manager, "_backend", None)
+    monkeypatch.setenv(vm_manager.BACKEND_ENV_VAR, "subprocess")
+    assert isinstance(vm_manager.get_backend(), backends.SubprocessBackend)
+
+    with pytest.raises(ValueError):
+        vm_manager.set_backend("carrier-pigeon")
+
+
+def test_vboxapi_backend_requires_bindings(monkeypatch):
+    """Tests that a missing 'vboxapi' module gives a clear error."""
+    monkeypatch.setitem(sys.modules, "vboxapi", None)
+
+    with pytest.raises(RuntimeError, match="VirtualBox Python bindings"):
+        backends.create_backend("vboxapi")
+
+
+def test_subprocess_backend_reports_failed_command(fake_vbox):
+    """Tests that failures raise CalledProcessError with a readable command."""
+    backend = backends.SubprocessBackend()
+
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        backend.execute(["modifyvm", "no-such-vm", "--memory", "512"])
+
+    assert e.value.cmd == "VBoxManage modifyvm no-such-vm --memory 512"
+    assert "Could not find a registered machine" in e.value.stderr
+
+
+def test_clone_flow_with_fake_backend_spawns_no_processes(fake_backend):
+    """Tests that the complete clone flow can run without any VBoxManage process."""
+    fake_backend.add_vm(TEMPLATE)
+    vm_manager.reset_spawn_count()
+
+    vm_manager.clone_vm(
+        TEMPLATE,
+        "pi-api",
+        ram=2048,
+        disk_size=4,
+        user="pi",
+        password="secret",
+        start_vm=True,
+        linked=True,
+    )
+
+    assert vm_manager.get_spawn_count() == 0
+    vm = fake_backend.state["vms"]["pi-api"]
+    assert vm["state"] == "running"
+    assert vm["settings"]["memory"] == "2048"
+    assert vm["properties"]["/VirtualBox/GuestAdd/user"] == "pi"
+    assert vm["disks"]["2"].endswith("pi-api-disk2.vdi")
@@ -0,0 +1,175 @@
+# tests/test_webapp.py
+import json
+
+import pytest
+
+from scripts import inventory
+from webapp import app as webapp
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(webapp.vm_manager, "setup_environment", lambda: True)
+    webapp.app.config["TESTING"] = True
+    inventory.invalidate()
+    with webapp.app.test_client() as client:
+        yield client
+    inventory.invalidate()
+
+
+def test_worker_count_falls_back_on_bad_values(monkeypatch):
+    """Tests that a malformed PIVM_WEB_WORKERS does not stop the app."""
+    monkeypatch.setenv(webapp.WORKERS_ENV_VAR, "four")
+    assert webapp.get_worker_count() == webapp.DEFAULT_WORKERS
+    monkeypatch.setenv(webapp.WORKERS_ENV_VAR, "0")
+    assert webapp.get_worker_count() == 1
+    monkeypatch.setenv(webapp.WORKERS_ENV_VAR, "6")
+    assert webapp.get_worker_count() == 6
+
+
+def test_api_vms_lists_inventory(client, fake_backend):
+    """Tests that the VM inventory is exposed as JSON."""
+    fake_backend.add_vm("pi-master-template")
+    fake_backend.add_vm("pi-up")["state"] = "running"
+
+    all_vms = client.get("/api/vms").get_json()
+    running = client.get("/api/vms?running=1").get_json()
+
+    assert [vm["name"] for vm in all_vms["vms"]] == ["pi-master-template", "pi-up"]
+    assert [vm["name"] for vm in running["vms"]] == ["pi-up"]
+    # Both requests were answered from one inventory snapshot.
+    assert fake_backend.commands("list") == [["list", "vms"], ["list", "runningvms"]]
+
+
+def test_api_vms_without_virtualbox(client, monkeypatch):
+    """Tests the error response when VBoxManage is not installed."""
+    monkeypatch.setattr(webapp.vm_manager, "setup_environment", lambda: False)
+
+    response = client.get("/api/vms")
+
+    assert response.status_code == 503
+
+
+def test_clone_form_queues_job_and_returns_immediately(client, fake_vbox):
+    """Tests that a clone is queued as a background job and completes."""
+    fake_vbox.add_vm("pi-master-template")
+
+    response = client.post("/", data={"vm_name": "pi-web", "ram": "512"})
+
+    assert response.status_code == 302
+    job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    assert webapp.job_queue.wait(job_id, timeout=60)
+
+    status = client.get(f"/jobs/{job_id}/status").get_json()
+    assert status["status"] == "succeeded"
+    assert status["name"] == "pi-web"
+    assert "Cloning complete!" in client.get(f"/jobs/{job_id}/log").get_data(
+        as_text=True
+    )
+    assert fake_vbox.read_state()["vms"]["pi-web"]["settings"]["memory"] == "512"
+    assert b"pi-web" in client.get("/jobs").data
+    assert b"succeeded" in client.get(f"/jobs/{job_id}").data
+
+
+def test_clone_form_requires_name(client):
+    """Tests that a submission without a VM name is rejected without a job."""
+    jobs_before = len(webapp.job_queue.list())
+
+    response = client.post("/", data={"vm_name": ""})
+
+    assert response.status_code == 200
+    assert b"VM Name is a required field." in response.data
+    assert len(webapp.job_queue.list()) == jobs_before
+
+
+def test_unknown_job_returns_404(client):
+    """Tests that asking for a job that does not exist gives a 404."""
+    assert client.get("/jobs/does-not-exist/status").status_code == 404
+
+
+def test_job_stream_sends_output_as_server_sent_events(client, fake_vbox):
+    """Tests that the event stream carries every step and ends with the status."""
+    fake_vbox.add_vm("pi-master-template")
+    response = client.post("/", data={"vm_name": "pi-stream"})
+    job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+
+    stream = client.get(f"/jobs/{job_id}/stream")
+
+    assert stream.mimetype == "text/event-stream"
+    body = stream.get_data(as_text=True)
+    assert "data: Running: VBoxManage clonevm pi-master-template" in body
+    assert "data:   (" in body
+    event, data = body.rstrip("\n").split("\n\n")[-1].split("\n")
+    assert event == "event: done"
+    assert json.loads(data[len("data: ") :])["status"] == "succeeded"
+
+
+def test_job_stream_resumes_after_last_event_id(client, fake_backend):
+    """Tests that a reconnecting browser gets only the lines it has not seen."""
+    fake_backend.add_vm("pi-master-template")
+    response = client.post("/", data={"vm_name": "pi-resume"})
+    job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    assert webapp.job_queue.wait(job_id, timeout=30)
+    first = client.get(f"/jobs/{job_id}/stream").get_data(as_text=True)
+    events = first.rstrip("\n").split("\n\n")[:-1]
+    assert [event.split("\n")[0] for event in events] == [
+        f"id: {number}" for number in range(1, len(events) + 1)
+    ]
+
+    resumed = client.get(
+        f"/jobs/{job_id}/stream", headers={"Last-Event-ID": "3"}
+    ).get_data(as_text=True)
+
+    assert resumed.rstrip("\n").split("\n\n") == first.rstrip("\n").split("\n\n")[3:]
+
+
+def test_clone_job_runs_in_process(client, fake_backend):
+    """Tests that a web clone uses the clone API directly, without a new process."""
+    fake_backend.add_vm("pi-master-template")
+
+    response = client.post("/", data={"vm_name": "pi-inproc", "cpus": "2"})
+    job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    assert webapp.job_queue.wait(job_id, timeout=30)
+
+    job = webapp.job_queue.get(job_id)
+    assert job.status == "succeeded", job.output + job.error
+    assert "Cloning complete!" in job.output
+    assert fake_backend.state["vms"]["pi-inproc"]["settings"]["cpus"] == "2"
+
+
+def test_clone_job_output_hides_the_password(client, fake_backend):
+    """Tests that the password reaches the VM but never the job output."""
+    fake_backend.add_vm("pi-master-template")
+
+    response = client.post(
+        "/", data={"vm_name": "pi-secret", "user": "pi", "password": "hunter2"}
+    )
+    job_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    assert webapp.job_queue.wait(job_id, timeout=30)
+
+    properties = fake_backend.state["vms"]["pi-secret"]["properties"]
+    assert properties["/VirtualBox/GuestAdd/password"] == "hunter2"
+    log = client.get(f"/jobs/{job_id}/log").get_data(as_text=True)
+    assert "/VirtualBox/GuestAdd/password ***" in log
+    for page in (log, client.get(f"/jobs/{job_id}/stream").get_data(as_text=True)):
+        assert "hunter2" not in page
+        assert "SERIAL_NUMBER" not in page
+
+
+def test_clone_form_rejects_non_numeric_sizes(client):
+    """Tests that invalid numbers are reported instead of queuing a job."""
+    response = client.post("/", data={"vm_name": "pi-bad", "ram": "lots"})
+
+    assert response.status_code == 200
+    assert b"must be whole numbers" in response.data
+
+
+def test_api_capacity_reports_budget(client, fake_backend):
+    """Tests that the capacity budget is served as JSON."""
+    fake_backend.add_vm("pi-up", memory=2048, cpus=2)["state"] = "running"
+
+    budget = client.get("/api/capacity").get_json()
+
+    assert budget["host_cpus"] == 16
+    assert budget["used_memory_mb"] == 2048
+    assert budget["free_cpus"] == budget["cpu_limit"] - 2
@@ -11,6 +11,7 @@ block_cipher = None
 
 a = Analysis(
     ['webapp/app.py'],
+    pathex=['.'],  # The webapp imports the 'scripts' package from the project root
     binaries=collect_dynamic_libs('python'),
     datas=[('webapp/templates', 'templates'), ('webapp/static', 'static')],
     hiddenimports=['waitress']
@@ -1,9 +1,39 @@
 # webapp/app.py
-import subprocess
+import argparse
 import sys
 import os
-from flask import Flask, render_template, request, flash
-from waitress import serve
+import json
+from dataclasses import asdict
+from flask import (
+    Flask,
+    Response,
+    abort,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
+
+# In development the app is started as 'python webapp/app.py'; make the
+# project root importable so the 'scripts' package can be used directly.
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from scripts import capacity, clone_vm, inventory, vm_manager  # noqa: E402
+from webapp import jobs  # noqa: E402
+
+# Number of clone jobs that may run at the same time.
+WORKERS_ENV_VAR = "PIVM_WEB_WORKERS"
+DEFAULT_WORKERS = 2
+
+# Seconds between keep-alive comments on an idle event stream.
+STREAM_KEEPALIVE = 15.0
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
 
 
 def resource_path(relative_path):
@@ -12,8 +42,8 @@ def resource_path(relative_path):
         # PyInstaller creates a temp folder and stores path in _MEIPASS
         base_path = sys._MEIPASS  # type: ignore
     except AttributeError:
-        # In a development environment, the base path is the app's root directory
-        base_path = os.path.abspath(".")
+        # In a development environment, the base path is the app's own directory
+        base_path = os.path.dirname(os.path.abspath(__file__))
 
     return os.path.join(base_path, relative_path)
 
@@ -28,6 +58,39 @@ app = Flask(
 app.config["SECRET_KEY"] = "a-random-and-secure-secret-key-for-this-project"
 
 
+def get_worker_count():
+    """Return how many clone jobs may run at once (PIVM_WEB_WORKERS overrides it)."""
+    try:
+        workers = int(os.environ.get(WORKERS_ENV_VAR, DEFAULT_WORKERS))
+    except ValueError:
+        workers = DEFAULT_WORKERS
+    return max(1, workers)
+
+
+def run_clone_job(job):
+    """Runs a queued clone job in this process, streaming its progress to the job."""
+
+    def write(message, error=False):
+        job.append_output(f"{message}\n")
+
+    with vm_manager.capture_output(write):
+        if not vm_manager.setup_environment():
+            return 1
+        request = job.request
+        if request.machine_folder is None and not request.dry_run:
+            # Copy disks outside the registry lock so that jobs run in parallel.
+            request.machine_folder = vm_manager.get_default_machine_folder()
+        result = clone_vm.clone(request)
+        clone_vm.report(request, result)
+    return 0 if result.ok else 1
+
+
+job_queue = jobs.JobQueue(
+    max_workers=get_worker_count(),
+    runner=run_clone_job,
+)
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     """
@@ -44,53 +107,171 @@ def index():
         user = form_data.get("user")
         password = form_data.get("password")
         start = form_data.get("start")  # Will be 'on' if checked, otherwise None
+        linked = form_data.get("linked")
 
-        # --- Build the Command (Modern Package-Aware Approach) ---
-        command = [sys.executable, "-m", "scripts.clone_vm"]
-
-        # Add the required vm_name argument.
-        if vm_name:
-            command.append(vm_name)
-        else:
+        if not vm_name:
             flash("VM Name is a required field.", "error")
             return render_template("index.html", form_data=form_data)
 
-        # Add optional arguments if they were provided in the form.
-        if ram:
-            command.extend(["--ram", ram])
-        if cpus:
-            command.extend(["--cpus", cpus])
-        if disk_size:
-            command.extend(["--disk-size", disk_size])
-        if user:
-            command.extend(["--user", user])
-        if password:
-            command.extend(["--password", password])
-        if start:
-            command.append("--start")
-
+        # --- Build the Request; optional fields are only set when provided ---
         try:
-            # --- Run the Backend Script ---
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                text=True,
-                check=False,  # Do not raise an exception on error; we will handle it.
+            request_data = clone_vm.CloneRequest(
+                name=vm_name,
+                ram=int(ram) if ram else None,
+                cpus=int(cpus) if cpus else None,
+                disk_size=int(disk_size) if disk_size else None,
+                user=user or None,
+                password=password or None,
+                start=bool(start),
+                linked=bool(linked),
             )
+        except ValueError:
+            flash("RAM, CPUs and disk size must be whole numbers.", "error")
+            return render_template("index.html", form_data=form_data)
 
-            # --- Process the Result ---
-            if result.returncode == 0:
-                flash(result.stdout, "success")
-            else:
-                flash(result.stderr, "error")
-
-        except Exception as e:
-            # Catch any other unexpected errors during subprocess execution.
-            flash(f"An unexpected application error occurred: {str(e)}", "error")
+        # --- Queue the Clone; a worker thread runs it in the background ---
+        job = job_queue.submit(vm_name, request_data)
+        flash(f"Clone job {job.id} for '{vm_name}' has been queued.", "success")
+        return redirect(url_for("job_detail", job_id=job.id))
 
     # Re-render the template with any flashed messages and form data.
     return render_template("index.html", form_data=form_data)
 
 
+def get_job_or_404(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
+def current_budget():
+    """Return the host's capacity Budget, or None without VirtualBox."""
+    if not vm_manager.setup_environment():
+        return None
+    return capacity.get_scheduler().budget()
+
+
+@app.route("/jobs")
+def job_list():
+    """Shows all recent clone jobs."""
+    return render_template(
+        "jobs.html",
+        jobs=job_queue.list(),
+        workers=job_queue.max_workers,
+        budget=current_budget(),
+    )
+
+
+@app.route("/jobs/<job_id>")
+def job_detail(job_id):
+    """Shows the status and output of one clone job."""
+    return render_template("job.html", job=get_job_or_404(job_id))
+
+
+@app.route("/jobs/<job_id>/status")
+def job_status(job_id):
+    """Returns the status of one clone job as JSON."""
+    return jsonify(get_job_or_404(job_id).to_dict())
+
+
+@app.route("/jobs/<job_id>/log")
+def job_log(job_id):
+    """Returns the output of one clone job as plain text."""
+    job = get_job_or_404(job_id)
+    return job.output + job.error, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
+def format_event(data, event=None, event_id=None):
+    """Format one Server-Sent Event."""
+    lines = [f"event: {event}"] if event else []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {part}" for part in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+@app.route("/jobs/<job_id>/stream")
+def job_stream(job_id):
+    """
+    Streams the output of one clone job as Server-Sent Events. Every event
+    carries the number of output lines sent so far as its ID, so a browser
+    that reconnects (with Last-Event-ID) continues where it left off.
+    """
+    job = get_job_or_404(job_id)
+    try:
+        start = max(0, int(request.headers.get("Last-Event-ID", 0)))
+    except ValueError:
+        start = 0
+
+    def events():
+        for item in job.follow_numbered(timeout=STREAM_KEEPALIVE, start=start):
+            if item is None:
+                yield ": keep-alive\n\n"
+            else:
+                index, line = item
+                yield format_event(line.rstrip("\n"), event_id=index + 1)
+        # The error counts as one more line, so it is not sent twice either.
+        lines = job.line_count
+        if job.error and start <= lines:
+            yield format_event(job.error.rstrip("\n"), event_id=lines + 1)
+        yield format_event(json.dumps(job.to_dict()), event="done")
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        # Ask proxies not to buffer the stream.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/vms")
+def api_vms():
+    """Returns the cached VM inventory as JSON."""
+    if not vm_manager.setup_environment():
+        return jsonify({"error": "VBoxManage executable not found."}), 503
+    snapshot = inventory.get_inventory()
+    running_only = request.args.get("running") in ("1", "true", "yes")
+    return jsonify(
+        {
+            "age_seconds": round(snapshot.age, 3),
+            "vms": [asdict(r) for r in snapshot.records(running_only=running_only)],
+        }
+    )
+
+
+@app.route("/api/capacity")
+def api_capacity():
+    """Returns the host capacity left for starting VMs as JSON."""
+    budget = current_budget()
+    if budget is None:
+        return jsonify({"error": "VBoxManage executable not found."}), 503
+    return jsonify(budget.to_dict())
+
+
+def main(argv=None):
+    """Serve the web interface with waitress."""
+    parser = argparse.ArgumentParser(description="The pi-server-vm web interface.")
+    parser.add_argument(
+        "--host",
+        default=DEFAULT_HOST,
+        help="Address to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="Port to listen on (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    # Only needed to serve; importing the app (tests, --help) does without it.
+    from waitress import serve
+
+    # Every open progress stream occupies a thread, so allow more than the default.
+    serve(app, host=args.host, port=args.port, threads=16)
+    return 0
+
+
 if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=5000)
+    sys.exit(main())
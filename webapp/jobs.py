@@ -0,0 +1,184 @@
+# webapp/jobs.py
+"""
+A small in-memory job queue for the web app.
+
+Clone requests are queued as jobs and executed by a bounded pool of worker
+threads, so an HTTP request never waits for a multi-minute clone. The
+output of a job is kept in a bounded buffer of lines that any number of
+viewers can follow while the job is running.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Only the most recent output lines of a job are kept in memory.
+MAX_LOG_LINES = 2000
+
+
+class Job:
+    """One queued clone request and its outcome."""
+
+    def __init__(self, job_id, name, request):
+        self.id = job_id
+        self.name = name
+        # What the runner should do, e.g. the clone's settings.
+        self.request = request
+        self.status = QUEUED
+        self.returncode = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = ""
+        self.done = threading.Event()
+        self._lines = deque(maxlen=MAX_LOG_LINES)
+        # Index (since the job started) of the oldest line still in the buffer.
+        self._first_line = 0
+        self._changed = threading.Condition()
+
+    @property
+    def duration(self):
+        """Seconds the job has been running (or ran), or None if not started."""
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def output(self):
+        """The buffered output of the job as one string."""
+        with self._changed:
+            return "".join(self._lines)
+
+    @property
+    def line_count(self):
+        """Lines of output since the job started, including dropped ones."""
+        with self._changed:
+            return self._first_line + len(self._lines)
+
+    def append_output(self, line):
+        """Add one line of output and wake up everyone following the job."""
+        with self._changed:
+            if len(self._lines) == self._lines.maxlen:
+                self._first_line += 1
+            self._lines.append(line)
+            self._changed.notify_all()
+
+    def finish(self, returncode):
+        """Record the exit code and wake up everyone following the job."""
+        with self._changed:
+            self.returncode = returncode
+            self.finished = time.time()
+            self.status = SUCCEEDED if returncode == 0 else FAILED
+            self.done.set()
+            self._changed.notify_all()
+
+    def follow(self, timeout=15.0):
+        """
+        Yield the output lines of the job, waiting for new ones until it has
+        finished. Yields None after 'timeout' seconds without output so that
+        callers can send keep-alives. Viewers that fall behind the buffer
+        skip the lines that were already dropped.
+        """
+        for item in self.follow_numbered(timeout):
+            yield None if item is None else item[1]
+
+    def follow_numbered(self, timeout=15.0, start=0):
+        """
+        Like follow(), but yield (index, line) pairs, where 'index' counts the
+        lines since the job started, and begin at line 'start'.
+        """
+        position = start
+        while True:
+            with self._changed:
+                if position - self._first_line >= len(self._lines):
+                    if self.done.is_set():
+                        return
+                    self._changed.wait(timeout)
+                position = max(position, self._first_line)
+                lines = list(self._lines)[position - self._first_line :]
+            if not lines and not self.done.is_set():
+                yield None
+            for offset, line in enumerate(lines):
+                yield position + offset, line
+            position += len(lines)
+
+    def to_dict(self):
+        """Return a JSON-serialisable summary (without the request itself)."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "returncode": self.returncode,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": self.duration,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on at most 'max_workers' threads and remembers recent jobs.
+    'runner(job)' does the work of a job and returns its exit code.
+    """
+
+    def __init__(self, runner, max_workers=2, history=200):
+        self.max_workers = max_workers
+        self._runner = runner
+        self._history = history
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="clone-job"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, name, request):
+        """Queue a new job and return it immediately."""
+        with self._lock:
+            job = Job(str(next(self._ids)), name, request)
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs so memory use stays bounded.
+            while len(self._jobs) > self._history:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self._jobs.popitem(last=False)
+        self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job):
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            returncode = self._runner(job)
+        except Exception as e:
+            job.error += f"An unexpected application error occurred: {e}\n"
+            returncode = -1
+        job.finish(returncode)
+
+    def get(self, job_id):
+        """Return a job by ID, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """Return all remembered jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def wait(self, job_id, timeout=None):
+        """Block until a job has finished. Returns False on timeout."""
+        job = self.get(job_id)
+        return job is not None and job.done.wait(timeout)
+
+    def shutdown(self):
+        """Stop accepting jobs and wait for the running ones to finish."""
+        self._executor.shutdown(wait=True)